@@ -0,0 +1,349 @@
+import os
+import sys
+import time
+import json
+import socket
+import struct
+import logging
+import argparse
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+
+from util import logging_setup
+from ngrams import get_stopwords
+from tokenizer import CustomTokenizer
+from piiscan import PiiScanner, PREFILTER
+
+#Analysis daemon: keeps the tokenizers, stopwords and PII scanners of the languages it has seen, so that
+#readcorpus.py --analysisd (and every worker of mapdriver.py) does not build them again in every run.
+#It listens on a Unix socket, with a few worker processes that accept connections (a connection is usually a
+#mapdriver worker, kept for the whole run, so there should be as many workers as jobs). Every connection is served
+#in a thread of its own, so that connections beyond the number of workers (a run with more jobs than the one that
+#started the daemon, or several runs at once) are not left waiting: they go to the idle workers first, and when
+#there are none, to the busy ones, which serve their connections one message at a time.
+#Every worker keeps its own languages: at most --max-languages of them, the ones used longest ago being dropped
+#first, as well as the ones not used for --idle-time seconds. Languages given in --preload are built before the
+#workers are started, and shared by all of them.
+#Messages (both ways) are a JSON object prefixed by its length (4 bytes, big endian):
+#   {"op": "load", "lang": "en", "fast": false} -> {"toktype": ..., "warnings": [...], "stopwords": [...]}
+#   {"op": "tokenize", "lang": "en", "fast": false, "segments": [...]} -> {"tokens": [[...], ...]}
+#   {"op": "pii", "lang": "en", "counts": false, "segments": [...]} -> {"pii": [...]} (as PiiScanner.has_pii or PiiScanner.count)
+#   {"op": "ping"} -> {"pid": ...}
+#Errors are returned as {"error": "..."}.
+#Usage:
+#   python3 scripts/analysisd.py /work/cache/analysisd.sock --workers 8 --preload en fr --detach
+
+HEADER = struct.Struct(">I")
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('socket', type=str, help="Path of the Unix socket")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--workers', type=int, default=4, help="Processes serving connections (connections go to idle processes first)")
+    groupO.add_argument('--max-languages', type=int, default=16, help="Languages kept by each worker")
+    groupO.add_argument('--idle-time', type=int, default=3600, help="Seconds after which an unused language is dropped")
+    groupO.add_argument('--preload', nargs='*', default=[], help="Languages built at startup")
+    groupO.add_argument('--detach', action='store_true', help="Run in the background, or do nothing if a daemon is already listening on the socket")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+
+def send_message(sock, message):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def recv_message(stream):
+    #None at the end of the connection
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    length, = HEADER.unpack(header)
+    data = stream.read(length)
+    if len(data) < length:
+        return None
+    return json.loads(data)
+
+
+class WarmLanguage:
+    #Everything readcorpus.py builds for a language
+
+    def __init__(self, lang):
+        self.lang = lang
+        self.stopwords, self.stopwords_warnings = get_stopwords(lang)
+        self.pii_scanner = PiiScanner(lang)
+        self.tokenizers = {}
+        self.used = time.time()
+
+    def tokenizer(self, fast):
+        tokenizer = self.tokenizers.get(fast)
+        if tokenizer == None:
+            tokenizer = CustomTokenizer(self.lang, fast=fast)
+            tokenizer.build()
+            self.tokenizers[fast] = tokenizer
+        return tokenizer
+
+
+class WarmLanguages:
+    #Least recently used languages first. Also used by readcorpus_mono.py --lang-column, to route every segment
+    #to the tools of its language (taken from analysisd if there is a client)
+
+    def __init__(self, max_languages, idle_time, client=None):
+        self.max_languages = max_languages
+        self.idle_time = idle_time
+        self.client = client
+        self.languages = OrderedDict()
+
+    def get(self, lang):
+        now = time.time()
+        while len(self.languages) > 0:
+            oldest = next(iter(self.languages.values()))
+            if now - oldest.used < self.idle_time:
+                break
+            logging.info("Dropping idle language " + oldest.lang)
+            del self.languages[oldest.lang]
+
+        warm = self.languages.pop(lang, None)
+        if warm == None:
+            logging.info("Loading " + lang)
+            if self.client != None:
+                warm = RemoteLanguage(self.client, lang)
+            else:
+                warm = WarmLanguage(lang)
+        warm.used = now
+        self.languages[lang] = warm
+        while len(self.languages) > self.max_languages:
+            dropped, _ = self.languages.popitem(last=False)
+            logging.info("Dropping language " + dropped)
+        return warm
+
+
+def handle(message, languages):
+    op = message.get("op")
+    if op == "ping":
+        return {"pid": os.getpid()}
+    warm = languages.get(message["lang"])
+    if op == "load":
+        tokenizer = warm.tokenizer(message.get("fast", False))
+        return {"toktype": tokenizer.toktype, "warnings": tokenizer.getWarnings(), "stopwords": sorted(warm.stopwords)}
+    elif op == "tokenize":
+        return {"tokens": warm.tokenizer(message.get("fast", False)).tokenize_batch(message["segments"])}
+    elif op == "pii":
+        if message.get("counts", False):
+            return {"pii": warm.pii_scanner.count_batch(message["segments"])}
+        return {"pii": warm.pii_scanner.has_pii_batch(message["segments"])}
+    raise Exception("Unknown operation: " + str(op))
+
+def serve_connection(conn, languages, lock):
+    #Messages of the connections of a worker are handled one at a time (languages are not shared between threads)
+    stream = conn.makefile("rb")
+    while True:
+        message = recv_message(stream)
+        if message == None:
+            break
+        try:
+            with lock:
+                reply = handle(message, languages)
+        except Exception as ex:
+            logging.error(traceback.format_exc())
+            reply = {"error": repr(ex)}
+        send_message(conn, reply)
+
+def worker(listener, languages, idle):
+    #idle: workers without connections, shared by all of them
+    lock = threading.Lock()
+    active = [0]
+    active_lock = threading.Lock()
+
+    def serve(conn):
+        try:
+            serve_connection(conn, languages, lock)
+        except (ConnectionError, OSError) as ex:
+            logging.warning("Connection lost: " + repr(ex))
+        finally:
+            conn.close()
+            with active_lock:
+                active[0] -= 1
+                if active[0] == 0:
+                    with idle.get_lock():
+                        idle.value += 1
+
+    while True:
+        #A busy worker leaves new connections to the idle ones
+        if active[0] > 0 and idle.value > 0:
+            time.sleep(0.1)
+            continue
+        conn, _ = listener.accept()
+        with active_lock:
+            active[0] += 1
+            if active[0] == 1:
+                with idle.get_lock():
+                    idle.value -= 1
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+class AnalysisClient:
+    #Connection to analysisd
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.stream = self.sock.makefile("rb")
+
+    def request(self, message):
+        send_message(self.sock, message)
+        reply = recv_message(self.stream)
+        if reply == None:
+            raise Exception("analysisd closed the connection")
+        if "error" in reply:
+            raise Exception("analysisd: " + reply["error"])
+        return reply
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+class RemoteTokenizer:
+    #Same interface as CustomTokenizer (as used by ngrams.get_segments_ngrams), tokenizing in analysisd.
+    #The stopwords of the language come with it.
+
+    def __init__(self, client, lang, fast=False):
+        self.client = client
+        self.lang = lang
+        self.fast = fast
+        reply = client.request({"op": "load", "lang": lang, "fast": fast})
+        self.toktype = reply["toktype"]
+        self.warnings = reply["warnings"]
+        self.stopwords = frozenset(reply["stopwords"])
+
+    def tokenize(self, sent):
+        return self.tokenize_batch([sent])[0]
+
+    def tokenize_batch(self, sents):
+        if len(sents) == 0:
+            return []
+        return self.client.request({"op": "tokenize", "lang": self.lang, "fast": self.fast, "segments": sents})["tokens"]
+
+    def getWarnings(self):
+        return self.warnings
+
+
+class RemotePiiScanner:
+    #Same batch interface as PiiScanner, scanning in analysisd. The pre-filter runs here, so that only the
+    #segments that can have PII are sent
+
+    def __init__(self, client, lang):
+        self.client = client
+        self.lang = lang
+        self.prefilter = PREFILTER.search
+
+    def scan(self, texts, counts):
+        empty = {} if counts else 0
+        results = [empty] * len(texts)
+        candidates = [i for i, text in enumerate(texts) if self.prefilter(text) != None]
+        if len(candidates) > 0:
+            reply = self.client.request({"op": "pii", "lang": self.lang, "counts": counts, "segments": [texts[i] for i in candidates]})
+            for i, pii in zip(candidates, reply["pii"]):
+                results[i] = pii
+        if counts:
+            #Not shared between segments
+            results = [dict(result) for result in results]
+        return results
+
+    def has_pii_batch(self, texts):
+        return self.scan(texts, False)
+
+    def count_batch(self, texts):
+        return self.scan(texts, True)
+
+
+class RemoteLanguage:
+    #Same interface as WarmLanguage, with the tools kept by analysisd
+
+    def __init__(self, client, lang):
+        self.lang = lang
+        self.client = client
+        self.pii_scanner = RemotePiiScanner(client, lang)
+        self.tokenizers = {}
+        self.stopwords = None
+        self.used = time.time()
+
+    def tokenizer(self, fast):
+        tokenizer = self.tokenizers.get(fast)
+        if tokenizer == None:
+            tokenizer = RemoteTokenizer(self.client, self.lang, fast=fast)
+            self.tokenizers[fast] = tokenizer
+            self.stopwords = tokenizer.stopwords
+        return tokenizer
+
+
+def is_listening(path):
+    try:
+        client = AnalysisClient(path)
+    except OSError:
+        return False
+    try:
+        client.request({"op": "ping"})
+        return True
+    except Exception:
+        return False
+    finally:
+        client.close()
+
+def main():
+    args = initialization()
+
+    if args.detach and is_listening(args.socket):
+        logging.info("analysisd already listening on " + args.socket)
+        return
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    languages = WarmLanguages(args.max_languages, args.idle_time)
+    for lang in args.preload:
+        for fast in [False, True]:
+            languages.get(lang).tokenizer(fast)
+
+    #Bound before detaching, so that clients can connect as soon as this returns
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(args.socket)
+    listener.listen(128)
+
+    if args.detach:
+        if os.fork() != 0:
+            return
+        os.setsid()
+
+    logging.info("Listening on " + args.socket + " with " + str(args.workers) + " workers")
+    workers = []
+    idle = multiprocessing.Value("i", args.workers)
+    for i in range(args.workers):
+        w = multiprocessing.Process(target=worker, args=(listener, languages, idle), name="analysisd-"+str(i), daemon=True)
+        w.start()
+        workers.append(w)
+    try:
+        for w in workers:
+            w.join()
+    finally:
+        for w in workers:
+            w.terminate()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import traceback
+
+import iso639
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util import logging_setup
+from docformats import DOCUMENT_FORMATS, get_document_decoder, split_document
+
+#Compares how readdocuments.py decoded documents (json.loads of the whole line, re.split and iso639.Lang for every
+#document) with docformats.py (only the fields of the format are decoded, invariants out of the loop), checking that
+#both read the same fields and sentences. Usage:
+#   python3 scripts/benchmarks/bench_docdecode.py hplt3=sample.hplt3.jsonl fineweb=sample.fineweb.jsonl
+#Output: format  documents  docs/s (json.loads)  docs/s (docformats)  speedup
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('corpora', nargs='+', type=str, help="format=path pairs, path being a JSONL file with one document per line")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--max-docs', type=int, default=50000, help="Documents read from each file")
+    groupO.add_argument('--srclang', type=str, default="en", help="Language of the documents")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def get_lang3(srclang):
+    if len(srclang) == 2:
+        return iso639.Lang(srclang).pt3
+    return srclang
+
+def legacy(lines, fields, srclang):
+    docs = []
+    for line in lines:
+        doc = json.loads(line)
+        sents = [s for s in re.split(r'\\n|\n', doc.get("text")) if len(s) > 0]
+        lang3 = get_lang3(srclang)
+        docs.append((sents, lang3, [doc.get(field) for field in fields]))
+    return docs
+
+def selective(lines, fields, srclang, decode):
+    docs = []
+    lang3 = get_lang3(srclang)
+    for line in lines:
+        doc = decode(line)
+        sents = [s for s in split_document(doc.text) if len(s) > 0]
+        docs.append((sents, lang3, [getattr(doc, field) for field in fields]))
+    return docs
+
+def bench(docformat, path, max_docs, srclang):
+    with open(path, "rt", errors="replace") as docsfile:
+        lines = [line for i, line in zip(range(max_docs), docsfile)]
+    doctype = DOCUMENT_FORMATS[docformat]
+    #JSON names (i.e. "web-register") and attribute names (i.e. web_register)
+    json_fields = list(doctype.__struct_encode_fields__)
+    fields = list(doctype.__struct_fields__)
+    decode = get_document_decoder(docformat)
+
+    start = time.perf_counter()
+    legacy_docs = legacy(lines, json_fields, srclang)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selective_docs = selective(lines, fields, srclang, decode)
+    selective_time = time.perf_counter() - start
+
+    if legacy_docs != selective_docs:
+        raise Exception("Different documents for " + docformat)
+    return len(lines), legacy_time, selective_time
+
+def main():
+    args = initialization()
+    print("\t".join(["format", "documents", "json.loads", "docformats", "speedup"]))
+    for corpus in args.corpora:
+        docformat, path = corpus.split("=", 1)
+        docs, legacy_time, selective_time = bench(docformat, path, args.max_docs, args.srclang)
+        print("\t".join([docformat, str(docs), "{:.0f}".format(docs / max(legacy_time, 1e-9)), "{:.0f}".format(docs / max(selective_time, 1e-9)),
+                         "{:.1f}x".format(legacy_time / max(selective_time, 1e-9))]))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import traceback
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util import logging_setup
+from ngrams import get_line_ngrams, get_line_ngrams_fast, get_stopwords
+from tokenizer import CustomTokenizer
+
+#Compares ngrams.get_line_ngrams (plus the " ".join done by readcorpus) with ngrams.get_line_ngrams_fast,
+#checking that both give the same ngrams. Usage:
+#   python3 scripts/benchmarks/bench_ngrams.py en=sample.en.txt ja=sample.ja.txt
+#Output: lang  segments  seconds (get_line_ngrams)  seconds (get_line_ngrams_fast)  speedup
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('corpora', nargs='+', type=str, help="lang=path pairs, path being a file with one segment per line")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--max-segments', type=int, default=100000, help="Segments read from each file")
+    groupO.add_argument('--max-order', type=int, default=5, help="Maximum ngram order")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def bench(lang, path, max_segments, max_order):
+    stop_words, warnings = get_stopwords(lang)
+    tokenizer = CustomTokenizer(lang)
+    with open(path, "rt", errors="replace") as corpusfile:
+        segments = [line.strip() for i, line in zip(range(max_segments), corpusfile)]
+    tokenized = tokenizer.tokenize_batch(segments)
+
+    start = time.perf_counter()
+    legacy = []
+    for tokens in tokenized:
+        ngrams_dict, nwarning = get_line_ngrams(lang, tokens, max_order, stop_words)
+        legacy.append([[" ".join(g) for g in ngrams_dict.get(order)] for order in range(1, max_order+1)])
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [get_line_ngrams_fast(tokens, max_order, stop_words) for tokens in tokenized]
+    fast_time = time.perf_counter() - start
+
+    if fast != legacy:
+        raise Exception("Different ngrams for " + lang)
+    return len(segments), legacy_time, fast_time
+
+def main():
+    args = initialization()
+    print("\t".join(["lang", "segments", "get_line_ngrams", "get_line_ngrams_fast", "speedup"]))
+    for corpus in args.corpora:
+        lang, path = corpus.split("=", 1)
+        segments, legacy_time, fast_time = bench(lang, path, args.max_segments, args.max_order)
+        print("\t".join([lang, str(segments), "{:.3f}".format(legacy_time), "{:.3f}".format(fast_time), "{:.1f}x".format(legacy_time / max(fast_time, 1e-9))]))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import traceback
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util import logging_setup
+from piiscan import PiiScanner
+
+#Compares running pii_manager on every segment (as readcorpus did) with piiscan.PiiScanner (pre-filter + pii_manager),
+#checking that both flag the same segments. Usage:
+#   python3 scripts/benchmarks/bench_pii.py en=sample.en.txt ja=sample.ja.txt
+#Output: lang  segments  prefiltered-out  seconds (pii_manager)  seconds (PiiScanner)  speedup
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('corpora', nargs='+', type=str, help="lang=path pairs, path being a file with one segment per line")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--max-segments', type=int, default=100000, help="Segments read from each file")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def bench(lang, path, max_segments):
+    scanner = PiiScanner(lang)
+    with open(path, "rt", errors="replace") as corpusfile:
+        segments = [line.strip() for i, line in zip(range(max_segments), corpusfile)]
+
+    start = time.perf_counter()
+    legacy = []
+    for segment in segments:
+        pii = 0
+        try:
+            next(scanner.pii_proc(segment))
+            pii = 1
+        except StopIteration:
+            pass
+        legacy.append(pii)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [scanner.has_pii(segment) for segment in segments]
+    fast_time = time.perf_counter() - start
+
+    if fast != legacy:
+        raise Exception("Different PII flags for " + lang)
+    skipped = sum(1 for segment in segments if scanner.prefilter(segment) == None)
+    return len(segments), skipped, legacy_time, fast_time
+
+def main():
+    args = initialization()
+    print("\t".join(["lang", "segments", "prefiltered-out", "pii_manager", "PiiScanner", "speedup"]))
+    for corpus in args.corpora:
+        lang, path = corpus.split("=", 1)
+        segments, skipped, legacy_time, fast_time = bench(lang, path, args.max_segments)
+        print("\t".join([lang, str(segments), str(skipped), "{:.3f}".format(legacy_time), "{:.3f}".format(fast_time), "{:.1f}x".format(legacy_time / max(fast_time, 1e-9))]))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import traceback
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util import logging_setup
+from sacremoses import MosesTokenizer
+from fastmoses import FastMosesTokenizer
+
+#Compares sacremoses' MosesTokenizer with fastmoses.FastMosesTokenizer (used with --fast-tokenizer),
+#checking that both give the same tokens. Usage:
+#   python3 scripts/benchmarks/moses_conformance.py en=sample.en.txt de=sample.de.txt
+#Output: lang  segments  identical tokens (%)  identical token counts (%)  seconds (sacremoses)  seconds (fastmoses)  speedup
+#followed by the first segments with different tokens, if any.
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('corpora', nargs='+', type=str, help="lang=path pairs, path being a file with one segment per line, and lang a Moses language code")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--max-segments', type=int, default=100000, help="Segments read from each file")
+    groupO.add_argument('--max-mismatches', type=int, default=10, help="Segments with different tokens printed for each language")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def bench(lang, path, max_segments):
+    moses = MosesTokenizer(lang)
+    fast = FastMosesTokenizer(lang)
+    with open(path, "rt", errors="replace") as corpusfile:
+        segments = [line.strip() for i, line in zip(range(max_segments), corpusfile)]
+
+    start = time.perf_counter()
+    moses_tokens = [moses.tokenize(segment, escape=False) for segment in segments]
+    moses_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_tokens = [fast.tokenize(segment) for segment in segments]
+    fast_time = time.perf_counter() - start
+
+    mismatches = [i for i in range(len(segments)) if moses_tokens[i] != fast_tokens[i]]
+    same_counts = sum(1 for i in mismatches if len(moses_tokens[i]) == len(fast_tokens[i]))
+    return segments, moses_tokens, fast_tokens, mismatches, same_counts, moses_time, fast_time
+
+def percent(part, total):
+    return "{:.2f}".format(100 * part / max(total, 1))
+
+def main():
+    args = initialization()
+    print("\t".join(["lang", "segments", "identical", "identical-counts", "sacremoses", "fastmoses", "speedup"]))
+    examples = []
+    for corpus in args.corpora:
+        lang, path = corpus.split("=", 1)
+        segments, moses_tokens, fast_tokens, mismatches, same_counts, moses_time, fast_time = bench(lang, path, args.max_segments)
+        total = len(segments)
+        print("\t".join([lang, str(total), percent(total - len(mismatches), total), percent(total - len(mismatches) + same_counts, total),
+                         "{:.3f}".format(moses_time), "{:.3f}".format(fast_time), "{:.1f}x".format(moses_time / max(fast_time, 1e-9))]))
+        for i in mismatches[:args.max_mismatches]:
+            examples.append("\n".join([lang + ": " + segments[i], "  sacremoses: " + " ".join(moses_tokens[i]), "  fastmoses:  " + " ".join(fast_tokens[i])]))
+    if examples:
+        print("")
+        print("\n".join(examples))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
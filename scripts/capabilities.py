@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import traceback
+
+import iso639
+
+from util import logging_setup, get_fastspell_langs
+from mapdriver import open_compressed
+
+#Annotations that documents of each format can carry, and that are used instead of computing them again:
+# - seg_langs: language of every segment (instead of FastSpell over the segments, see readdocuments.py --emit-langs)
+# - wds: Web Docs Scorer score of the document (instead of docscorer)
+# - register_labels: web register probabilities of the document (instead of registerlabels.py, see
+#                    readdocuments.py --register-labels)
+#Given a documents file, prints the annotations that its first documents have (i.e. "seg_langs wds register_labels"),
+#for runstats.sh to choose the stages to run. Usage:
+#   python3 scripts/capabilities.py hplt3 documents.jsonl.zst
+
+CAPABILITIES = {
+    #format: {annotation: JSON field or Parquet column}
+    "hplt2": {"seg_langs": "seg_langs", "wds": "doc_scores"},
+    "hplt3": {"seg_langs": "seg_langs", "wds": "doc_scores", "register_labels": "web-register"},
+    "nemotron": {},
+    "fineweb": {},
+    "madlad": {},
+}
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('format', type=str, choices=CAPABILITIES.keys(), help="Document format")
+    parser.add_argument('input', type=str, help="Documents file (JSONL, plain or compressed, or Parquet)")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--sample', type=int, default=100, help="Documents checked: an annotation is reused if all of them have it")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def read_sample(path, fields, sample):
+    #First documents of a file, as dicts with (at most) the given fields
+    if path.endswith(".parquet"):
+        import pyarrow.parquet
+        parquetfile = pyarrow.parquet.ParquetFile(path)
+        names = set(parquetfile.schema_arrow.names)
+        columns = [field for field in fields if field in names]
+        if len(columns) == 0:
+            return [{}]
+        return next(parquetfile.iter_batches(batch_size=sample, columns=columns)).to_pylist()
+    stream = open_compressed(path)
+    if stream == None:
+        stream = open(path, "rb")
+    docs = []
+    with stream:
+        for line in stream:
+            if len(docs) >= sample:
+                break
+            doc = json.loads(line)
+            docs.append({field: doc.get(field) for field in fields})
+    return docs
+
+def detect(docformat, path, sample=100):
+    #Annotations of the format that all the sampled documents have
+    capabilities = CAPABILITIES[docformat]
+    if len(capabilities) == 0:
+        return []
+    docs = read_sample(path, list(capabilities.values()), sample)
+    return [annotation for annotation, field in capabilities.items() if len(docs) > 0 and all(doc.get(field) != None for doc in docs)]
+
+
+fastspell_labels = set(get_fastspell_langs())
+#Codes that FastSpell has as labels, but not for the language with that ISO 639-3 code: "als" is Alemannic in
+#fastText (Tosk Albanian is "sq") and Standard Malay is written "ms"
+fastspell_label_conflicts = {"als", "zsm"}
+fastspell_langs = {}
+
+def get_fastspell_lang(lang):
+    #Language code as FastSpell writes it, from a code with script as in seg_langs (i.e. "eng_Latn"):
+    # - ISO 639-1 if there is one ("eng" -> "en")
+    # - the code itself if FastSpell has it as a label ("arz", "yue", "ckb", "azb")
+    # - ISO 639-1 of its macrolanguage ("arb" -> "ar", "pes" -> "fa", "lvs" -> "lv", "zsm" -> "ms", "cmn" -> "zh")
+    # - otherwise the code itself
+    #Serbo-Croatian keeps the script, as FastSpell does ("hbs_lat", "hbs_cyr")
+    fastspell_lang = fastspell_langs.get(lang)
+    if fastspell_lang == None:
+        code, _, script = lang.partition("_")
+        if code == "hbs":
+            fastspell_lang = "hbs_" + script[:3].lower()
+        else:
+            try:
+                isolang = iso639.Lang(code)
+                fastspell_lang = isolang.pt1
+                if not fastspell_lang and code in fastspell_labels and code not in fastspell_label_conflicts:
+                    fastspell_lang = code
+                if not fastspell_lang and isolang.macro() != None:
+                    fastspell_lang = isolang.macro().pt1
+                fastspell_lang = fastspell_lang or code
+            except Exception:
+                fastspell_lang = code
+        fastspell_langs[lang] = fastspell_lang
+    return fastspell_lang
+
+def main():
+    args = initialization()
+    annotations = detect(args.format, args.input, args.sample)
+    logging.info("Annotations reused: " + (" ".join(annotations) if len(annotations) > 0 else "none"))
+    print(" ".join(annotations))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
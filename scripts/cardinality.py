@@ -0,0 +1,207 @@
+import os
+import math
+import zlib
+import base64
+import logging
+import tempfile
+from array import array
+
+#Distinct counting of 64-bit segment hashes (xxh64), in two flavours:
+# - "hll": HyperLogLog sketches. A few KB per counter, relative standard error of 1.04/sqrt(2^precision)
+#          (1.6% for the default precision of 12). Small counters are kept exact until they would
+#          need as much memory as the sketch.
+# - "exact": hashes are hash-partitioned into on-disk buckets (when a spill dir is given), so only one
+#          bucket needs to be in memory when counting.
+#Both are mergeable across workers. Every counter is identified by a name (i.e. "src") and an integer
+#key (i.e. the token count of the segment), so that distinct counts per key come out of the same pass.
+
+class HyperLogLog:
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.sparse = set()
+        self.sparse_limit = self.m // 8  #a set of 64-bit hashes this size takes as much memory as the registers
+        self.registers = None
+
+    def add(self, hashvalue):
+        if self.registers == None:
+            self.sparse.add(hashvalue)
+            if len(self.sparse) > self.sparse_limit:
+                self.densify()
+            return
+        self.add_dense(hashvalue)
+
+    def add_dense(self, hashvalue):
+        index = hashvalue >> (64 - self.precision)
+        rest = hashvalue & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def densify(self):
+        self.registers = bytearray(self.m)
+        for hashvalue in self.sparse:
+            self.add_dense(hashvalue)
+        self.sparse = set()
+
+    def merge(self, other):
+        assert self.precision == other.precision, "Cannot merge HyperLogLogs with different precision"
+        if other.registers == None:
+            for hashvalue in other.sparse:
+                self.add(hashvalue)
+            return
+        if self.registers == None:
+            self.densify()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        if self.registers == None:
+            return len(self.sparse)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros > 0:
+            #Small range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def to_dict(self):
+        if self.registers == None:
+            return {"p": self.precision, "sparse": sorted(self.sparse)}
+        return {"p": self.precision, "dense": base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        hll = cls(data["p"])
+        if "dense" in data:
+            hll.registers = bytearray(zlib.decompress(base64.b64decode(data["dense"])))
+        else:
+            hll.sparse = set(data["sparse"])
+        return hll
+
+
+class DistinctCounter:
+
+    def __init__(self, mode="exact", spill_dir=None, precision=12, partitions=64, buffer_size=1000000):
+        assert mode in ["exact", "hll"], "Unknown cardinality mode " + str(mode)
+        self.mode = mode
+        self.spill_dir = spill_dir
+        self.precision = precision
+        self.partitions = partitions
+        self.buffer_size = buffer_size
+        self.hlls = {}      #(name, key) -> HyperLogLog
+        self.pending = {}   #name -> set of (key << 64 | hash), not yet written to disk
+        self.buckets = []   #[name, partition, path]
+        self.workdir = None
+        self.flushes = 0
+
+    def add(self, name, key, hashvalue):
+        if self.mode == "hll":
+            hll = self.hlls.get((name, key))
+            if hll == None:
+                hll = HyperLogLog(self.precision)
+                self.hlls[(name, key)] = hll
+            hll.add(hashvalue)
+            return
+
+        pending = self.pending.get(name)
+        if pending == None:
+            pending = set()
+            self.pending[name] = pending
+        pending.add((key << 64) | hashvalue)
+        if self.spill_dir != None and len(pending) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.workdir == None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.workdir = tempfile.mkdtemp(prefix="distinct.", dir=self.spill_dir)
+        logging.debug("Flushing distinct hashes to " + self.workdir)
+        for name, pending in self.pending.items():
+            partitioned = [array("Q") for p in range(self.partitions)]
+            for item in pending:
+                #Interleaved key, hash
+                bucket = partitioned[(item & 0xFFFFFFFFFFFFFFFF) % self.partitions]
+                bucket.append(item >> 64)
+                bucket.append(item & 0xFFFFFFFFFFFFFFFF)
+            for partition, bucket in enumerate(partitioned):
+                if len(bucket) == 0:
+                    continue
+                path = os.path.join(self.workdir, "{}.{}.{}".format(name, partition, self.flushes))
+                with open(path, "wb") as bucketfile:
+                    bucket.tofile(bucketfile)
+                self.buckets.append([name, partition, path])
+        self.pending = {}
+        self.flushes += 1
+
+    def close(self):
+        if self.spill_dir != None and len(self.pending) > 0:
+            self.flush()
+
+    def merge(self, other):
+        assert self.mode == other.mode, "Cannot merge distinct counters with different modes"
+        for (name, key), hll in other.hlls.items():
+            if (name, key) in self.hlls:
+                self.hlls[(name, key)].merge(hll)
+            else:
+                self.hlls[(name, key)] = hll
+        for name, pending in other.pending.items():
+            self.pending.setdefault(name, set()).update(pending)
+        self.buckets.extend(other.buckets)
+
+    def counts(self):
+        #{name: {key: distinct hashes}}
+        results = {}
+        if self.mode == "hll":
+            for (name, key), hll in self.hlls.items():
+                results.setdefault(name, {})[key] = hll.count()
+            return results
+
+        tasks = {}
+        for name, partition, path in self.buckets:
+            tasks.setdefault((name, partition), []).append(path)
+        names = set(name for name, partition in tasks.keys()) | set(self.pending.keys())
+        for name in names:
+            keycounts = results.setdefault(name, {})
+            #Hashes still in memory are deduplicated within the bucket they would have been written to
+            pending = [set() for p in range(self.partitions)]
+            for item in self.pending.get(name, []):
+                pending[(item & 0xFFFFFFFFFFFFFFFF) % self.partitions].add(item)
+            #Only one bucket at a time is loaded in memory
+            for partition in range(self.partitions):
+                seen = pending[partition]
+                for path in tasks.get((name, partition), []):
+                    bucket = array("Q")
+                    with open(path, "rb") as bucketfile:
+                        bucket.fromfile(bucketfile, os.path.getsize(path) // bucket.itemsize)
+                    seen.update((bucket[i] << 64) | bucket[i+1] for i in range(0, len(bucket), 2))
+                for item in seen:
+                    keycounts[item >> 64] = keycounts.get(item >> 64, 0) + 1
+                pending[partition] = None
+        return results
+
+    def error(self):
+        #Relative standard error of the counts (0 when exact)
+        if self.mode == "hll":
+            return round(1.04 / math.sqrt(1 << self.precision), 4)
+        return 0
+
+    def to_dict(self):
+        return {"mode": self.mode, "precision": self.precision, "partitions": self.partitions,
+                "hll": [[name, key, hll.to_dict()] for (name, key), hll in self.hlls.items()],
+                "pending": {name: sorted(pending) for name, pending in self.pending.items()},
+                "buckets": self.buckets}
+
+    @classmethod
+    def from_dict(cls, data):
+        counter = cls(data["mode"], precision=data["precision"], partitions=data["partitions"])
+        for name, key, hll in data["hll"]:
+            counter.hlls[(name, key)] = HyperLogLog.from_dict(hll)
+        for name, pending in data["pending"].items():
+            counter.pending[name] = set(pending)
+        counter.buckets = data["buckets"]
+        return counter
@@ -5,31 +5,49 @@ import logging
 import traceback
 import argparse
 import json
-import pandas
+import pyarrow.parquet
+
+#Parquet file to JSON lines, one row group at a time (in batches of --batch-rows rows), so that the file is never
+#in memory as a whole. With --columns, only those columns are read.
+#readdocuments.py (through mapdriver.py) reads Parquet files directly, this is for the tools that read JSON lines.
 
 def initialization():
     parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
-    parser.add_argument('input', nargs='?', type=argparse.FileType('rb'), default=io.TextIOWrapper(sys.stdin.buffer, errors="replace"),  help="Input parquet file.")
-    parser.add_argument('output', nargs='?', type=argparse.FileType('wt'), default=sys.stdout, help="Output.") 
-    
-    
-    args = parser.parse_args() 
+    parser.add_argument('input', nargs='?', type=argparse.FileType('rb'), default=sys.stdin.buffer,  help="Input parquet file.")
+    parser.add_argument('output', nargs='?', type=argparse.FileType('wt'), default=sys.stdout, help="Output.")
+
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--columns', nargs='+', default=None, help="Columns to read (the ones not in the file are left out). All of them by default.")
+    groupO.add_argument('--batch-rows', type=int, default=1024, help="Rows read at a time")
+
+    args = parser.parse_args()
     #logging_setup(args)
     return args
-    
-    
+
+
 def main():
-    args = initialization() # Parsing parameters    
-    
-    df = pandas.read_parquet(args.input)
-    jsonlines = df.to_json(args.output, orient="records", lines=True)
-    #for l in jsonlines:
-    #    args.output.write(l)
-    
+    args = initialization() # Parsing parameters
+
+    source = args.input
+    if not source.seekable():
+        #Parquet files are read from the end (footer), standard input is read whole
+        source = io.BytesIO(source.read())
+    parquetfile = pyarrow.parquet.ParquetFile(source)
+
+    columns = None
+    if args.columns != None:
+        names = set(parquetfile.schema_arrow.names)
+        columns = [column for column in args.columns if column in names]
+
+    for batch in parquetfile.iter_batches(batch_size=args.batch_rows, columns=columns):
+        for record in batch.to_pylist():
+            #Timestamps and other non-JSON values as strings
+            args.output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
 if __name__ == '__main__':
     try:
         main()  # Running main program
     except Exception as ex:
         tb = traceback.format_exc()
         logging.error(tb)
-        sys.exit(1)    
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,71 @@
+from typing import Any
+
+import msgspec
+
+#Fields of every document format read by readdocuments.py.
+#Documents are decoded straight into these structs: the fields that are not here (i.e. most of the metadata of
+#HPLT documents) are skipped by the decoder instead of being built as Python objects. Missing fields are None,
+#as with dict.get, and values are not type-checked (any JSON value is accepted, as json.loads does).
+#Fields whose JSON name is not a Python name are renamed (i.e. "web-register" is read as web_register).
+
+class HPLT2Document(msgspec.Struct):
+    text: Any = None
+    seg_langs: Any = None
+    u: Any = None
+    collection: Any = None
+    doc_scores: Any = None
+    lang: Any = None
+    id: Any = None
+
+class HPLT3Document(msgspec.Struct):
+    text: Any = None
+    seg_langs: Any = None
+    u: Any = None
+    crawl_id: Any = None
+    doc_scores: Any = None
+    web_register: Any = msgspec.field(default=None, name="web-register")
+    lang: Any = None
+    id: Any = None
+
+class NemotronDocument(msgspec.Struct):
+    text: Any = None
+    url: Any = None
+    warc_record_id: Any = None
+
+class FinewebDocument(msgspec.Struct):
+    text: Any = None
+    url: Any = None
+    dump: Any = None
+    language: Any = None
+    language_script: Any = None
+    id: Any = None
+
+class MadladDocument(msgspec.Struct):
+    text: Any = None
+    id: Any = None
+
+
+DOCUMENT_FORMATS = {
+    "hplt2": HPLT2Document,
+    "hplt3": HPLT3Document,
+    "nemotron": NemotronDocument,
+    "fineweb": FinewebDocument,
+    "madlad": MadladDocument,
+}
+
+def get_document_decoder(docformat):
+    #JSON line (text or bytes) -> document struct, its fields read with getattr
+    return msgspec.json.Decoder(DOCUMENT_FORMATS[docformat]).decode
+
+def get_document_columns(docformat):
+    #JSON fields (or Parquet columns) read for a format
+    return list(DOCUMENT_FORMATS[docformat].__struct_encode_fields__)
+
+def get_record_decoder(docformat):
+    #Row of a Parquet file (dict of the columns of the format, see mapdriver.py) -> document struct
+    doctype = DOCUMENT_FORMATS[docformat]
+    return lambda record: msgspec.convert(record, doctype)
+
+def split_document(text):
+    #Same as re.split(r'\\n|\n', text): documents are split both on newlines and on escaped newlines
+    return text.replace("\\n", "\n").split("\n")
@@ -0,0 +1,113 @@
+import os
+import logging
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import tldextract
+
+#Domain and top-level domain (public suffix) of URLs, as readdocuments.py reports them.
+#Suffixes come from the public suffix list snapshot shipped with tldextract (no network access at startup), built
+#into its suffix trie once per process. Resolved hosts are kept in a bounded LRU and, optionally, in a persistent
+#cache (a SQLite database in WAL mode, shared across the workers of a run and across runs), written in batches.
+
+class DomainResolver:
+
+    def __init__(self, max_entries=100000, path=None, batch_size=10000):
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.cache = OrderedDict()  #host -> (domain, tld), least recently used first
+        self.pending = []           #new entries of the persistent cache
+        self.lookups = 0
+        self.hits = 0               #found in the LRU
+        self.stored = 0             #found in the persistent cache
+
+        self.extractor = tldextract.TLDExtract(cache_dir=None, suffix_list_urls=())
+        self.extractor("example.com")   #Builds the trie now, not in the first block
+
+        self.path = path
+        self.db = None
+        if path != None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            with self.db:
+                self.db.execute("CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, domain TEXT, tld TEXT) WITHOUT ROWID")
+
+    def extract(self, host):
+        extract_res = self.extractor(host)
+        rawdomain = extract_res.domain #This does not include subdomain
+        tld = extract_res.suffix #This is the TDL removing the preceeding dot
+        return (rawdomain + "." + tld, tld)
+
+    def resolve_batch(self, urls):
+        #[(domain, tld) of every url], ("", "") for the urls that cannot be parsed
+        cache = self.cache
+        results = [("", "")] * len(urls)
+        missing = {}    #host -> positions
+        for i, url in enumerate(urls):
+            try:
+                host = urlparse(url).netloc #This includes subdomain
+            except Exception as ex:
+                logging.error("Bad url: " + str(url))
+                logging.error(ex)
+                continue
+            self.lookups += 1
+            resolved = cache.get(host)
+            if resolved != None:
+                cache.move_to_end(host)
+                self.hits += 1
+                results[i] = resolved
+            else:
+                missing.setdefault(host, []).append(i)
+        #Repeated in the batch (as if the first one had been in memory already)
+        self.hits += sum(len(positions) - 1 for positions in missing.values())
+
+        resolved = {}
+        if self.db != None and len(missing) > 0:
+            hosts = list(missing.keys())
+            #SQLite limits the number of parameters of a query
+            for start in range(0, len(hosts), 500):
+                part = hosts[start:start+500]
+                query = "SELECT host, domain, tld FROM hosts WHERE host IN (" + ",".join("?" * len(part)) + ")"
+                for host, domain, tld in self.db.execute(query, part):
+                    resolved[host] = (domain, tld)
+            #Only the first url of every host: the rest were counted as repeated in the batch
+            self.stored += len(resolved)
+
+        for host, positions in missing.items():
+            if host not in resolved:
+                try:
+                    resolved[host] = self.extract(host)
+                except Exception as ex:
+                    logging.error("Bad url: " + str(urls[positions[0]]))
+                    logging.error(ex)
+                    continue
+                self.pending.append((host,) + resolved[host])
+            for i in positions:
+                results[i] = resolved[host]
+            cache[host] = resolved[host]
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return results
+
+    def resolve(self, url):
+        return self.resolve_batch([url])[0]
+
+    def flush(self):
+        if self.db != None and len(self.pending) > 0:
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO hosts VALUES (?, ?, ?)", self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.lookups > 0:
+            logging.info("Domain resolution: {} urls, {} in memory, {} in the persistent cache, {} resolved, hit rate {:.4f}, {} hosts kept".format(
+                         self.lookups, self.hits, self.stored, self.lookups - self.hits - self.stored, (self.hits + self.stored) / self.lookups, len(self.cache)))
+        if self.db != None:
+            self.db.close()
@@ -0,0 +1,128 @@
+import re
+from itertools import chain
+
+from sacremoses import MosesTokenizer
+
+#Faster drop-in for sacremoses' MosesTokenizer(lang).tokenize(text, escape=False), giving the same tokens.
+#Almost every step of the Moses tokenizer only looks at a word (a whitespace-separated chunk of the sentence)
+#and at the spaces around it, so those steps are run once per distinct word and memoized: with the usual
+#vocabulary of a corpus, most words are never processed again. The steps that look across words (nonbreaking
+#prefixes, final ".'") run on the token list of the sentence, as sacremoses does.
+#The only interaction between words that the memo cannot reproduce (a word ending with an apostrophe followed
+#by one starting with an apostrophe, which can share the space between them in the apostrophe rules) is sent
+#to sacremoses. scripts/benchmarks/moses_conformance.py checks both tokenizers against sample corpora.
+
+SPACES = re.compile(r"\s+")
+SHARED_APOSTROPHE = re.compile(r"' +'")
+BACKREF = re.compile(r"\\(\d)")
+
+def compile_substitution(regexp, substitution):
+    #(compiled regexp, replacement), the replacement being a function when it has backreferences, so that
+    #re does not parse the template on every call
+    parts = BACKREF.split(substitution)
+    if len(parts) == 1:
+        return re.compile(regexp), substitution
+    literals = parts[0::2]
+    groups = [int(group) for group in parts[1::2]]
+    def replace(match):
+        return literals[0] + "".join(match.group(group) + literal for group, literal in zip(groups, literals[1:]))
+    return re.compile(regexp), replace
+
+class WordCache(dict):
+    #word -> tokens, computed on the first lookup
+    def __init__(self, split_word):
+        self.split_word = split_word
+
+    def __missing__(self, word):
+        tokens = self.split_word(word)
+        self[word] = tokens
+        return tokens
+
+
+class FastMosesTokenizer:
+
+    def __init__(self, lang, cache_size=1000000):
+        self.moses = MosesTokenizer(lang)
+        moses = self.moses
+        self.cache_size = cache_size
+        self.cache = WordCache(self.split_cached_word)
+
+        self.junk = re.compile(moses.ASCII_JUNK[0])
+        self.pad_regex = compile_substitution(*moses.PAD_NOT_ISALNUM)
+        self.comma_regexes = [compile_substitution(*rule) for rule in [moses.COMMA_SEPARATE_1, moses.COMMA_SEPARATE_2, moses.COMMA_SEPARATE_3]]
+        if lang == "en":
+            apostrophes = moses.ENGLISH_SPECIFIC_APOSTROPHE
+        elif lang in ["fr", "it"]:
+            apostrophes = moses.FR_IT_SPECIFIC_APOSTROPHE
+        else:
+            apostrophes = [moses.NON_SPECIFIC_APOSTROPHE]
+        self.apostrophe_regexes = [compile_substitution(*rule) for rule in apostrophes]
+
+        self.nonbreaking_prefixes = frozenset(moses.NONBREAKING_PREFIXES)
+        self.numeric_only_prefixes = frozenset(moses.NUMERIC_ONLY_PREFIXES)
+        self.alpha = frozenset(moses.IsAlpha)
+        self.lower = frozenset(moses.IsLower)
+
+    def split_word(self, word, first, last):
+        #Moses steps before the nonbreaking prefixes, on a word surrounded by the same spaces as in the sentence
+        #(the rules that need a character that is not in the word are skipped)
+        text = ("" if first else " ") + word + ("" if last else " ")
+        regexp, substitution = self.pad_regex
+        text = regexp.sub(substitution, text)
+        if ".." in text or "DOTMULTI" in text:
+            text = self.moses.replace_multidots(text)
+        if "," in text:
+            for regexp, substitution in self.comma_regexes:
+                text = regexp.sub(substitution, text)
+        if "'" in text:
+            for regexp, substitution in self.apostrophe_regexes:
+                text = regexp.sub(substitution, text)
+        return text.split()
+
+    def split_cached_word(self, word):
+        #The first and last words of a sentence are not surrounded by spaces, so they are cached with a "\n" mark
+        #(newlines cannot be in a word)
+        return self.split_word(word.strip("\n"), word[0] == "\n", word[-1] == "\n")
+
+    def tokenize(self, sent):
+        text = self.junk.sub("", SPACES.sub(" ", sent))
+        words = text.split()
+        if len(words) == 0:
+            return []
+        if "'" in text and SHARED_APOSTROPHE.search(text) != None:
+            return self.moses.tokenize(sent, escape=False)
+
+        if len(self.cache) > self.cache_size:
+            self.cache = WordCache(self.split_cached_word)
+        words[0] = "\n" + words[0]
+        words[-1] = words[-1] + "\n"
+        tokens = list(chain.from_iterable(map(self.cache.__getitem__, words)))
+
+        tokens = self.handle_nonbreaking_prefixes(tokens)
+
+        #Split trailing ".'"
+        if tokens[-1].endswith(".'"):
+            tokens[-1:] = (tokens[-1][:-2] + " . '").split()
+
+        #Restore multidots
+        for i, token in enumerate(tokens):
+            if "DOTMULTI" in token:
+                while "DOTDOTMULTI" in token:
+                    token = token.replace("DOTDOTMULTI", "DOTMULTI.")
+                tokens[i] = token.replace("DOTMULTI", ".")
+        return tokens
+
+    def handle_nonbreaking_prefixes(self, tokens):
+        #Same as MosesTokenizer.handles_nonbreaking_prefixes, on a list of tokens (only the ones ending with a period can change)
+        num_tokens = len(tokens)
+        for i in reversed([i for i, token in enumerate(tokens) if token[-1] == "." and len(token) > 1]):
+            prefix = tokens[i][:-1]
+            if ("." in prefix and not self.alpha.isdisjoint(prefix)) \
+                or (prefix in self.nonbreaking_prefixes and prefix not in self.numeric_only_prefixes) \
+                or (i != num_tokens - 1 and tokens[i+1][0] in self.lower):
+                pass
+            elif prefix in self.numeric_only_prefixes and i + 1 < num_tokens and tokens[i+1][0] in "0123456789":
+                pass
+            else:
+                tokens[i:i+1] = [prefix, "."]
+        return tokens
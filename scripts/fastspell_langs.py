@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+import logging
+import traceback
+import argparse
+
+from fastspell import FastSpell
+
+from util import logging_setup, stdout_to_err
+
+#Same output as "fastspell --aggr lang input | cut -f2": one identified language per input line
+#With --weighted, input lines are "multiplicity\tsegment" (collapsed duplicates) and output lines "multiplicity\tlanguage"
+
+def initialization(argv=None):
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('input',  nargs='?', type=argparse.FileType('rt', errors="replace"), default=io.TextIOWrapper(sys.stdin.buffer, errors="replace"),  help="Input file (one segment per line).")
+    parser.add_argument('lang', type=str, help="Expected language")
+    parser.add_argument('output', nargs='?', type=argparse.FileType('wt'), default=sys.stdout, help="Output.")
+
+    # Optionals
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--mode', type=str, default="aggr", choices=["aggr", "cons"], help="FastSpell mode.")
+    groupO.add_argument('--weighted', action='store_true', help="Every line starts with the times it is in the corpus and a tab, which is kept in the output.")
+
+    # Logging group
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args(argv)
+    logging_setup(args)
+    return args
+
+
+class LangTagger:
+    #Built once (FastText model and dictionaries are loaded here), can process many blocks of lines (see mapdriver.py)
+
+    def __init__(self, args):
+        with stdout_to_err():
+            self.fastspell = FastSpell(args.lang, mode=args.mode)
+        self.weighted = args.weighted
+
+    def process(self, lines, output):
+        getlang = self.fastspell.getlang
+        if self.weighted:
+            for line in lines:
+                weight, segment = line.rstrip("\n").split("\t", 1)
+                output.write(weight + "\t" + getlang(segment) + "\n")
+            return
+        for line in lines:
+            output.write(getlang(line.rstrip("\n")) + "\n")
+
+    def finish(self, output):
+        pass
+
+
+def main():
+    args = initialization()
+    logging.info("Starting process")
+
+    tagger = LangTagger(args)
+    tagger.process(args.input, args.output)
+    tagger.finish(args.output)
+
+if __name__ == '__main__':
+    try:
+        main()  # Running main program
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
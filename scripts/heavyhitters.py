@@ -0,0 +1,72 @@
+#Most frequent keys of a stream (i.e. the domains of the documents) in bounded memory, as a Space-Saving summary
+#(Metwally et al., 2005) that is mergeable across workers (Agarwal et al., 2012).
+#Keys are counted exactly until there are 2*capacity of them. Then only the capacity keys with the highest counts
+#are kept, and the highest count dropped becomes the floor: a key that is not in the summary was seen at most
+#floor times, and a key added afterwards starts counting from the floor, so counts are upper bounds (never more
+#than floor above the true count) and any key seen more than floor times is in the summary.
+#While the floor is 0 (the usual case for TLDs or collections) the counts are exact. Otherwise the top keys
+#can be counted again exactly in a second pass over the keys (see recount).
+
+class SpaceSaving:
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = {}    #key -> count, upper bound of the true count
+        self.floor = 0
+
+    def add(self, key, weight=1):
+        counts = self.counts
+        count = counts.get(key)
+        if count == None:
+            counts[key] = self.floor + weight
+            if len(counts) > 2 * self.capacity:
+                self.prune()
+        else:
+            counts[key] = count + weight
+
+    def prune(self):
+        if len(self.counts) <= self.capacity:
+            return
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        self.floor = max(self.floor, ranked[self.capacity][1])
+        self.counts = dict(ranked[:self.capacity])
+
+    def merge(self, other):
+        #Keys missing from one of the summaries were seen at most its floor times there
+        counts = {}
+        for key in self.counts.keys() | other.counts.keys():
+            counts[key] = self.counts.get(key, self.floor) + other.counts.get(key, other.floor)
+        self.counts = counts
+        self.floor += other.floor
+        self.prune()
+
+    def exact(self):
+        return self.floor == 0
+
+    def complete(self, n):
+        #Whether the top n keys are the true top n: the keys out of the summary cannot reach the n-th count
+        top = self.top(n)
+        return self.floor == 0 or (len(top) == n and top[-1][1] > self.floor)
+
+    def top(self, n):
+        #[(key, count)], highest counts first (ties: highest keys first, as "sort -nr")
+        return sorted(self.counts.items(), key=lambda item: (item[1], item[0]), reverse=True)[:n]
+
+    def recount(self, keys):
+        #Exact counts of the keys in the summary, from a second pass over all the keys of the stream.
+        #The floor stays: the keys that are not in the summary were still seen at most floor times
+        counts = dict.fromkeys(self.counts, 0)
+        for key in keys:
+            if key in counts:
+                counts[key] += 1
+        self.counts = counts
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "floor": self.floor, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data["capacity"])
+        summary.floor = data["floor"]
+        summary.counts = data["counts"]
+        return summary
@@ -0,0 +1,52 @@
+import logging
+from collections import OrderedDict
+from xxhash import xxh64
+
+#Language identification of segments, remembering the most recent results.
+#Web documents repeat the same lines (menus, cookie banners, footers) over and over, so every distinct segment of a
+#batch is identified only once, and the segments identified recently are not identified again. Results are kept
+#in a bounded LRU, keyed by the xxh64 of the segment (8 bytes per entry instead of the segment itself).
+
+class CachedIdentifier:
+
+    def __init__(self, identify, max_entries=1000000):
+        self.identify = identify    #segment -> language, i.e. heli_otr.Identifier().identify
+        self.max_entries = max_entries
+        self.cache = OrderedDict()  #segment hash -> language, least recently used first
+        self.lookups = 0
+        self.hits = 0
+
+    def identify_batch(self, segments):
+        #[language of every segment]
+        cache = self.cache
+        keys = [xxh64(segment).intdigest() for segment in segments]
+        langs = [None] * len(segments)
+        missing = {}    #segment hash -> positions
+        for i, key in enumerate(keys):
+            lang = cache.get(key)
+            if lang != None:
+                cache.move_to_end(key)
+                langs[i] = lang
+            else:
+                missing.setdefault(key, []).append(i)
+
+        self.lookups += len(segments)
+        self.hits += len(segments) - len(missing)
+
+        identify = self.identify
+        for key, positions in missing.items():
+            lang = identify(segments[positions[0]])
+            for i in positions:
+                langs[i] = lang
+            cache[key] = lang
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return langs
+
+    def hit_rate(self):
+        #Segments not identified (already in the cache, or repeated in their batch) out of all segments
+        return self.hits / self.lookups if self.lookups > 0 else 0.0
+
+    def log_stats(self):
+        logging.info("Language identification: {} segments, {} identified, hit rate {:.4f}, {} cached".format(
+                     self.lookups, self.lookups - self.hits, self.hit_rate(), len(self.cache)))
@@ -5,11 +5,15 @@ inputfile=$3
 outputfile=$4
 column=$5
 
-if [[ $* == *--nocache* ]]
+if [[ $* == *--weighted* ]]
 then
-	cat $inputfile | cut -f $column |parallel -j $JOBS --pipe ./scripts/map/par-fastspell.sh $langcode > $outputfile
+	#Collapsed duplicates ("multiplicity\tline"), already unique: the multiplicity is kept in the output
+	cat $inputfile | cut -f 1,$(($column + 1)) | python3 /work/scripts/mapdriver.py $JOBS - $outputfile fastspell $langcode --weighted --quiet 2> fastspell.log
+elif [[ $* == *--nocache* ]]
+then
+	cat $inputfile | cut -f $column | python3 /work/scripts/mapdriver.py $JOBS - $outputfile fastspell $langcode --quiet 2> fastspell.log
 else
-	cat $inputfile | cut -f $column | /work/preprocess/build/bin/cache -k 1 parallel -k -j $JOBS --pipe ./scripts/map/par-fastspell.sh $langcode > $outputfile
+	cat $inputfile | cut -f $column | /work/preprocess/build/bin/cache -k 1 python3 /work/scripts/mapdriver.py $JOBS - - fastspell $langcode --quiet 2> fastspell.log > $outputfile
 fi
 
 
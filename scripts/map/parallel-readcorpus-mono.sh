@@ -5,7 +5,7 @@ srclang=$3
 outputfile=$4
 
 
-cat $inputfile  | parallel -j $JOBS --pipe ./scripts/map/par-readcorpus-mono.sh $srclang > $outputfile
+python3 /work/scripts/mapdriver.py $JOBS $inputfile $outputfile readcorpus_mono $srclang --quiet ${@:5} 2> readcorpus-mono.log
 
 
 
@@ -6,7 +6,7 @@ trglang=$4
 outputfile=$5
 
 
-cat $inputfile  | parallel -j $JOBS --pipe ./scripts/map/par-readcorpus.sh $srclang $trglang > $outputfile
+python3 /work/scripts/mapdriver.py $JOBS $inputfile $outputfile readcorpus $srclang $trglang --quiet ${@:6} 2> readcorpus.log
 
 
 
@@ -5,4 +5,4 @@ srclang=$3
 outputfile=$4
 format=$5
 
-cat $inputfile  | parallel -j $JOBS --pipe ./scripts/map/par-readdocuments.sh $srclang $format > $outputfile
+python3 /work/scripts/mapdriver.py $JOBS $inputfile $outputfile readdocuments $srclang --format $format --quiet ${@:6} 2> readdocuments.log
@@ -0,0 +1,278 @@
+import io
+import os
+import sys
+import gzip
+import lzma
+import mmap
+import queue
+import logging
+import threading
+import subprocess
+import argparse
+import traceback
+import importlib
+import multiprocessing
+
+from util import logging_setup
+
+#Map driver: replaces "parallel --pipe ./scripts/map/par-*.sh".
+#Starts N long-lived workers once (each one imports its task module and builds its processor, i.e. tokenizers,
+#PII managers and stopwords, only once), splits the input in blocks of lines and streams the results back in order.
+#Regular files are split in byte ranges aligned to line ends (as "parallel --pipepart" does), and every worker
+#reads its own ranges. Standard input is read by the driver in blocks and sent to the workers.
+#Processors have a process(lines, output) method, called once per block, and a finish(output) method, called
+#once per worker at the end (i.e. to write the partials of readcorpus.py --emit-partials).
+#Processors with a true "binary" attribute get the lines as bytes instead of text (readcorpus.py --binary).
+#Compressed files (.zst/.zstd, .gz, .xz) are decompressed here, in a separate thread, and sent to the workers as
+#standard input is. The blocks read from a stream are read ahead while the workers process the previous ones.
+#Parquet files are split in row groups, and every worker reads its own, in batches of rows and only the columns
+#its processor needs (a "columns" attribute). Processors that read Parquet have a process_records(records, output)
+#method, called with every batch of rows (as dicts) instead of lines.
+
+TASKS = {
+    #task: (module, processor class, positional arguments of the task script, besides input and output)
+    "readcorpus": ("readcorpus", "CorpusReader", 2),
+    "readcorpus_mono": ("readcorpus_mono", "MonoCorpusReader", 1),
+    "readdocuments": ("readdocuments", "DocumentReader", 1),
+    "fastspell": ("fastspell_langs", "LangTagger", 1),
+}
+
+FINISHED = -1
+FAILED = -2
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('jobs', type=int, help="Number of workers")
+    parser.add_argument('input', type=str, help="Input file (plain, compressed with zstd, gzip or xz, or Parquet), or - to read from standard input")
+    parser.add_argument('output', type=argparse.FileType('wt'), help="Output file, or - to write to standard output")
+    parser.add_argument('task', type=str, choices=TASKS.keys(), help="Task to run")
+    parser.add_argument('taskargs', nargs=argparse.REMAINDER, help="Task arguments, as in the task script, without input and output (i.e. 'en fr --emit-partials')")
+
+    # Optionals (must go before the positional arguments)
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--block-size', type=int, default=1024*1024, help="Approximate size in bytes of the blocks sent to workers")
+    groupO.add_argument('--batch-rows', type=int, default=1024, help="Rows read at a time from the row groups of Parquet files")
+
+    # Logging group
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def file_blocks(path, block_size):
+    #(offset, length) ranges that end right after a newline (or at EOF)
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as inputfile, mmap.mmap(inputfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            newline = -1
+            if start + block_size < size:
+                newline = mm.find(b"\n", start + block_size - 1)
+            end = size if newline == -1 else newline + 1
+            yield (start, end - start)
+            start = end
+
+def stream_blocks(stream, block_size):
+    #Blocks of whole lines read from a stream
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        if not block.endswith(b"\n"):
+            block += stream.readline()
+        yield block
+
+def open_compressed(path):
+    #Decompressed stream (bytes) of a compressed file, or None if it is not compressed
+    if path.endswith(".zst") or path.endswith(".zstd"):
+        try:
+            import zstandard
+        except ImportError:
+            logging.warning("zstandard not installed, decompressing with zstd")
+            return subprocess.Popen(["zstd", "-dc", path], stdout=subprocess.PIPE, bufsize=1024*1024).stdout
+        #Same limits as the zstd command line tool (--long=31), and concatenated frames (i.e. HPLT shards) read as one stream
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2**31)
+        return io.BufferedReader(decompressor.stream_reader(open(path, "rb"), read_size=1024*1024, read_across_frames=True), buffer_size=1024*1024)
+    elif path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    elif path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    return None
+
+def parquet_blocks(path):
+    #Indexes of the row groups of a Parquet file
+    import pyarrow.parquet
+    for index in range(pyarrow.parquet.ParquetFile(path).num_row_groups):
+        yield index
+
+def parquet_records(parquetfile, row_group, columns, batch_rows):
+    #Batches of rows (as dicts) of a row group, with only the columns that are in the file
+    names = set(parquetfile.schema_arrow.names)
+    columns = [column for column in columns if column in names]
+    for batch in parquetfile.iter_batches(batch_size=batch_rows, row_groups=[row_group], columns=columns):
+        yield batch.to_pylist()
+
+def read_ahead(blocks, max_blocks):
+    #Same blocks, produced by a separate thread (reading and decompressing release the GIL), at most max_blocks ahead
+    pending = queue.Queue(max_blocks)
+    def produce():
+        try:
+            for block in blocks:
+                pending.put(block)
+            pending.put(None)
+        except Exception as ex:
+            pending.put(ex)
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        block = pending.get()
+        if block == None:
+            break
+        if isinstance(block, Exception):
+            raise block
+        yield block
+
+def worker(task, taskargs, path, tasks, results, batch_rows):
+    try:
+        modulename, classname, positional = TASKS[task]
+        module = importlib.import_module(modulename)
+        taskargs = ["-"] + taskargs[:positional] + ["-"] + taskargs[positional:]
+        processor = getattr(module, classname)(module.initialization(taskargs))
+        binary = getattr(processor, "binary", False)
+        parquetfile = None
+        inputfile = None
+        if path.endswith(".parquet"):
+            import pyarrow.parquet
+            if not hasattr(processor, "process_records"):
+                raise Exception(task + " does not read Parquet files")
+            parquetfile = pyarrow.parquet.ParquetFile(path)
+        elif path != "-":
+            inputfile = open(path, "rb")
+
+        while True:
+            item = tasks.get()
+            if item == None:
+                break
+            index, block = item
+            output = io.StringIO()
+            if parquetfile != None:
+                for records in parquet_records(parquetfile, block, processor.columns, batch_rows):
+                    processor.process_records(records, output)
+                results.put((index, output.getvalue()))
+                continue
+            if inputfile != None:
+                offset, length = block
+                inputfile.seek(offset)
+                block = inputfile.read(length)
+            if binary:
+                lines = io.BytesIO(block)
+            else:
+                #Same decoding as the scripts' input files
+                lines = io.TextIOWrapper(io.BytesIO(block), encoding="utf-8", errors="replace")
+            processor.process(lines, output)
+            results.put((index, output.getvalue()))
+
+        output = io.StringIO()
+        processor.finish(output)
+        results.put((FINISHED, output.getvalue()))
+        if inputfile != None:
+            inputfile.close()
+        if parquetfile != None:
+            parquetfile.close()
+    except Exception as ex:
+        results.put((FAILED, traceback.format_exc()))
+
+def get_result(results, workers):
+    #Don't wait forever for a worker that was killed (i.e. segfault in a native library)
+    while True:
+        try:
+            index, text = results.get(timeout=5)
+        except queue.Empty:
+            for w in workers:
+                if w.exitcode not in [None, 0]:
+                    raise Exception(w.name + " died with exit code " + str(w.exitcode))
+            continue
+        if index == FAILED:
+            raise Exception("Worker failed:\n" + text)
+        return index, text
+
+def main():
+    args = initialization()
+    logging.info("Starting " + str(args.jobs) + " workers for " + args.task)
+
+    path = args.input
+    if args.input == "-":
+        blocks = read_ahead(stream_blocks(sys.stdin.buffer, args.block_size), args.jobs * 2)
+    else:
+        stream = open_compressed(args.input)
+        if args.input.endswith(".parquet"):
+            blocks = parquet_blocks(args.input)
+        elif stream != None:
+            #Workers get the blocks, not the path
+            path = "-"
+            blocks = read_ahead(stream_blocks(stream, args.block_size), args.jobs * 2)
+        else:
+            blocks = file_blocks(args.input, args.block_size)
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    workers = []
+    for i in range(args.jobs):
+        w = multiprocessing.Process(target=worker, args=(args.task, args.taskargs, path, tasks, results, args.batch_rows), name="worker-"+str(i))
+        w.start()
+        workers.append(w)
+
+    try:
+        #Results are written in input order. At most max_in_flight blocks are being processed
+        #or waiting to be written, so memory does not depend on the input size
+        max_in_flight = args.jobs * 2
+        in_flight = 0
+        next_index = 0
+        ready = {}
+        for index, block in enumerate(blocks):
+            tasks.put((index, block))
+            in_flight += 1
+            while in_flight >= max_in_flight or (in_flight > 0 and next_index in ready):
+                if next_index not in ready:
+                    result_index, text = get_result(results, workers)
+                    ready[result_index] = text
+                while next_index in ready:
+                    args.output.write(ready.pop(next_index))
+                    next_index += 1
+                    in_flight -= 1
+        while in_flight > 0:
+            result_index, text = get_result(results, workers)
+            ready[result_index] = text
+            while next_index in ready:
+                args.output.write(ready.pop(next_index))
+                next_index += 1
+                in_flight -= 1
+        logging.debug(str(next_index) + " blocks processed")
+
+        for w in workers:
+            tasks.put(None)
+        for w in workers:
+            result_index, text = get_result(results, workers)
+            args.output.write(text)
+        for w in workers:
+            w.join()
+    except Exception:
+        for w in workers:
+            w.terminate()
+        #Blocks still waiting to be sent to the (dead) workers would not let the driver exit
+        tasks.cancel_join_thread()
+        raise
+    args.output.close()
+
+if __name__ == '__main__':
+    try:
+        main()  # Running main program
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -0,0 +1,151 @@
+import os
+import logging
+from array import array
+from xxhash import xxh64_intdigest
+
+#Near-duplicate documents, as MinHash signatures of their word shingles banded into LSH keys.
+#Signatures are computed with one permutation hashing (Li et al., 2012): every distinct shingle is hashed once,
+#the hash chooses one of the bins of the signature and the rest of it is the value kept if it is the minimum of
+#the bin. Empty bins (short documents) take the value of the next non-empty bin, shifted by the distance to it
+#(rotation densification, Shrivastava and Li, 2014), so that signatures of any length estimate Jaccard similarity.
+#Signatures are cut in bands of rows: documents with the same values in a band are candidates to be near-duplicates,
+#with a probability of 1-(1-s^rows)^bands for a Jaccard similarity s (about 0.7 is where it grows fastest for
+#16 bands of 8 rows). Candidates are not checked, so the estimate is an upper bound.
+#The key of every band of every document (with the document number) is written to disk, hash-partitioned, so memory
+#does not depend on the number of documents. Indexes are merged across workers (and shards) by listing their files,
+#and documents sharing a key are clustered one partition at a time, with a union-find over all the documents.
+
+class MinHasher:
+
+    def __init__(self, bands=16, rows=8, shingle_size=5):
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = bands * rows
+        self.shingle_size = shingle_size
+        self.shift = (1 << 64) // self.num_perm   #values in a bin are below this
+
+    def signature(self, words):
+        #[num_perm values] of a list of words, or None if there are no words
+        if len(words) == 0:
+            return None
+        num_perm = self.num_perm
+        size = self.shingle_size
+        shingles = set(" ".join(words[i:i+size]) for i in range(max(1, len(words)-size+1)))
+        bins = [None] * num_perm
+        for shingle in shingles:
+            hashvalue = xxh64_intdigest(shingle)
+            index = hashvalue % num_perm
+            value = hashvalue // num_perm
+            if bins[index] == None or value < bins[index]:
+                bins[index] = value
+        if None in bins:
+            #Densification, from the bins that were not empty
+            filled = bins
+            bins = list(filled)
+            for index in range(num_perm):
+                if filled[index] == None:
+                    distance = 1
+                    while filled[(index + distance) % num_perm] == None:
+                        distance += 1
+                    bins[index] = filled[(index + distance) % num_perm] + distance * self.shift
+        return bins
+
+    def band_keys(self, signature):
+        rows = self.rows
+        return [xxh64_intdigest(array("Q", signature[band*rows:(band+1)*rows]).tobytes(), band) for band in range(self.bands)]
+
+
+class LSHIndex:
+
+    def __init__(self, spill_dir, prefix, partitions=256, buffer_size=1000000):
+        self.spill_dir = spill_dir
+        self.prefix = prefix
+        self.partitions = partitions
+        self.buffer_size = buffer_size
+        self.docs = 0
+        self.pending = [array("Q") for p in range(partitions)]    #interleaved band key, document
+        self.pending_size = 0
+        self.buckets = []   #[partition, path, number of the first document]
+
+    def add(self, keys):
+        #Band keys of the next document (none if it has no signature: it is not near-duplicate of anything)
+        doc = self.docs
+        self.docs += 1
+        for key in keys:
+            bucket = self.pending[key % self.partitions]
+            bucket.append(key)
+            bucket.append(doc)
+        self.pending_size += len(keys)
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def path(self, partition):
+        return os.path.join(self.spill_dir, self.prefix + ".lsh." + str(partition))
+
+    def flush(self):
+        #Every partition is appended to its own file
+        for partition, bucket in enumerate(self.pending):
+            if len(bucket) == 0:
+                continue
+            with open(self.path(partition), "ab") as bucketfile:
+                bucket.tofile(bucketfile)
+        self.pending = [array("Q") for p in range(self.partitions)]
+        self.pending_size = 0
+
+    def close(self):
+        self.flush()
+        self.buckets = [[partition, os.path.abspath(self.path(partition)), 0] for partition in range(self.partitions) if os.path.exists(self.path(partition))]
+
+    def merge(self, other):
+        #Documents of the other index are numbered after the ones of this one
+        assert self.partitions == other.partitions, "Cannot merge LSH indexes with different partitions"
+        self.buckets.extend([partition, path, first + self.docs] for partition, path, first in other.buckets)
+        self.docs += other.docs
+
+    def clusters(self):
+        #{cluster size: clusters}, documents without near-duplicates being clusters of size 1
+        parents = array("q", range(self.docs))
+
+        def find(doc):
+            while parents[doc] != doc:
+                parents[doc] = parents[parents[doc]]
+                doc = parents[doc]
+            return doc
+
+        paths = {}
+        for partition, path, first in self.buckets:
+            paths.setdefault(partition, []).append((path, first))
+        #Only one partition at a time is loaded in memory
+        for partition in sorted(paths.keys()):
+            firsts = {}     #band key -> first document with it
+            for path, first in paths[partition]:
+                bucket = array("Q")
+                with open(path, "rb") as bucketfile:
+                    bucket.fromfile(bucketfile, os.path.getsize(path) // bucket.itemsize)
+                for i in range(0, len(bucket), 2):
+                    doc = bucket[i+1] + first
+                    other = firsts.setdefault(bucket[i], doc)
+                    if other != doc:
+                        root, other_root = find(doc), find(other)
+                        if root != other_root:
+                            parents[max(root, other_root)] = min(root, other_root)
+            logging.debug("Clustered LSH partition " + str(partition))
+
+        sizes = array("q", bytes(8 * self.docs))  #documents in the cluster of every root
+        for doc in range(self.docs):
+            sizes[find(doc)] += 1
+        clusters = {}
+        for size in sizes:
+            if size > 0:
+                clusters[size] = clusters.get(size, 0) + 1
+        return clusters
+
+    def to_dict(self):
+        return {"docs": self.docs, "partitions": self.partitions, "buckets": self.buckets}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(None, None, data["partitions"])
+        index.docs = data["docs"]
+        index.buckets = data["buckets"]
+        return index
@@ -0,0 +1,150 @@
+import os
+import heapq
+import logging
+import tempfile
+from collections import Counter
+from multiprocessing import Pool
+from xxhash import xxh64
+
+#Exact ngram counting with bounded memory.
+#Counts are kept in memory until max_entries distinct ngrams are reached. Then they are hash-partitioned
+#and written to disk as sorted runs ("ngram\tcount" lines), so that every ngram always lands in the same
+#partition, no matter the worker. Merging the runs of a partition is a k-way merge of sorted files, and
+#the top-N of each (side, order) is the top-N of the per-partition top-Ns.
+
+class NgramCounter:
+
+    def __init__(self, spill_dir=None, max_entries=2000000, partitions=16):
+        self.spill_dir = spill_dir
+        self.max_entries = max_entries
+        self.partitions = partitions
+        self.counts = {}  #(side, order) -> Counter
+        self.runs = []    #[side, order, partition, path]
+        self.workdir = None
+        self.spills = 0
+
+    def update(self, side, order, ngrams, weight=1):
+        #weight: times the ngrams are counted (i.e. the multiplicity of a collapsed duplicate segment)
+        counter = self.counts.get((side, order))
+        if counter == None:
+            counter = Counter()
+            self.counts[(side, order)] = counter
+        if weight == 1:
+            counter.update(ngrams)
+        else:
+            for ngram in ngrams:
+                counter[ngram] += weight
+
+        if self.spill_dir != None and self.entries() >= self.max_entries:
+            self.spill()
+
+    def entries(self):
+        return sum(len(c) for c in self.counts.values())
+
+    def spill(self):
+        if self.workdir == None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.workdir = tempfile.mkdtemp(prefix="ngrams.", dir=self.spill_dir)
+        logging.debug("Spilling " + str(self.entries()) + " ngrams to " + self.workdir)
+        for (side, order), counter in self.counts.items():
+            buckets = [[] for p in range(self.partitions)]
+            for ngram, count in counter.items():
+                buckets[xxh64(ngram.encode("utf-8")).intdigest() % self.partitions].append((ngram, count))
+            for partition, bucket in enumerate(buckets):
+                if len(bucket) == 0:
+                    continue
+                bucket.sort()
+                path = os.path.join(self.workdir, "{}.{}.{}.{}".format(side, order, partition, self.spills))
+                with open(path, "w") as runfile:
+                    for ngram, count in bucket:
+                        runfile.write(ngram + "\t" + str(count) + "\n")
+                self.runs.append([side, order, partition, path])
+        self.counts = {}
+        self.spills += 1
+
+    def close(self):
+        #Leave everything on disk, so partials stay small
+        if self.spill_dir != None and self.entries() > 0:
+            self.spill()
+
+    def merge(self, other):
+        for (side, order), counter in other.counts.items():
+            self.counts.setdefault((side, order), Counter()).update(counter)
+        self.runs.extend(other.runs)
+
+    def to_dict(self):
+        counts = {}
+        for (side, order), counter in self.counts.items():
+            counts.setdefault(side, {})[str(order)] = dict(counter)
+        return {"partitions": self.partitions, "counts": counts, "runs": self.runs}
+
+    @classmethod
+    def from_dict(cls, data):
+        counter = cls(partitions=data["partitions"])
+        for side, orders in data["counts"].items():
+            for order, counts in orders.items():
+                counter.counts[(side, int(order))] = Counter(counts)
+        counter.runs = data["runs"]
+        return counter
+
+    def top(self, n, jobs=1):
+        #Exact top-n ngrams for each (side, order): {(side, order): [(ngram, count), ...]}, most common first
+        tasks = {}
+        for side, order, partition, path in self.runs:
+            tasks.setdefault((side, order, partition), [[], []])[0].append(path)
+        #Ngrams still in memory are merged within the partition they would have been spilled to
+        for (side, order), counter in self.counts.items():
+            for ngram, count in counter.items():
+                partition = xxh64(ngram.encode("utf-8")).intdigest() % self.partitions
+                tasks.setdefault((side, order, partition), [[], []])[1].append((ngram, count))
+
+        keys = list(tasks.keys())
+        args = [(tasks[k][0], sorted(tasks[k][1]), n) for k in keys]
+        if jobs > 1 and len(args) > 1:
+            with Pool(jobs) as pool:
+                partition_tops = pool.starmap(top_from_runs, args)
+        else:
+            partition_tops = [top_from_runs(*a) for a in args]
+
+        results = {}
+        for (side, order, partition), partition_top in zip(keys, partition_tops):
+            results.setdefault((side, order), []).extend(partition_top)
+        for key in results:
+            results[key] = most_common(results[key], n)
+        return results
+
+
+def read_run(path):
+    with open(path, "r") as runfile:
+        for line in runfile:
+            ngram, count = line.rstrip("\n").rsplit("\t", 1)
+            yield ngram, int(count)
+
+def ngram_sort_key(item):
+    #Same order as "sort | uniq -c | sort -nr": ties are broken by the ngram, in reverse byte order
+    return (item[1], item[0].encode("utf-8"))
+
+def most_common(items, n):
+    return heapq.nlargest(n, items, key=ngram_sort_key)
+
+def top_from_runs(paths, in_memory, n):
+    heap = []
+    current = None
+    current_count = 0
+    for ngram, count in heapq.merge(in_memory, *[read_run(p) for p in paths]):
+        if ngram == current:
+            current_count += count
+            continue
+        if current != None:
+            push_bounded(heap, (current_count, current.encode("utf-8"), current), n)
+        current = ngram
+        current_count = count
+    if current != None:
+        push_bounded(heap, (current_count, current.encode("utf-8"), current), n)
+    return [(ngram, count) for count, key, ngram in heap]
+
+def push_bounded(heap, item, n):
+    if len(heap) < n:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
@@ -1,18 +1,13 @@
 import os
 import logging
 
-import stopwords as astuana_stopwords
 from nltk import ngrams
-from nltk.corpus import stopwords as nltk_stopwords
-from stopwordsiso import stopwords as iso_stopwords
 from collections import Counter
-from klpt.preprocess import Preprocess as KurdishPreprocess
-from laonlp.corpus.lao_words import lao_stopwords
-from openodia.common.constants import STOPWORDS as odia_stopwords
-from etnltk.lang.am import STOP_WORDS as amharic_stopwords
-from etnltk.lang.tg import STOP_WORDS as tigrinya_stopwords
 
-import pycantonese
+#Stopword libraries are imported in get_stopwords, only for the languages that need them,
+#and only when the stopwords are not in the precompiled pack (see stopwordpack.py)
+
+STOPWORDS_PACK = None
 
 NLTK_STOPWORDS_LANGS =  {"ar": "arabic",
                         "az": "azerbaijani",                        
@@ -175,7 +170,7 @@ def fix_stopwords(stopwords, lang):
     elif lang == "mi":
         stopwords.extend(["te", "o", "ki", "me", "nga"])
     elif lang == "mk":
-        stpowords.extend(["овие"])
+        stopwords.extend(["овие"])
     elif lang == "ml":
         stopwords.extend(["ഞാന്", "ചെയ്യുക"])
     elif lang == "mr":
@@ -232,18 +227,35 @@ def fix_stopwords(stopwords, lang):
         stopwords.extend(["noma", "lokhu"])
     return stopwords
 
-def get_stopwords(lang):
+def get_packed_stopwords(lang):
+    global STOPWORDS_PACK
+    if STOPWORDS_PACK == None:
+        from stopwordpack import StopwordPack, DEFAULT_PATH
+        if not os.path.exists(DEFAULT_PATH):
+            return None
+        STOPWORDS_PACK = StopwordPack(DEFAULT_PATH)
+    return STOPWORDS_PACK.get(lang)
+
+def get_stopwords(lang, use_pack=True):
+    if use_pack:
+        stop_words = get_packed_stopwords(lang)
+        if stop_words != None:
+            logging.info("Stopwords from pack")
+            return stop_words, []
+
     # Language-agnostic strategy for stopwords, can be improved
     stop_words = []
     warnings = []    
     if lang in NLTK_STOPWORDS_LANGS.keys():        
         logging.info("Stopwords from NLTK")
+        from nltk.corpus import stopwords as nltk_stopwords
         langname = NLTK_STOPWORDS_LANGS.get(lang)
         stop_words = nltk_stopwords.words(langname)        
         stop_words = fix_stopwords(stop_words, lang)
     
     elif lang in NLTK_STOPWORDS_MAPS.keys():
         logging.info("Stopwords from NLTK - mapped")
+        from nltk.corpus import stopwords as nltk_stopwords
         mapped = NLTK_STOPWORDS_MAPS.get(lang)
         langname = NLTK_STOPWORDS_LANGS.get(mapped)
         stop_words = nltk_stopwords.words(langname)
@@ -251,22 +263,26 @@ def get_stopwords(lang):
                 
     elif lang in ASTUANA_STOPWORDS_LANGS:
         logging.info("Stopwords from Astuana")
+        import stopwords as astuana_stopwords
         stop_words = astuana_stopwords.get_stopwords(lang)
         stop_words = fix_stopwords(stop_words, lang)
     
     elif lang in ASTUANA_STOPWORDS_MAPS.keys():
         logging.info("Stopwords from Astuana - mapped")
+        import stopwords as astuana_stopwords
         mapped = ASTUANA_STOPWORDS_MAPS.get(lang)
         stop_words = astuana_stopwords.get_stopwords(mapped)
         stop_words = fix_stopwords(stop_words, lang)
         
     elif lang in ISO_STOPWORDS_LANGS:
         logging.info("Stopwords from ISO")
+        from stopwordsiso import stopwords as iso_stopwords
         stop_words = list(iso_stopwords(lang))
         stop_words = fix_stopwords(stop_words, lang)
     
     elif lang in ISO_STOPWORDS_MAPS.keys():
         logging.info("Stopwords from ISO - mapped")
+        from stopwordsiso import stopwords as iso_stopwords
         mapped = ISO_STOPWORDS_MAPS.get(lang)
         stop_words = list(iso_stopwords(mapped))
         stop_words = fix_stopwords(stop_words, lang)
@@ -289,6 +305,7 @@ def get_stopwords(lang):
         
     elif lang in KLPT_STOPWORDS_LANGS:
         logging.info("Stopwords from KLPT")
+        from klpt.preprocess import Preprocess as KurdishPreprocess
         if lang == "kmr":
             kp = KurdishPreprocess("Kurmanji", "Latin")
         elif lang == "ckb":
@@ -298,23 +315,28 @@ def get_stopwords(lang):
     
     elif lang in CANTONESE_LANGS:
         logging.info("Stopwords from pycantonese")
+        import pycantonese
         stopwords = list(pycantonese.stop_words())
         stop_words = fix_stopwords(stopwords, lang)    
     
     elif lang in LAONLP_LANGS:
         logging.info("Stopwords from LaoNLP")
+        from laonlp.corpus.lao_words import lao_stopwords
         stopwords = list(lao_stopwords())
         stop_words = fix_stopwords(stopwords, lang)
         
     elif lang in OPENODIA_LANGS:
         logging.info("Stopwords from OpenOdia")
+        from openodia.common.constants import STOPWORDS as odia_stopwords
         stopwords = odia_stopwords
         stop_words = fix_stopwords(stopwords, lang)
     
     elif lang in ETHIOPIC_LANGS:
         if lang == "am" or lang == "amh":
+            from etnltk.lang.am import STOP_WORDS as amharic_stopwords
             stopwords = amharic_stopwords
         elif lang == "ti" or lang == "tir":
+            from etnltk.lang.tg import STOP_WORDS as tigrinya_stopwords
             stopwords = tigrinya_stopwords
         stop_words = fix_stopwords(stopwords, lang)
 
@@ -333,7 +355,8 @@ def get_stopwords(lang):
         warnings = ["ngrams_" + lang + "_freq"]        
         '''
     logging.info("Stopwords: " + str(stop_words))
-    return list(set(stop_words)), warnings
+    #frozenset: stopwords are looked up for every token of every ngram candidate
+    return frozenset(stop_words), warnings
 
 def get_line_ngrams(lang, tokenized_line, max_order, stop_words):
     warnings = []
@@ -357,6 +380,54 @@ def get_line_ngrams(lang, tokenized_line, max_order, stop_words):
     return candidates, warnings
     
 
+def get_line_ngrams_fast(tokenized_line, max_order, stop_words):
+    #Same ngrams as get_line_ngrams (given the stopwords), already joined: [onegrams, twograms, ...]
+    #Every token is classified only once (alphabetic, stopword), and all the orders come out of a single
+    #pass in which every token is the last one of the ngrams ending there.
+    results = [[] for order in range(max_order)]
+    tokens = [token.lower() for token in tokenized_line]
+    is_stopword = [token in stop_words for token in tokens]
+    run = 0 #tokens with some alphabetic character in a row, ending at the current one
+    for last, token in enumerate(tokens):
+        if not (token.isalpha() or any(c.isalpha() for c in token)):
+            run = 0
+            continue
+        run += 1
+        #First and last tokens cannot be stopwords (so there is always a token that is not a stopword)
+        if is_stopword[last]:
+            continue
+        ngram = token
+        results[0].append(ngram)
+        for order in range(2, min(run, max_order)+1):
+            first = last - order + 1
+            ngram = tokens[first] + " " + ngram
+            if not is_stopword[first]:
+                results[order-1].append(ngram)
+    return results
+
+
+def get_segments_ngrams(lang, segments, tokenizer, stop_words, max_order=5, segcache=None, hashes=None):
+    #Token count and ngrams (as strings, for every order from 1 to max_order) of a chunk of segments: [(tokcount, [onegrams, twograms, ...]), ...]
+    #The chunk is tokenized at once (tokenize_batch), skipping the segments found in the segment cache (by hash)
+    results = [None] * len(segments)
+    if segcache != None:
+        missing = []
+        for i, seghash in enumerate(hashes):
+            results[i] = segcache.get(lang, tokenizer.toktype, seghash)
+            if results[i] == None:
+                missing.append(i)
+    else:
+        missing = range(len(segments))
+
+    tokenized = tokenizer.tokenize_batch([segments[i] for i in missing])
+    for i, tokens in zip(missing, tokenized):
+        ngrams_lists = get_line_ngrams_fast(tokens, max_order, stop_words)
+        results[i] = (len(tokens), ngrams_lists)
+        if segcache != None:
+            segcache.put(lang, tokenizer.toktype, hashes[i], len(tokens), ngrams_lists)
+    return results
+    
+
 def get_ngrams(lang, tokenized_sentences, max_order):
     stop_words, warnings = get_stopwords(lang)
     
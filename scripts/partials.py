@@ -0,0 +1,201 @@
+import json
+from ngramcounter import NgramCounter
+from cardinality import DistinctCounter
+from heavyhitters import SpaceSaving
+from minhash import LSHIndex
+
+#Running totals kept in-process by a readcorpus worker (--emit-partials).
+#Each worker dumps its partial as a single JSON line at EOF, and reduce/merge_partials.py combines them.
+
+VOLUME_FIELDS = ["tokens", "bytes", "chars", "pii"]
+
+class CorpusPartial:
+
+    def __init__(self, sides, max_order=5, spill_dir=None, ngrams_buffer=2000000, cardinality="exact", hll_precision=12):
+        self.sides = sides  #["src", "trg"] for parallel corpora, ["src"] for mono
+        self.max_order = max_order
+        self.segments = 0
+        self.volumes = {}
+        self.tokcounts = {}
+        self.pii_types = {}
+        self.lang_sides = []    #breakdown of the sides by language, i.e. "src:en" (see add_lang)
+        for side in sides:
+            self.init_side(side)
+        #Distinct segment hashes per side, keyed by token count, and distinct pair hashes (key 0, parallel only)
+        self.distinct = DistinctCounter(cardinality, spill_dir, hll_precision)
+        self.ngrams = NgramCounter(spill_dir, ngrams_buffer)
+
+    def init_side(self, side):
+        self.volumes[side] = dict.fromkeys(VOLUME_FIELDS, 0)
+        self.tokcounts[side] = {}   #tokcount -> segments
+        self.pii_types[side] = {}   #PII type -> matches
+
+    def add_lang(self, side, lang):
+        #Side for the segments of a side in a language (readcorpus_mono.py --lang-column), counted as any other side
+        #(volumes, token counts, distinct hashes and ngrams) besides being counted in their side
+        lang_side = side + ":" + lang
+        if lang_side not in self.volumes:
+            self.lang_sides.append(lang_side)
+            self.init_side(lang_side)
+        return lang_side
+
+    def add_segment(self, side, tokcount, nbytes, nchars, pii, seghash, ngrams_dict, pii_counts=None, weight=1):
+        #seghash is the xxh64 of the segment, as an integer. pii_counts: {PII type: matches in the segment}
+        #weight: times the segment is in the corpus (readcorpus.py --weighted), everything but distinct counts is multiplied by it
+        volumes = self.volumes[side]
+        volumes["tokens"] += tokcount * weight
+        volumes["bytes"] += nbytes * weight
+        volumes["chars"] += nchars * weight
+        volumes["pii"] += pii * weight
+
+        self.tokcounts[side][tokcount] = self.tokcounts[side].get(tokcount, 0) + weight
+        if pii_counts:
+            pii_types = self.pii_types[side]
+            for piitype, matches in pii_counts.items():
+                pii_types[piitype] = pii_types.get(piitype, 0) + matches * weight
+        self.distinct.add(side, tokcount, seghash)
+
+        for order in range(1, self.max_order+1):
+            self.ngrams.update(side, order, ngrams_dict.get(order, []), weight)
+
+    def add_unit(self, unithash=None, weight=1):
+        #One sentence pair (pair hash as an integer), or one sentence in mono (no hash needed), weight times
+        self.segments += weight
+        if unithash != None:
+            self.distinct.add("pair", 0, unithash)
+
+    def merge(self, other):
+        self.segments += other.segments
+        for lang_side in other.lang_sides:
+            if lang_side not in self.volumes:
+                self.lang_sides.append(lang_side)
+                self.init_side(lang_side)
+        for side in self.sides + other.lang_sides:
+            for field in VOLUME_FIELDS:
+                self.volumes[side][field] += other.volumes[side][field]
+            for tokcount, count in other.tokcounts[side].items():
+                self.tokcounts[side][tokcount] = self.tokcounts[side].get(tokcount, 0) + count
+            for piitype, matches in other.pii_types[side].items():
+                self.pii_types[side][piitype] = self.pii_types[side].get(piitype, 0) + matches
+        self.distinct.merge(other.distinct)
+        self.ngrams.merge(other.ngrams)
+
+    def close(self):
+        #Called by the worker at EOF, before writing the partial
+        self.distinct.close()
+        self.ngrams.close()
+
+    def to_json(self):
+        partial = {"sides": self.sides, "max_order": self.max_order, "segments": self.segments,
+                   "volumes": self.volumes, "tokcounts": {}, "pii_types": self.pii_types, "distinct": self.distinct.to_dict(), "ngrams": self.ngrams.to_dict(), "lang_sides": self.lang_sides}
+        for side in self.sides + self.lang_sides:
+            partial["tokcounts"][side] = {str(k): v for k, v in self.tokcounts[side].items()}
+        return json.dumps(partial, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        partial = cls(data["sides"], data["max_order"])
+        partial.segments = data["segments"]
+        partial.lang_sides = data.get("lang_sides", [])
+        for side in partial.sides + partial.lang_sides:
+            partial.volumes[side] = data["volumes"][side]
+            partial.tokcounts[side] = {int(k): v for k, v in data["tokcounts"][side].items()}
+            partial.pii_types[side] = data["pii_types"][side]
+        partial.distinct = DistinctCounter.from_dict(data["distinct"])
+        partial.ngrams = NgramCounter.from_dict(data["ngrams"])
+        return partial
+
+
+class DocumentPartial:
+    #Document stats kept in-process by a readdocuments worker (--partials-dir), merged by reduce/merge_docpartials.py.
+    #Histograms are keyed by the value as readdocuments.py writes it (i.e. the WDS as a string)
+
+    def __init__(self, capacity=10000, lsh=None, spill_dir=None):
+        self.docs = 0
+        self.segments = 0
+        self.doc_segments = {}  #segments in the document -> documents
+        self.wds = {}           #WDS -> documents
+        self.lang_ratios = {}   #ratio of segments in the document language -> documents
+        self.collections = {}   #collection -> documents
+        self.register_labels = {}   #register label -> documents (from the documents, see readdocuments.py --register-labels)
+        self.reused = {}        #annotation of the documents used instead of computing it (see capabilities.py) -> documents
+        self.domains = SpaceSaving(capacity)
+        self.tlds = SpaceSaving(capacity)
+        self.lsh = lsh          #LSH keys of the MinHash signatures of the documents (readdocuments.py --minhash), or None
+        #Distinct document hashes (key 0), hash-partitioned on disk. The most repeated ones are counted from the keys
+        #files written along the partials (see reduce/merge_docpartials.py)
+        self.distinct = DistinctCounter("exact", spill_dir)
+
+    def add_document(self, doclength, wds, lang_ratio, collection, domain, tld):
+        self.docs += 1
+        self.segments += doclength
+        self.doc_segments[doclength] = self.doc_segments.get(doclength, 0) + 1
+        self.wds[wds] = self.wds.get(wds, 0) + 1
+        self.lang_ratios[lang_ratio] = self.lang_ratios.get(lang_ratio, 0) + 1
+        self.collections[collection] = self.collections.get(collection, 0) + 1
+        self.domains.add(domain)
+        self.tlds.add(tld)
+
+    def add_hash(self, dochash):
+        #dochash: 64-bit hash of the normalized text of the document
+        self.distinct.add("docs", 0, dochash)
+
+    def add_register_labels(self, labels):
+        for label in labels:
+            self.register_labels[label] = self.register_labels.get(label, 0) + 1
+
+    def add_reused(self, annotation, docs=1):
+        self.reused[annotation] = self.reused.get(annotation, 0) + docs
+
+    def merge(self, other):
+        self.docs += other.docs
+        self.segments += other.segments
+        for histogram, other_histogram in [(self.doc_segments, other.doc_segments), (self.wds, other.wds),
+                                           (self.lang_ratios, other.lang_ratios), (self.collections, other.collections),
+                                           (self.register_labels, other.register_labels), (self.reused, other.reused)]:
+            for key, count in other_histogram.items():
+                histogram[key] = histogram.get(key, 0) + count
+        self.domains.merge(other.domains)
+        self.tlds.merge(other.tlds)
+        self.distinct.merge(other.distinct)
+        if self.lsh == None:
+            self.lsh = other.lsh
+        elif other.lsh != None:
+            self.lsh.merge(other.lsh)
+
+    def close(self):
+        #Called by the worker at EOF, before writing the partial
+        self.distinct.close()
+        if self.lsh != None:
+            self.lsh.close()
+
+    def to_json(self):
+        partial = {"docs": self.docs, "segments": self.segments, "doc_segments": {str(k): v for k, v in self.doc_segments.items()},
+                   "wds": self.wds, "lang_ratios": self.lang_ratios, "collections": self.collections,
+                   "register_labels": self.register_labels, "reused": self.reused,
+                   "domains": self.domains.to_dict(), "tlds": self.tlds.to_dict(),
+                   "distinct": self.distinct.to_dict()}
+        if self.lsh != None:
+            partial["lsh"] = self.lsh.to_dict()
+        return json.dumps(partial, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        partial = cls()
+        partial.docs = data["docs"]
+        partial.segments = data["segments"]
+        partial.doc_segments = {int(k): v for k, v in data["doc_segments"].items()}
+        partial.wds = data["wds"]
+        partial.lang_ratios = data["lang_ratios"]
+        partial.collections = data["collections"]
+        partial.register_labels = data.get("register_labels", {})
+        partial.reused = data.get("reused", {})
+        partial.domains = SpaceSaving.from_dict(data["domains"])
+        partial.tlds = SpaceSaving.from_dict(data["tlds"])
+        if "distinct" in data:
+            partial.distinct = DistinctCounter.from_dict(data["distinct"])
+        if "lsh" in data:
+            partial.lsh = LSHIndex.from_dict(data["lsh"])
+        return partial
@@ -0,0 +1,59 @@
+import re
+
+from iso639 import Lang
+from pii_manager import PiiEnum
+from pii_manager.api import PiiManager
+from pii_manager.lang import COUNTRY_ANY
+
+from util import stdout_to_err
+
+#PII scanning (IP addresses, email addresses, phone numbers) with pii_manager, behind a cheap pre-filter:
+#every pattern in pii_manager for these types needs either an "@" (emails) or at least 4 digits (IP addresses
+#have 4, phone numbers more), so segments with neither are skipped without running pii_manager.
+
+PII_TASKLIST = (PiiEnum.IP_ADDRESS, PiiEnum.EMAIL_ADDRESS, PiiEnum.PHONE_NUMBER)
+PII_TYPES = [pii.name for pii in PII_TASKLIST]
+
+#Same \d (any Unicode decimal digit) as the pii_manager patterns
+PREFILTER = re.compile(r"@|\d\D*\d\D*\d\D*\d")
+
+def get_pii_lang(lang):
+    pii_isolang = Lang(lang.split('_')[0])
+
+    if pii_isolang.pt3 == 'hbs':
+        return 'hbs'
+    elif not pii_isolang.pt1:
+        return 'any'
+    else:
+        return pii_isolang.pt1
+
+
+class PiiScanner:
+
+    def __init__(self, lang):
+        with stdout_to_err():
+            self.pii_proc = PiiManager(get_pii_lang(lang), COUNTRY_ANY, tasks=PII_TASKLIST, mode="extract")
+        self.prefilter = PREFILTER.search
+
+    def has_pii(self, text):
+        #1 if there is at least one match, 0 otherwise
+        if self.prefilter(text) == None:
+            return 0
+        for pii in self.pii_proc(text):
+            return 1
+        return 0
+
+    def count(self, text):
+        #{pii type: matches}, only for the types with matches
+        counts = {}
+        if self.prefilter(text) == None:
+            return counts
+        for pii in self.pii_proc(text):
+            counts[pii.elem.name] = counts.get(pii.elem.name, 0) + 1
+        return counts
+
+    def has_pii_batch(self, texts):
+        return [self.has_pii(text) for text in texts]
+
+    def count_batch(self, texts):
+        return [self.count(text) for text in texts]
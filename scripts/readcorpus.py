@@ -6,19 +6,18 @@ import logging
 import traceback
 import argparse
 import json
+from itertools import islice
 
-from iso639 import Lang
-
-from pii_manager import PiiEnum
-from pii_manager.api import PiiManager
-from pii_manager.lang import COUNTRY_ANY
-
-from util import logging_setup, stdout_to_err, print_in_column
+from util import logging_setup, stdout_to_err, format_in_column, decode_segment, split_weights
 from xxhash import xxh64
-from ngrams import get_line_ngrams, get_stopwords
+from ngrams import get_segments_ngrams, get_stopwords
 from tokenizer  import CustomTokenizer
+from partials import CorpusPartial
+from segcache import SegmentCache
+from piiscan import PiiScanner
+from analysisd import AnalysisClient, RemoteTokenizer, RemotePiiScanner
 
-def initialization():
+def initialization(argv=None):
     #parser = argparse.ArgumentParser()    
     #parser.add_argument('corpus', type=argparse.FileType('rt'), help="Corpus name. Prefix to the source and target bitexts.")
     #parser.add_argument('statsfile', type=str, help="Output YAML stats file.") #TODO: default tmpfile #type=argparse.FileType('w'),    
@@ -28,6 +27,22 @@ def initialization():
     parser.add_argument('srclang', type=str, help="Source language")
     parser.add_argument('trglang', type=str, help="Target language")
     parser.add_argument('output', nargs='?', type=argparse.FileType('wt'), default=sys.stdout, help="Output.")
+
+    # Optionals
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--emit-partials', action='store_true', help="Keep running totals in process and write a single mergeable partial at EOF, instead of one row per segment and ngram.")
+    groupO.add_argument('--spill-dir', type=str, default=None, help="With --emit-partials, directory where ngram counts are spilled as sorted runs, instead of keeping them in the partial.")
+    groupO.add_argument('--ngrams-buffer', type=int, default=2000000, help="Maximum distinct ngrams kept in memory before spilling them to --spill-dir.")
+    groupO.add_argument('--cardinality', type=str, default="exact", choices=["exact", "hll"], help="With --emit-partials, how unique segments are counted: exact (hash-partitioned buckets in --spill-dir) or hll (HyperLogLog estimate, bounded memory).")
+    groupO.add_argument('--hll-precision', type=int, default=12, help="HyperLogLog precision (2^p registers, relative error 1.04/sqrt(2^p)).")
+    groupO.add_argument('--segment-cache', type=str, default=None, help="Persistent cache of token counts and ngrams (SQLite database), keyed by language, tokenizer and segment hash. Shared across runs.")
+    groupO.add_argument('--segment-cache-size', type=int, default=4096, help="Maximum size of the segment cache, in MB. The entries used longest ago are evicted.")
+    groupO.add_argument('--segment-cache-generation', type=int, default=None, help="Generation of the entries used in this run (the same for all its workers, i.e. a timestamp). Entries of the current generation are never evicted. Current time by default.")
+    groupO.add_argument('--batch-size', type=int, default=1000, help="Lines tokenized at once.")
+    groupO.add_argument('--fast-tokenizer', action='store_true', help="Use the memoized Moses tokenizer (same tokens as sacremoses, see fastmoses.py) for the languages tokenized with Moses.")
+    groupO.add_argument('--weighted', action='store_true', help="Every line starts with the times it is in the corpus and a tab (exact duplicates collapsed with sort | uniq -c). Segments are analysed once, and counted as many times as they are repeated.")
+    groupO.add_argument('--analysisd', type=str, default=None, help="Unix socket of a running analysisd.py: tokenizers, stopwords and PII scanners are taken from it instead of being built here.")
+    groupO.add_argument('--binary', action='store_true', help="Read the input as bytes: sizes and hashes are computed on the raw segments, which are only decoded for tokenization and PII.")
     
     # Logging group
     groupL = parser.add_argument_group('Logging')
@@ -36,189 +51,226 @@ def initialization():
     groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
     #groupL.add_argument('-v', '--version', action='version', version="%(prog)s " + __version__, help="show version of this script and exit")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     logging_setup(args)
     return args
 
 
-    
-
-def get_pii_proc(lang):
-    pii_isolang = Lang(lang.split('_')[0])
-
-    if pii_isolang.pt3 == 'hbs':
-        pii_lang = 'hbs'
-    elif not pii_isolang.pt1:
-        pii_lang = 'any'
-    else:
-        pii_lang = pii_isolang.pt1
+class CorpusReader:
+    #Everything that is expensive to build (tokenizers, PII managers, stopwords) is built once,
+    #so that the same reader can process many blocks of lines (see mapdriver.py)
 
-    pii_country = COUNTRY_ANY
-    pii_tasklist = (PiiEnum.IP_ADDRESS, PiiEnum.EMAIL_ADDRESS, PiiEnum.PHONE_NUMBER)
-    with stdout_to_err():
-        pii_proc = PiiManager(pii_lang, pii_country, tasks=pii_tasklist, mode="extract")
-            
-    return pii_proc
-
-
-def main():
-    args = initialization() # Parsing parameters
-    #logging_setup(args)
-    logging.info("Starting process")
-      
-    src_tokenizer = CustomTokenizer(args.srclang)
-    trg_tokenizer = CustomTokenizer(args.trglang)
+    def __init__(self, args):
+        self.args = args
+        self.binary = args.binary   #lines are bytes (see mapdriver.py)
+        self.client = None
+        if args.analysisd != None:
+            #Tokenizers, stopwords and PII scanners kept warm by analysisd.py
+            self.client = AnalysisClient(args.analysisd)
+            self.src_tokenizer = RemoteTokenizer(self.client, args.srclang, fast=args.fast_tokenizer)
+            self.trg_tokenizer = RemoteTokenizer(self.client, args.trglang, fast=args.fast_tokenizer)
+        else:
+            self.src_tokenizer = CustomTokenizer(args.srclang, fast=args.fast_tokenizer)
+            self.trg_tokenizer = CustomTokenizer(args.trglang, fast=args.fast_tokenizer)
 
-    logging.info("Tokenizing " + args.srclang + " with " +src_tokenizer.toktype + " (" + str(src_tokenizer.getWarnings()) +")") 
-    logging.info("Tokenizing " + args.trglang + " with " +trg_tokenizer.toktype + " (" + str(src_tokenizer.getWarnings()) +")") 
+        logging.info("Tokenizing " + args.srclang + " with " +self.src_tokenizer.toktype + " (" + str(self.src_tokenizer.getWarnings()) +")") 
+        logging.info("Tokenizing " + args.trglang + " with " +self.trg_tokenizer.toktype + " (" + str(self.src_tokenizer.getWarnings()) +")") 
     
-    #PII
-    src_pii_proc = get_pii_proc(args.srclang)
-    trg_pii_proc = get_pii_proc(args.trglang)
+        #PII
+        if self.client != None:
+            self.src_pii_scanner = RemotePiiScanner(self.client, args.srclang)
+            self.trg_pii_scanner = RemotePiiScanner(self.client, args.trglang)
+        else:
+            self.src_pii_scanner = PiiScanner(args.srclang)
+            self.trg_pii_scanner = PiiScanner(args.trglang)
     
-    warnings = []
+        warnings = []
     
 
-#    for w in src_tokenizer.getWarnings():
-#        warnings.append("src_"+w)
-#    for w in trg_tokenizer.getWarnings():
-#        warnings.append("trg_"+w)
+    #    for w in src_tokenizer.getWarnings():
+    #        warnings.append("src_"+w)
+    #    for w in trg_tokenizer.getWarnings():
+    #        warnings.append("trg_"+w)
         
         
 
 
            
-    #src_ngrams_warnings = set()    
-    #trg_ngrams_warnings = set()
+        #src_ngrams_warnings = set()    
+        #trg_ngrams_warnings = set()
     
-    src_stopwords, nwarnings = get_stopwords(args.srclang)
-    #for w in nwarnings:
-    #    src_ngrams_warnings.add("src_"+w)
-    trg_stopwords, nwarnings = get_stopwords(args.trglang)
-    #for w in nwarnings:
-    #    trg_ngrams_warnings.add("trg_"+w)
+        if self.client != None:
+            self.src_stopwords = self.src_tokenizer.stopwords
+            self.trg_stopwords = self.trg_tokenizer.stopwords
+        else:
+            self.src_stopwords, nwarnings = get_stopwords(args.srclang)
+            #for w in nwarnings:
+            #    src_ngrams_warnings.add("src_"+w)
+            self.trg_stopwords, nwarnings = get_stopwords(args.trglang)
+        #for w in nwarnings:
+        #    trg_ngrams_warnings.add("trg_"+w)
     
-    #Output format:
-    # srctokcount trgtokcount srcbytes trgbytes  srcchars trgchars srcpii trgpii srchash trghash pairhash
-    # src_onegrams src_twograms src_threegrams src_fourgrams src_fivegrams
-    # trg_onegrams trg_twograms trg_threegrams trg_fourgrams trg_fivegrams    
-    for line in args.input:
-        lineparts = line.split("\t")
-        src = lineparts[0].strip()
-        trg = lineparts[1].strip()
-        srctoks = []
-        trgtoks = []
-        srctokcount =  0
-        trgtokcount = 0
-        srcbytes = 0
-        trgbytes = 0
-        srcchars = 0
-        trgchars = 0
-        srcpii = 0
-        trgpii = 0
-        srchash = ""
-        trghash = ""
-        pairhash = ""
-        src_onegrams = []
-        src_twograms = []
-        src_threegrams = []
-        src_fourgrams =  []
-        src_fivegrams = []
-        trg_onegrams = []
-        trg_twograms = []
-        trg_threegrams = []
-        trg_fourgrams =  []
-        trg_fivegrams = []
-        
+        self.partial = None
+        if args.emit_partials:
+            self.partial = CorpusPartial(["src", "trg"], spill_dir=args.spill_dir, ngrams_buffer=args.ngrams_buffer,
+                                         cardinality=args.cardinality, hll_precision=args.hll_precision)
+
+        self.segcache = None
+        if args.segment_cache != None:
+            self.segcache = SegmentCache(args.segment_cache, args.segment_cache_size*1024*1024, generation=args.segment_cache_generation)
+
+    def process(self, lines, output):
+        #Lines are read in chunks, and every chunk is tokenized at once
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.args.batch_size))
+            if len(chunk) == 0:
+                break
+            self.process_chunk(chunk, output)
+
+    def process_chunk(self, lines, output):
+        args = self.args
+        src_pii_scanner = self.src_pii_scanner
+        trg_pii_scanner = self.trg_pii_scanner
+        partial = self.partial
+
+        #Times each line is in the corpus
+        if args.weighted:
+            weights, lines = split_weights(lines)
+        else:
+            weights = [1] * len(lines)
+
+        #Segments as text (for the tokenizers and PII) and as UTF-8 bytes (for sizes and hashes)
+        srcs = []
+        trgs = []
+        src_raws = []
+        trg_raws = []
+        for line in lines:
+            if self.binary:
+                lineparts = line.split(b"\t")
+                src, src_raw = decode_segment(lineparts[0])
+                trg, trg_raw = decode_segment(lineparts[1])
+            else:
+                lineparts = line.split("\t")
+                src = lineparts[0].strip()
+                trg = lineparts[1].strip()
+                src_raw = src.encode("utf-8")
+                trg_raw = trg.encode("utf-8")
+            srcs.append(src)
+            trgs.append(trg)
+            src_raws.append(src_raw)
+            trg_raws.append(trg_raw)
+
+        #Get hashes in each sentence 
+        src_digests = [xxh64(src_raw) for src_raw in src_raws]
+        trg_digests = [xxh64(trg_raw) for trg_raw in trg_raws]
+
+        #Counting tokens in each sentence, and ngrams (or getting them from the segment cache)
+        src_analyses = get_segments_ngrams(args.srclang, srcs, self.src_tokenizer, self.src_stopwords, 5, self.segcache, [d.intdigest() for d in src_digests])
+        trg_analyses = get_segments_ngrams(args.trglang, trgs, self.trg_tokenizer, self.trg_stopwords, 5, self.segcache, [d.intdigest() for d in trg_digests])
+
         #PII
-        src_pii_matches = src_pii_proc(src)
-        try:
-            next(src_pii_matches)
-            srcpii = 1
-        except StopIteration:
-            pass
+        if args.emit_partials:
+            src_piis = src_pii_scanner.count_batch(srcs)
+            trg_piis = trg_pii_scanner.count_batch(trgs)
+        else:
+            src_piis = src_pii_scanner.has_pii_batch(srcs)
+            trg_piis = trg_pii_scanner.has_pii_batch(trgs)
+
+        #Output of the whole chunk, written at once
+        out = []
+
+        #Output format:
+        # srctokcount trgtokcount srcbytes trgbytes  srcchars trgchars srcpii trgpii srchash trghash pairhash
+        # src_onegrams src_twograms src_threegrams src_fourgrams src_fivegrams
+        # trg_onegrams trg_twograms trg_threegrams trg_fourgrams trg_fivegrams    
+        for i in range(len(srcs)):
+            src = srcs[i]
+            trg = trgs[i]
+            srcdigest = src_digests[i]
+            trgdigest = trg_digests[i]
+        
+            #PII
+            src_pii_counts = None
+            if args.emit_partials:
+                src_pii_counts = src_piis[i]
+                srcpii = 1 if src_pii_counts else 0
+            else:
+                srcpii = src_piis[i]
             
-        trg_pii_matches = trg_pii_proc(trg)
-        try:
-            next(trg_pii_matches)
-            trgpii = 1
-        except StopIteration:
-            pass
+            trg_pii_counts = None
+            if args.emit_partials:
+                trg_pii_counts = trg_piis[i]
+                trgpii = 1 if trg_pii_counts else 0
+            else:
+                trgpii = trg_piis[i]
   
-        #Counting tokens in each sentence
-        srctoks = src_tokenizer.tokenize(src)
-        trgtoks = trg_tokenizer.tokenize(trg)
+            pairdigest = xxh64(src_raws[i] + b"\t" + trg_raws[i])
+            srchash = srcdigest.hexdigest()
+            trghash = trgdigest.hexdigest()
+            pairhash = pairdigest.hexdigest()
 
-        srctokcount = len(srctoks)
-        trgtokcount = len(trgtoks)
+            # Corpus strings
+            srcbytes = len(src_raws[i])
+            trgbytes = len(trg_raws[i])
         
-        #Get hashes in each sentence 
-        srchash = xxh64(src).hexdigest()
-        trghash = xxh64(trg).hexdigest()
-        pairhash = xxh64(src + "\t" + trg).hexdigest()
+            srcchars = len(src)
+            trgchars = len(trg)
 
+            srctokcount, (src_onegrams, src_twograms, src_threegrams, src_fourgrams, src_fivegrams) = src_analyses[i]
+            trgtokcount, (trg_onegrams, trg_twograms, trg_threegrams, trg_fourgrams, trg_fivegrams) = trg_analyses[i]
 
-        # Corpus strings
-        srcbytes = len(src.encode('utf-8'))
-        trgbytes = len(trg.encode('utf-8'))
-        
-        srcchars = len(src)
-        trgchars = len(trg)
+            if args.emit_partials:
+                partial.add_segment("src", srctokcount, srcbytes, srcchars, srcpii, srcdigest.intdigest(), 
+                                    {1: src_onegrams, 2: src_twograms, 3: src_threegrams, 4: src_fourgrams, 5: src_fivegrams}, src_pii_counts, weights[i])
+                partial.add_segment("trg", trgtokcount, trgbytes, trgchars, trgpii, trgdigest.intdigest(), 
+                                    {1: trg_onegrams, 2: trg_twograms, 3: trg_threegrams, 4: trg_fourgrams, 5: trg_fivegrams}, trg_pii_counts, weights[i])
+                partial.add_unit(pairdigest.intdigest(), weights[i])
+                continue
+
+            start = len(out)
+            out.append("\t".join([str(srctokcount), str(trgtokcount), \
+                            str(srcbytes), str(trgbytes), \
+                            str(srcchars), str(trgchars), \
+                            str(srcpii), str(trgpii), \
+                            srchash, trghash, pairhash])+"\n")
+
+            #now, this is the ugliest thing ever, but it's for the sake of the final output format... trust the process
+            out.append(format_in_column(12, src_onegrams))
+            out.append(format_in_column(13, src_twograms))
+            out.append(format_in_column(14, src_threegrams))
+            out.append(format_in_column(15, src_fourgrams))
+            out.append(format_in_column(16, src_fivegrams))
+            out.append(format_in_column(17, trg_onegrams))
+            out.append(format_in_column(18, trg_twograms))
+            out.append(format_in_column(19, trg_threegrams))
+            out.append(format_in_column(20, trg_fourgrams))
+            out.append(format_in_column(21, trg_fivegrams))
+            #Same rows for every repetition of the pair
+            if weights[i] > 1:
+                out.extend(out[start:] * (weights[i] - 1))
+
+        output.write("".join(out))
+
+    def finish(self, output):
+        if self.client != None:
+            self.client.close()
+        if self.segcache != None:
+            self.segcache.close()
+        if self.partial != None:
+            self.partial.close()
+            output.write(self.partial.to_json()+"\n")
+
+
+def main():
+    args = initialization() # Parsing parameters
+    #logging_setup(args)
+    logging.info("Starting process")
+
+    reader = CorpusReader(args)
+    reader.process(args.input.buffer if args.binary else args.input, args.output)
+    reader.finish(args.output)
 
-        
-        
-        #ngrams
-        
-        src_ngrams_dict, nwarning = get_line_ngrams(args.srclang, srctoks, 5, src_stopwords)        
-        trg_ngrams_dict, nwarning = get_line_ngrams(args.trglang, trgtoks, 5, trg_stopwords)        
-
-        for g in src_ngrams_dict.get(1):
-            src_onegrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(2):
-            src_twograms.append(" ".join(g))
-        for g in src_ngrams_dict.get(3):
-            src_threegrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(4): 
-            src_fourgrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(5):
-            src_fivegrams.append(" ".join(g))
-        
-        for g in trg_ngrams_dict.get(1):
-            trg_onegrams.append(" ".join(g))
-        for g in trg_ngrams_dict.get(2):
-            trg_twograms.append(" ".join(g))
-        for g in trg_ngrams_dict.get(3):
-            trg_threegrams.append(" ".join(g))
-        for g in trg_ngrams_dict.get(4): 
-            trg_fourgrams.append(" ".join(g))
-        for g in trg_ngrams_dict.get(5):
-            trg_fivegrams.append(" ".join(g))
-
-        #args.output.write("\t".join([src, trg, " ".join(srctoks), " ".join(trgtoks), str(srctokcount), str(trgtokcount), str(srcbytes), str(trgbytes), str(srcchars), str(trgchars), str(srcpii), str(trgpii), srchash, trghash, pairhash ])+"\n")
-        args.output.write("\t".join([str(srctokcount), str(trgtokcount), \
-                        str(srcbytes), str(trgbytes), \
-                        str(srcchars), str(trgchars), \
-                        str(srcpii), str(trgpii), \
-                        srchash, trghash, pairhash])+"\n")
-
-        #now, this is the ugliest thing ever, but it's for the sake of the final output format... trust the process
-        print_in_column(12, src_onegrams, args.output)
-        print_in_column(13, src_twograms, args.output)
-        print_in_column(14, src_threegrams, args.output)
-        print_in_column(15, src_fourgrams, args.output)
-        print_in_column(16, src_fivegrams, args.output)
-        print_in_column(17, trg_onegrams, args.output)
-        print_in_column(18, trg_twograms, args.output)
-        print_in_column(19, trg_threegrams, args.output)
-        print_in_column(20, trg_fourgrams, args.output)
-        print_in_column(21, trg_fivegrams, args.output)
-        
-        '''    
-        json.dumps(src_twograms), json.dumps(src_threegrams), json.dumps(src_fourgrams), json.dumps(src_fivegrams), \
-                        json.dumps(trg_onegrams), json.dumps(trg_twograms), json.dumps(trg_threegrams), json.dumps(trg_fourgrams), json.dumps(trg_fivegrams) ])+"\n")
-        
-        '''
-        
 if __name__ == '__main__':
     try:
         main()  # Running main program
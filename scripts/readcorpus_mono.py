@@ -6,23 +6,41 @@ import traceback
 import argparse
 import yaml
 import json
-from iso639 import Lang
+from itertools import islice
 
-from pii_manager import PiiEnum
-from pii_manager.api import PiiManager
-from pii_manager.lang import COUNTRY_ANY
-
-from util import logging_setup, stdout_to_err, print_in_column
-from ngrams import get_line_ngrams, get_stopwords
+from util import logging_setup, stdout_to_err, format_in_column, decode_segment, split_weights, split_langs
+from ngrams import get_segments_ngrams, get_stopwords
 from xxhash import xxh64
 from tokenizer import CustomTokenizer
+from partials import CorpusPartial
+from segcache import SegmentCache
+from piiscan import PiiScanner
+from analysisd import AnalysisClient, RemoteTokenizer, RemotePiiScanner, WarmLanguages
 
-def initialization():
+def initialization(argv=None):
     parser = argparse.ArgumentParser()
     
     parser.add_argument('input',  nargs='?', type=argparse.FileType('rt', errors="replace"), default=io.TextIOWrapper(sys.stdin.buffer, errors="replace"),  help="Input TSV file.")
     parser.add_argument('srclang', type=str, help="Source language")
     parser.add_argument('output', nargs='?', type=argparse.FileType('wt'), default=sys.stdout, help="Output.")
+
+    # Optionals
+    groupO = parser.add_argument_group("Optional")
+    groupO.add_argument('--emit-partials', action='store_true', help="Keep running totals in process and write a single mergeable partial at EOF, instead of one row per segment and ngram.")
+    groupO.add_argument('--spill-dir', type=str, default=None, help="With --emit-partials, directory where ngram counts are spilled as sorted runs, instead of keeping them in the partial.")
+    groupO.add_argument('--ngrams-buffer', type=int, default=2000000, help="Maximum distinct ngrams kept in memory before spilling them to --spill-dir.")
+    groupO.add_argument('--cardinality', type=str, default="exact", choices=["exact", "hll"], help="With --emit-partials, how unique segments are counted: exact (hash-partitioned buckets in --spill-dir) or hll (HyperLogLog estimate, bounded memory).")
+    groupO.add_argument('--hll-precision', type=int, default=12, help="HyperLogLog precision (2^p registers, relative error 1.04/sqrt(2^p)).")
+    groupO.add_argument('--segment-cache', type=str, default=None, help="Persistent cache of token counts and ngrams (SQLite database), keyed by language, tokenizer and segment hash. Shared across runs.")
+    groupO.add_argument('--segment-cache-size', type=int, default=4096, help="Maximum size of the segment cache, in MB. The entries used longest ago are evicted.")
+    groupO.add_argument('--segment-cache-generation', type=int, default=None, help="Generation of the entries used in this run (the same for all its workers, i.e. a timestamp). Entries of the current generation are never evicted. Current time by default.")
+    groupO.add_argument('--batch-size', type=int, default=1000, help="Lines tokenized at once.")
+    groupO.add_argument('--fast-tokenizer', action='store_true', help="Use the memoized Moses tokenizer (same tokens as sacremoses, see fastmoses.py) for the languages tokenized with Moses.")
+    groupO.add_argument('--weighted', action='store_true', help="Every line starts with the times it is in the corpus and a tab (exact duplicates collapsed with sort | uniq -c). Segments are analysed once, and counted as many times as they are repeated.")
+    groupO.add_argument('--lang-column', action='store_true', help="Every line starts with the language of its segment and a tab (i.e. as identified by FastSpell). Segments are tokenized with the tokenizer, stopwords and PII scanner of their language (srclang is only used for the output), and with --emit-partials the stats are broken down by language too.")
+    groupO.add_argument('--max-languages', type=int, default=16, help="With --lang-column, languages whose tokenizers, stopwords and PII scanners are kept at the same time. The ones used longest ago are dropped first.")
+    groupO.add_argument('--analysisd', type=str, default=None, help="Unix socket of a running analysisd.py: tokenizers, stopwords and PII scanners are taken from it instead of being built here.")
+    groupO.add_argument('--binary', action='store_true', help="Read the input as bytes: sizes and hashes are computed on the raw segments, which are only decoded for tokenization and PII.")
     
     # Logging group    
     groupL = parser.add_argument_group('Logging')
@@ -30,91 +48,175 @@ def initialization():
     groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
     groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     logging_setup(args)
     return args
 
-def get_pii_proc(lang):
-    pii_isolang = Lang(lang.split('_')[0])
-
-    if pii_isolang.pt3 == 'hbs':
-        pii_lang = 'hbs'
-    elif not pii_isolang.pt1:
-        pii_lang = 'any'
-    else:
-        pii_lang = pii_isolang.pt1
-
-    pii_country = COUNTRY_ANY
-    pii_tasklist = (PiiEnum.IP_ADDRESS, PiiEnum.EMAIL_ADDRESS, PiiEnum.PHONE_NUMBER)
-    with stdout_to_err():
-        pii_proc = PiiManager(pii_lang, pii_country, tasks=pii_tasklist, mode="extract")
-            
-    return pii_proc
-    
-def main():
-    args = initialization() # Parsing parameters
-    logging.info("Starting process")
 
-    src_tokenizer = CustomTokenizer(args.srclang)    
-    logging.info("Tokenizing " + args.srclang + " with " +src_tokenizer.toktype + " (" + str(src_tokenizer.getWarnings()) +")" )
+class MonoCorpusReader:
+    #Built once, can process many blocks of lines (see mapdriver.py)
 
-    src_stopwords, nwarnings = get_stopwords(args.srclang)
-    logging.debug("Starting reading corpus")
-    
-    src_pii_proc = get_pii_proc(args.srclang)
-    
-    for line in args.input:
-        src = line.strip()
-        srctoks = []
-        srctokcount = 0
-        srcbytes = 0
-        srcchars = 0
-        srcpii = 0
-        srchash = ""
-        src_onegrams = []
-        src_twograms = []
-        src_threegrams = []
-        src_fourgrams =  []
-        src_fivegrams = []
+    def __init__(self, args):
+        self.args = args
+        self.binary = args.binary   #lines are bytes (see mapdriver.py)
+        self.client = None
+        if args.analysisd != None:
+            self.client = AnalysisClient(args.analysisd)
+            self.src_tokenizer = RemoteTokenizer(self.client, args.srclang, fast=args.fast_tokenizer)
+            self.src_stopwords = self.src_tokenizer.stopwords
+            self.src_pii_scanner = RemotePiiScanner(self.client, args.srclang)
+        else:
+            self.src_tokenizer = CustomTokenizer(args.srclang, fast=args.fast_tokenizer)    
+            self.src_stopwords, nwarnings = get_stopwords(args.srclang)
+            self.src_pii_scanner = PiiScanner(args.srclang)
+        logging.info("Tokenizing " + args.srclang + " with " +self.src_tokenizer.toktype + " (" + str(self.src_tokenizer.getWarnings()) +")" )
+
+        #Tools of every language, built the first time a segment in that language is found
+        self.languages = None
+        if args.lang_column:
+            self.languages = WarmLanguages(args.max_languages, float("inf"), self.client)
+
+        self.partial = None
+        if args.emit_partials:
+            self.partial = CorpusPartial(["src"], spill_dir=args.spill_dir, ngrams_buffer=args.ngrams_buffer,
+                                         cardinality=args.cardinality, hll_precision=args.hll_precision)
+
+        self.segcache = None
+        if args.segment_cache != None:
+            self.segcache = SegmentCache(args.segment_cache, args.segment_cache_size*1024*1024, generation=args.segment_cache_generation)
+
+    def process(self, lines, output):
+        #Lines are read in chunks, and every chunk is tokenized at once
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.args.batch_size))
+            if len(chunk) == 0:
+                break
+            self.process_chunk(chunk, output)
+
+    def analyse_by_lang(self, langs, srcs, hashes):
+        #Same as get_segments_ngrams and PII scanning in process_chunk, with the tools of the language of every segment,
+        #one batch per language
+        args = self.args
+        by_lang = {}
+        for i, lang in enumerate(langs):
+            by_lang.setdefault(lang, []).append(i)
+
+        src_analyses = [None] * len(srcs)
+        src_piis = [None] * len(srcs)
+        for lang, indexes in by_lang.items():
+            language = self.languages.get(lang)
+            tokenizer = language.tokenizer(args.fast_tokenizer)
+            segments = [srcs[i] for i in indexes]
+            analyses = get_segments_ngrams(lang, segments, tokenizer, language.stopwords, 5, self.segcache, [hashes[i] for i in indexes])
+            if args.emit_partials:
+                piis = language.pii_scanner.count_batch(segments)
+            else:
+                piis = language.pii_scanner.has_pii_batch(segments)
+            for i, analysis, pii in zip(indexes, analyses, piis):
+                src_analyses[i] = analysis
+                src_piis[i] = pii
+        return src_analyses, src_piis
+
+    def process_chunk(self, lines, output):
+        args = self.args
+        src_pii_scanner = self.src_pii_scanner
+        partial = self.partial
+
+        #Language of each line
+        if args.lang_column:
+            langs, lines = split_langs(lines)
+
+        #Times each line is in the corpus
+        if args.weighted:
+            weights, lines = split_weights(lines)
+        else:
+            weights = [1] * len(lines)
+
+        #Segments as text (for the tokenizer and PII) and as UTF-8 bytes (for sizes and hashes)
+        if self.binary:
+            srcs, src_raws = zip(*[decode_segment(line) for line in lines])
+        else:
+            srcs = [line.strip() for line in lines]
+            src_raws = [src.encode("utf-8") for src in srcs]
+        src_digests = [xxh64(src_raw) for src_raw in src_raws]
+
+        if args.lang_column:
+            src_analyses, src_piis = self.analyse_by_lang(langs, srcs, [d.intdigest() for d in src_digests])
+        else:
+            #Counting tokens in each sentence, and ngrams (or getting them from the segment cache)
+            src_analyses = get_segments_ngrams(args.srclang, srcs, self.src_tokenizer, self.src_stopwords, 5, self.segcache, [d.intdigest() for d in src_digests])
+
+            #PII
+            if args.emit_partials:
+                src_piis = src_pii_scanner.count_batch(srcs)
+            else:
+                src_piis = src_pii_scanner.has_pii_batch(srcs)
+
+        #Output of the whole chunk, written at once
+        out = []
+
+        for i in range(len(srcs)):
+            src = srcs[i]
+            srcdigest = src_digests[i]
         
-        #Volumes
-        srctoks = src_tokenizer.tokenize(src)
-        srctokcount = len(srctoks)
-        srchash = xxh64(src).hexdigest()
-        srcbytes = len(src.encode('utf-8'))            
-        srcchars = len(src)
-
-        #PII
-        src_pii_matches = src_pii_proc(src)
-        try:
-            next(src_pii_matches)
-            srcpii = 1
-        except StopIteration:
-            pass
-
-        #ngrams
-        src_ngrams_dict, nwarning = get_line_ngrams(args.srclang, srctoks, 5, src_stopwords)
-        for g in src_ngrams_dict.get(1):
-            src_onegrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(2):
-            src_twograms.append(" ".join(g))
-        for g in src_ngrams_dict.get(3):
-            src_threegrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(4): 
-            src_fourgrams.append(" ".join(g))
-        for g in src_ngrams_dict.get(5):
-            src_fivegrams.append(" ".join(g))
+            #Volumes
+            srchash = srcdigest.hexdigest()
+            srcbytes = len(src_raws[i])
+            srcchars = len(src)
+
+            #PII
+            src_pii_counts = None
+            if args.emit_partials:
+                src_pii_counts = src_piis[i]
+                srcpii = 1 if src_pii_counts else 0
+            else:
+                srcpii = src_piis[i]
+
+            srctokcount, (src_onegrams, src_twograms, src_threegrams, src_fourgrams, src_fivegrams) = src_analyses[i]
+
+            if args.emit_partials:
+                src_ngrams = {1: src_onegrams, 2: src_twograms, 3: src_threegrams, 4: src_fourgrams, 5: src_fivegrams}
+                partial.add_segment("src", srctokcount, srcbytes, srcchars, srcpii, srcdigest.intdigest(), src_ngrams, src_pii_counts, weights[i])
+                if args.lang_column:
+                    partial.add_segment(partial.add_lang("src", langs[i]), srctokcount, srcbytes, srcchars, srcpii, srcdigest.intdigest(), src_ngrams, src_pii_counts, weights[i])
+                partial.add_unit(weight=weights[i])
+                continue
         
-        #Write outoput:
-        #srctokcount srcbytes srcchars srcpii srchash
-        args.output.write("\t".join([str(srctokcount), str(srcbytes), str(srcchars), str(srcpii), srchash])+"\n")        
-        #now, this is the ugliest thing ever, but it's for the sake of the final output format... trust the process
-        print_in_column(6, src_onegrams, args.output)
-        print_in_column(7, src_twograms, args.output)
-        print_in_column(8, src_threegrams, args.output)
-        print_in_column(9, src_fourgrams, args.output)
-        print_in_column(10, src_fivegrams, args.output)
+            start = len(out)
+            #Write outoput:
+            #srctokcount srcbytes srcchars srcpii srchash
+            out.append("\t".join([str(srctokcount), str(srcbytes), str(srcchars), str(srcpii), srchash])+"\n")
+            #now, this is the ugliest thing ever, but it's for the sake of the final output format... trust the process
+            out.append(format_in_column(6, src_onegrams))
+            out.append(format_in_column(7, src_twograms))
+            out.append(format_in_column(8, src_threegrams))
+            out.append(format_in_column(9, src_fourgrams))
+            out.append(format_in_column(10, src_fivegrams))
+            #Same rows for every repetition of the segment
+            if weights[i] > 1:
+                out.extend(out[start:] * (weights[i] - 1))
 
+        output.write("".join(out))
+
+    def finish(self, output):
+        if self.client != None:
+            self.client.close()
+        if self.segcache != None:
+            self.segcache.close()
+        if self.partial != None:
+            self.partial.close()
+            output.write(self.partial.to_json()+"\n")
+
+
+def main():
+    args = initialization() # Parsing parameters
+    logging.info("Starting process")
+
+    reader = MonoCorpusReader(args)
+    logging.debug("Starting reading corpus")
+    reader.process(args.input.buffer if args.binary else args.input, args.output)
+    reader.finish(args.output)
     
         
 if __name__ == '__main__':
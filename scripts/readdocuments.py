@@ -7,16 +7,23 @@ import logging
 import traceback
 import argparse
 import json
-import tldextract
+import multiprocessing
 import docscorer
 import iso639
 import heli_otr
 
 
 from util import logging_setup, print_in_column
-from urllib.parse import urlparse
+from docformats import get_document_decoder, get_document_columns, get_record_decoder, split_document
+from langidcache import CachedIdentifier
+from partials import DocumentPartial
+from minhash import MinHasher, LSHIndex
+from xxhash import xxh3_64_intdigest
+from registers import get_labels
+from capabilities import get_fastspell_lang
+from domains import DomainResolver
 
-def initialization():
+def initialization(argv=None):
     parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
     
     parser.add_argument('input', nargs='?', type=argparse.FileType('rt', errors="replace"), default=io.TextIOWrapper(sys.stdin.buffer, errors="replace"),  help="Input documents file.")
@@ -27,6 +34,19 @@ def initialization():
     groupO = parser.add_argument_group("Optional")
     groupO.add_argument('--langs', type=argparse.FileType('wt'), help="Save sentence languages in this file.")
     groupO.add_argument('--format', type=str, help="Document format.", choices=["hplt2", "hplt3", "nemotron", "fineweb", "madlad"])
+    groupO.add_argument('--langid-cache-size', type=int, default=1000000, help="Languages of the most recent distinct segments kept, so that repeated segments are identified only once.")
+    groupO.add_argument('--domain-cache-size', type=int, default=100000, help="Domains of the most recent distinct hosts kept in memory.")
+    groupO.add_argument('--domain-cache', type=str, default=None, help="Persistent cache of the domains of every host (SQLite database). Shared across runs.")
+    groupO.add_argument('--partials-dir', type=str, default=None, help="Keep the document stats in process and write a mergeable partial in this directory at EOF (see reduce/merge_docpartials.py), instead of one row per document. Only the segments are written to the output.")
+    groupO.add_argument('--emit-langs', action='store_true', help="With --partials-dir, write the language of every segment (as FastSpell codes) and a tab before it, to use the segment languages of the documents instead of identifying them again.")
+    groupO.add_argument('--register-labels', action='store_true', help="With --partials-dir, count the web register labels of the documents that have them (HPLT v3), instead of running registerlabels.py.")
+    groupO.add_argument('--minhash', action='store_true', help="With --partials-dir, compute MinHash signatures of the word shingles of every document, to estimate near-duplicate documents (see minhash.py).")
+    groupO.add_argument('--minhash-bands', type=int, default=16, help="LSH bands of the MinHash signatures.")
+    groupO.add_argument('--minhash-rows', type=int, default=8, help="Values in each LSH band (signatures have bands*rows values).")
+    groupO.add_argument('--shingle-size', type=int, default=5, help="Words in each shingle of the MinHash signatures.")
+    groupO.add_argument('--top-capacity', type=int, default=10000, help="With --partials-dir, domains and TLDs counted per worker (the most frequent ones are kept).")
+    groupO.add_argument('--wds-workers', type=int, default=0, help="Processes scoring (WDS) the documents without doc_scores, while the next ones are read. 0 to score them in this process.")
+    groupO.add_argument('--wds-chunk-size', type=int, default=64, help="Documents identified and sent to be scored at a time.")
     
     # Logging group
     groupL = parser.add_argument_group('Logging')
@@ -35,156 +55,264 @@ def initialization():
     groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
     #groupL.add_argument('-v', '--version', action='version', version="%(prog)s " + __version__, help="show version of this script and exit")
 
-    args = parser.parse_args() 
+    args = parser.parse_args(argv)
     logging_setup(args)
     return args
 
-def main():
-    args = initialization() # Parsing parameters
-    logging.info("Starting process")
-    
-    text_field=None
-    seglangs_field=None
-    url_field=None
-    collection_field=None
-    wds_field=None
-
-
-    if args.format == "hplt2":
-        text_field="text"
-        seglangs_field="seg_langs"
-        url_field="u"
-        collection_field="collection"
-        wds_field="doc_scores"
-    elif args.format == "hplt3":
-        text_field="text"
-        seglangs_field="seg_langs"
-        url_field="u"
-        collection_field="crawl_id"
-        wds_field="doc_scores"
-    elif args.format=="nemotron":
-        text_field="text"        
-        url_field="url"
-    elif args.format=="fineweb":
-        text_field="text"
-        url_field="url"
-        collection_field="dump"
-    elif args.format=="madlad":
-        text_field="text"
-        
-        
-    langident = heli_otr.Identifier()
-    ds = docscorer.DocumentScorer()
+#WDS of the documents without doc_scores, scored in chunks by the --wds-workers processes (or by the reader itself)
+scorer = None
 
-    domain_cache = {}
-    
-    for json_line in args.input:
-        doc = json.loads(json_line)
+def init_scorer():
+    global scorer
+    scorer = docscorer.DocumentScorer()
+
+def score_documents(wds_docs):
+    #[(document_lang, script, id, langs, sents)] -> [raw WDS]
+    scores = []
+    for document_lang, script, docid, langs, sents in wds_docs:
+        ds_doc = {}
+        ds_doc["document_lang"] = document_lang
+        ds_doc["langs"] = langs
+        ds_doc["text"] = ("\n").join(sents)
+        ds_doc["script"] = script
+        ds_doc["id"] = docid
+        scores.append(scorer.score_document(ds_doc, raw_score=True))
+        #scores.append(scorer.score_document(json_line, only_final_score=True))
+    return scores
+
+
+class DocumentReader:
+    #Built once, can process many blocks of documents (see mapdriver.py)
+
+    def __init__(self, args):
+        self.args = args
     
-        #Sentences
-        #raw_sents = doc.get(text_field).split("\n")
-        raw_sents = re.split(r'\\n|\n', doc.get(text_field))
-        sents = []
-        for s in raw_sents:
-            if len(s) > 0:
-                sents.append(s)
-                
-        
-        #Segments in the document
-        doclength = len(sents)	
-        
-        #Document languages (HELI)
-        langs=[]
-        if seglangs_field != None:
-            langs = doc.get(seglangs_field)
-        if (seglangs_field == None) or (len(langs) != len(sents)):
-            for s in sents:
-                l = langident.identify(s)
-                langs.append(l)
+        self.text_field=None
+        self.seglangs_field=None
+        self.url_field=None
+        self.collection_field=None
+        self.wds_field=None
 
+
+        if args.format == "hplt2":
+            self.text_field="text"
+            self.seglangs_field="seg_langs"
+            self.url_field="u"
+            self.collection_field="collection"
+            self.wds_field="doc_scores"
+        elif args.format == "hplt3":
+            self.text_field="text"
+            self.seglangs_field="seg_langs"
+            self.url_field="u"
+            self.collection_field="crawl_id"
+            self.wds_field="doc_scores"
+        elif args.format=="nemotron":
+            self.text_field="text"        
+            self.url_field="url"
+        elif args.format=="fineweb":
+            self.text_field="text"
+            self.url_field="url"
+            self.collection_field="dump"
+        elif args.format=="madlad":
+            self.text_field="text"
         
-        #Collection
-        collection="unk"
-        if collection_field != None:
-            collection = doc.get(collection_field)
         
-        #Segments in the document language (docs_lang)
+        self.langident = CachedIdentifier(heli_otr.Identifier().identify, args.langid_cache_size)
+
+        self.pool = None
+        if self.wds_field == None:
+            if args.wds_workers > 0:
+                self.pool = multiprocessing.Pool(args.wds_workers, initializer=init_scorer)
+            else:
+                init_scorer()
+
+        self.domains = DomainResolver(args.domain_cache_size, args.domain_cache)
+
+        self.partial = None
+        if args.partials_dir != None:
+            os.makedirs(args.partials_dir, exist_ok=True)
+            self.minhasher = None
+            lsh = None
+            if args.minhash:
+                self.minhasher = MinHasher(args.minhash_bands, args.minhash_rows, args.shingle_size)
+                lsh = LSHIndex(args.partials_dir, "docs." + str(os.getpid()))
+            self.partial = DocumentPartial(args.top_capacity, lsh, args.partials_dir)
+            #Domain, TLD, hash and url of every document, to count the top ones again if they did not fit
+            self.keysfile = open(os.path.join(args.partials_dir, "docs." + str(os.getpid()) + ".keys"), "wt")
+
+        #Only the fields above are decoded (see docformats.py), or read from Parquet files (see mapdriver.py)
+        self.decode = get_document_decoder(args.format)
+        self.decode_record = get_record_decoder(args.format)
+        self.columns = get_document_columns(args.format)
+
         if len(args.srclang) == 2:
             #The documents have 3-letter langcodes
             langobj = iso639.Lang(args.srclang)
-            lang3 = langobj.pt3
+            self.lang3 = langobj.pt3
         else:
-            lang3 = args.srclang
-        lang_matches = sum(1 for item in langs if item.split("_")[0] == lang3) #this accepts both "hbs_cyr" and "hbs_lat" when target language is "hbs", for example
-        lang_matches_rate = round((lang_matches/len(langs)), 1)
-
-        #WDS
-        if wds_field != None:
-            docscores = doc.get(wds_field)
-            document_score = docscores[0]
-        else:
-            ds_doc = {}
-            if args.format=="hplt2":
-                ds_doc["document_lang"] = lang3
-                ds_doc["langs"] = langs
-                ds_doc["text"] = ("\n").join(sents)
-                ds_doc["script"] = doc.get("lang")[0].split("_")[1].lower()
-                ds_doc["id"] = doc.get("id")
-            elif args.format=="hplt3":
-                ds_doc["document_lang"] = lang3
-                ds_doc["langs"] = langs
-                ds_doc["text"] = ("\n").join(sents)
-                ds_doc["script"] = doc.get("lang")[0].split("_")[1].lower()
-                ds_doc["id"] = doc.get("id")
-            elif args.format=="nemotron":
-                ds_doc["document_lang"] = "eng" #Nemotron is always English for now
-                ds_doc["langs"] = langs
-                ds_doc["text"] = ("\n").join(sents)
-                ds_doc["script"] = "latn"
-                ds_doc["id"] = doc.get("warc_record_id")
-            elif args.format=="fineweb":
-                ds_doc["document_lang"] = doc.get("language") # + "_" + doc.get("language_script").lower()
-                ds_doc["langs"] = langs
-                ds_doc["text"] = ("\n").join(sents)
-                ds_doc["script"] = doc.get("language_script").lower()
-                ds_doc["id"] = doc.get("id")       
-            elif args.format=="madlad":
-                ds_doc["document_lang"] = lang3
-                ds_doc["langs"] = langs
-                ds_doc["text"] = ("\n").join(sents)
-                ds_doc["script"] = "latn"
-                ds_doc["id"] = doc.get("id")
-    
-            document_score = ds.score_document(ds_doc, raw_score=True) 
-            #document_score = ds.score_document(json_line, only_final_score=True)
- 
+            self.lang3 = args.srclang
+
+    def process(self, lines, output):
+        decode = self.decode
+        self.process_documents([decode(json_line) for json_line in lines], output)
+
+    def process_records(self, records, output):
+        #Rows of a Parquet file
+        decode_record = self.decode_record
+        self.process_documents([decode_record(record) for record in records], output)
+
+    def process_documents(self, documents, output):
+        args = self.args
+        text_field = self.text_field
+        seglangs_field = self.seglangs_field
+        url_field = self.url_field
+        collection_field = self.collection_field
+        wds_field = self.wds_field
+        lang3 = self.lang3
+
+        #Documents in the block, with their segments
+        docs = []
+        for doc in documents:
+            #Sentences
+            #raw_sents = doc.get(text_field).split("\n")
+            raw_sents = split_document(getattr(doc, text_field))
+            sents = []
+            for s in raw_sents:
+                if len(s) > 0:
+                    sents.append(s)
+
+            langs=[]
+            if seglangs_field != None:
+                langs = getattr(doc, seglangs_field)
+            docs.append((doc, sents, langs))
+
+        #Languages and scores, a chunk of documents at a time: the pool scores a chunk while the next one is identified,
+        #and the domains of the first ones are extracted
+        chunk_size = args.wds_chunk_size
+        scored = []
+        for start in range(0, len(docs), chunk_size):
+            chunk = docs[start:start+chunk_size]
+            self.identify(chunk)
+            if wds_field == None:
+                wds_docs = [self.get_wds_doc(doc, sents, langs) for doc, sents, langs in chunk]
+                if self.pool != None:
+                    scored.append(self.pool.apply_async(score_documents, (wds_docs,)))
+                else:
+                    scored.append(score_documents(wds_docs))
+        scores = self.iter_scores(scored)
+
         #Top-level domain and domain
-        #Domain
-        tld = ""
-        domain = ""
         if url_field:
-            url = doc.get(url_field)
-            try:
-                fulldomain = urlparse(url).netloc #This includes subdomain
-                if fulldomain in domain_cache:
-                    domain, tld = domain_cache[fulldomain]
-                else:
-                    extract_res = tldextract.extract(fulldomain)
-                    rawdomain = extract_res.domain #This does not include subdomain
-                    tld = extract_res.suffix #This is the TDL removing the preceeding dot
-                    domain = rawdomain + "." + tld
-                    domain_cache[fulldomain] = (domain, tld)
-            except Exception as ex:
-                logging.error("Bad url: " + url)
-                logging.error(ex)
-
-        args.output.write("\t".join([str(doclength), str(document_score), str(lang_matches_rate), collection, domain, tld ]) + "\n")
-        #Extract segments for further segment processing
-        print_in_column(7, sents, args.output)
-
-     #if unmatching_docs != 0:
-     #	warnings.append("docs_unmatching_"+str(unmatching_docs))
-       
+            domains = self.domains.resolve_batch([getattr(doc, url_field) for doc, sents, langs in docs])
+        else:
+            domains = [("", "")] * len(docs)
+
+        for (doc, sents, langs), (domain, tld) in zip(docs, domains):
+            #Segments in the document
+            doclength = len(sents)	
+        
+            #Collection
+            collection="unk"
+            if collection_field != None:
+                collection = getattr(doc, collection_field)
+        
+            #Segments in the document language (docs_lang)
+            lang_matches = sum(1 for item in langs if item.split("_")[0] == lang3) #this accepts both "hbs_cyr" and "hbs_lat" when target language is "hbs", for example
+            lang_matches_rate = round((lang_matches/len(langs)), 1)
+
+            #WDS
+            if wds_field != None:
+                docscores = getattr(doc, wds_field)
+                document_score = docscores[0]
+            else:
+                #In input order
+                document_score = next(scores)
+ 
+            if self.partial != None:
+                self.partial.add_document(doclength, str(document_score), str(lang_matches_rate), collection, domain, tld)
+                #Same hash for documents that only differ in whitespace
+                dochash = xxh3_64_intdigest("\n".join(" ".join(s.split()) for s in sents))
+                self.partial.add_hash(dochash)
+                url = (getattr(doc, url_field) or "") if url_field else ""
+                self.keysfile.write(domain + "\t" + tld + "\t" + format(dochash, "016x") + "\t" + url.replace("\t", " ") + "\n")
+                if wds_field != None:
+                    self.partial.add_reused("wds")
+                if self.minhasher != None:
+                    signature = self.minhasher.signature([word for s in sents for word in s.lower().split()])
+                    self.partial.lsh.add(self.minhasher.band_keys(signature) if signature != None else [])
+                web_register = getattr(doc, "web_register", None) if args.register_labels else None
+                if web_register != None:
+                    self.partial.add_register_labels(get_labels(web_register))
+                    self.partial.add_reused("register_labels")
+                #Segments for further segment processing, up to the first tab (as "cut -f 7" of the rows below)
+                #Languages of the segments (the identified ones are after the ones in the document if they did not match)
+                for s, lang in zip(sents, langs[len(langs)-len(sents):]):
+                    s = s.split("\t", 1)[0]
+                    if len(s) > 0:
+                        if args.emit_langs:
+                            output.write(get_fastspell_lang(lang) + "\t")
+                        output.write(s + "\n")
+                continue
+
+            output.write("\t".join([str(doclength), str(document_score), str(lang_matches_rate), collection, domain, tld ]) + "\n")
+            #Extract segments for further segment processing
+            print_in_column(7, sents, output)
+
+         #if unmatching_docs != 0:
+         #	warnings.append("docs_unmatching_"+str(unmatching_docs))
+
+    def identify(self, docs):
+        #Document languages (HELI), for the documents without a language for each segment, all of them at once
+        seglangs_field = self.seglangs_field
+        unidentified = [(sents, langs) for doc, sents, langs in docs if (seglangs_field == None) or (len(langs) != len(sents))]
+        if self.partial != None and seglangs_field != None:
+            self.partial.add_reused("seg_langs", len(docs) - len(unidentified))
+        identified = self.langident.identify_batch([s for sents, langs in unidentified for s in sents])
+        position = 0
+        for sents, langs in unidentified:
+            langs.extend(identified[position:position+len(sents)])
+            position += len(sents)
+
+    def get_wds_doc(self, doc, sents, langs):
+        #What score_documents needs of a document: (document_lang, script, id, langs, sents)
+        fmt = self.args.format
+        if fmt == "hplt2" or fmt == "hplt3":
+            return (self.lang3, doc.lang[0].split("_")[1].lower(), doc.id, langs, sents)
+        elif fmt == "nemotron":
+            return ("eng", "latn", doc.warc_record_id, langs, sents) #Nemotron is always English for now
+        elif fmt == "fineweb":
+            return (doc.language, doc.language_script.lower(), doc.id, langs, sents) # + "_" + doc.language_script.lower()
+        elif fmt == "madlad":
+            return (self.lang3, "latn", doc.id, langs, sents)
+
+    def iter_scores(self, scored):
+        #Scores of the chunks, waiting for the pool if needed
+        for chunk in scored:
+            if self.pool != None:
+                chunk = chunk.get()
+            yield from chunk
+
+    def finish(self, output):
+        self.langident.log_stats()
+        self.domains.close()
+        if self.partial != None:
+            self.keysfile.close()
+            self.partial.close()
+            with open(os.path.join(self.args.partials_dir, "docs." + str(os.getpid()) + ".json"), "wt") as partialfile:
+                partialfile.write(self.partial.to_json() + "\n")
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+
+
+def main():
+    args = initialization() # Parsing parameters
+    logging.info("Starting process")
+
+    reader = DocumentReader(args)
+    reader.process(args.input, args.output)
+    reader.finish(args.output)
+
 if __name__ == '__main__':
     try:
         main()  # Running main program
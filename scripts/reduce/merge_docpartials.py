@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import heapq
+import shutil
+import tempfile
+import argparse
+import traceback
+import logging
+import yaml
+from array import array
+
+sys.path.append('/work/scripts/')
+
+from partials import DocumentPartial
+
+#Merges the partials written by readdocuments.py --partials-dir, and writes the docs_* keys (same as write_docstats.py),
+#the register labels of the documents if they had them (same as write_registerlabels.py), and the annotations of the
+#documents that were used instead of computing them (docs_reused: {annotation: documents}, see capabilities.py).
+#Documents with the same normalized text are counted once (docs_unique, docs_duplication_ratio), and the documents
+#repeated most are counted exactly from the hashes in the keys files, and listed with the lowest url of their copies.
+#With readdocuments.py --minhash, near-duplicate documents are clustered (see minhash.py), and the ratio of documents
+#that are near-duplicates of another one and the sizes of the clusters are written too.
+#Partials of several shards of a corpus are merged by giving all their directories.
+#If the domains or TLDs did not fit in the summaries of the workers, the top ones are counted again exactly from the
+#keys files written along the partials.
+
+def initialization():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('yamlfile', type=argparse.FileType('a'), help="Output YAML stats file.")
+    parser.add_argument('partialsdirs', nargs='+', type=str, help="Directories with the partials (docs.*.json), keys (docs.*.keys) and LSH (docs.*.lsh.*) files")
+    parser.add_argument('--top', type=int, default=100, help="Most common domains, TLDs and duplicated documents to keep")
+
+    args = parser.parse_args()
+    return args
+
+def list_files(partialsdirs, extension):
+    for partialsdir in partialsdirs:
+        for filename in sorted(os.listdir(partialsdir)):
+            if filename.endswith(extension):
+                yield os.path.join(partialsdir, filename)
+
+def read_partials(partialsdirs):
+    merged = None
+    for path in list_files(partialsdirs, ".json"):
+        with open(path, "rt") as partialfile:
+            for line in partialfile:
+                if len(line.strip()) == 0:
+                    continue
+                partial = DocumentPartial.from_json(line)
+                if merged == None:
+                    merged = partial
+                else:
+                    merged.merge(partial)
+    assert merged != None, "No partials found"
+    return merged
+
+def read_keys(partialsdirs, column):
+    #Domain (column 0), TLD (column 1), hash (column 2) or url (column 3) of every document
+    for path in list_files(partialsdirs, ".keys"):
+        with open(path, "rt") as keysfile:
+            for line in keysfile:
+                yield line.rstrip("\n").split("\t")[column]
+
+def get_top(summary, partialsdirs, column, top):
+    #[[key, documents]] of the most common keys, the empty key (documents without url) left out
+    if not summary.exact():
+        logging.info("Counting the top keys again (floor " + str(summary.floor) + ")")
+        summary.recount(read_keys(partialsdirs, column))
+        if not summary.complete(top+1):
+            logging.warning("The top " + str(top) + " keys may be incomplete, use a higher --top-capacity in readdocuments.py")
+    return [[key, count] for key, count in summary.top(top+1) if len(key) > 0][:top]
+
+def get_top_duplicated(partialsdirs, top, partitions=256, buffer_size=1000000):
+    #[[url, copies]] of the documents with most copies (the lowest url of the copies, or the hash if they have no url).
+    #Hashes are hash-partitioned into files, and counted one partition at a time
+    workdir = tempfile.mkdtemp(prefix="duplicated.", dir=partialsdirs[0])
+    try:
+        pending = [array("Q") for p in range(partitions)]
+        pending_size = 0
+        paths = [os.path.join(workdir, str(partition)) for partition in range(partitions)]
+
+        def flush():
+            for partition, bucket in enumerate(pending):
+                if len(bucket) > 0:
+                    with open(paths[partition], "ab") as bucketfile:
+                        bucket.tofile(bucketfile)
+                    pending[partition] = array("Q")
+
+        for key in read_keys(partialsdirs, 2):
+            dochash = int(key, 16)
+            pending[dochash % partitions].append(dochash)
+            pending_size += 1
+            if pending_size >= buffer_size:
+                flush()
+                pending_size = 0
+        flush()
+
+        duplicated = []     #heap of (copies, hash), the top ones
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            bucket = array("Q")
+            with open(path, "rb") as bucketfile:
+                bucket.fromfile(bucketfile, os.path.getsize(path) // bucket.itemsize)
+            counts = {}
+            for dochash in bucket:
+                counts[dochash] = counts.get(dochash, 0) + 1
+            for dochash, count in counts.items():
+                if count > 1:
+                    if len(duplicated) < top:
+                        heapq.heappush(duplicated, (count, dochash))
+                    elif (count, dochash) > duplicated[0]:
+                        heapq.heapreplace(duplicated, (count, dochash))
+    finally:
+        shutil.rmtree(workdir)
+
+    #Highest counts first (ties: highest hashes first, as "sort -nr")
+    duplicated = [[format(dochash, "016x"), count] for count, dochash in sorted(duplicated, reverse=True)]
+    urls = {dochash: None for dochash, count in duplicated}
+    if len(urls) > 0:
+        for path in list_files(partialsdirs, ".keys"):
+            with open(path, "rt") as keysfile:
+                for line in keysfile:
+                    parts = line.rstrip("\n").split("\t")
+                    if parts[2] in urls and len(parts[3]) > 0 and (urls[parts[2]] == None or parts[3] < urls[parts[2]]):
+                        urls[parts[2]] = parts[3]
+    return [[urls[dochash] or dochash, count] for dochash, count in duplicated]
+
+def histogram_element(histogram, position):
+    #Element at a position of the sorted elements of a [[value, freq]] histogram sorted by value
+    for value, freq in histogram:
+        if position < freq:
+            return value
+        position -= freq
+
+def main():
+    args = initialization()
+    stats = {}
+
+    partial = read_partials(args.partialsdirs)
+
+    stats["docs_total"] = partial.docs
+
+    #Document sentences
+    docs_sents_list = [[sents, freq] for sents, freq in sorted(partial.doc_segments.items())]
+    stats["docs_segments"] = str(docs_sents_list)
+    #Same as statistics.mean and statistics.median of the sorted elements, without listing them
+    docs = sum(freq for sents, freq in docs_sents_list)
+    stats["docs_segments_mean"] = round(sum(sents * freq for sents, freq in docs_sents_list) / docs)
+    if docs % 2 == 1:
+        stats["docs_segments_median"] = round(histogram_element(docs_sents_list, docs // 2))
+    else:
+        stats["docs_segments_median"] = round((histogram_element(docs_sents_list, docs // 2 - 1) + histogram_element(docs_sents_list, docs // 2)) / 2)
+
+    #WDS and doc langs, in the order of "LC_ALL=C sort"
+    stats["docs_wds"] = json.dumps([[float(score), freq] for score, freq in sorted(partial.wds.items())])
+    stats["docs_langs"] = json.dumps([[float(ratio), freq] for ratio, freq in sorted(partial.lang_ratios.items())])
+
+    #Collections, most common first
+    stats["docs_collections"] = json.dumps([[collection, freq] for collection, freq in sorted(partial.collections.items(), key=lambda item: (item[1], item[0]), reverse=True)])
+
+    #Domains and TLDs
+    stats["docs_top100_domains"] = json.dumps(get_top(partial.domains, args.partialsdirs, 0, args.top))
+    stats["docs_top100_tld"] = json.dumps(get_top(partial.tlds, args.partialsdirs, 1, args.top))
+
+    #Document duplication
+    unique = min(sum(partial.distinct.counts().get("docs", {}).values()), partial.docs)
+    stats["docs_unique"] = unique
+    stats["docs_duplication_ratio"] = round((partial.docs - unique) / partial.docs, 4)
+    stats["docs_top100_duplicated"] = json.dumps(get_top_duplicated(args.partialsdirs, args.top))
+
+    #Register labels, most common first
+    if len(partial.register_labels) > 0:
+        stats["register_labels"] = json.dumps(dict(sorted(partial.register_labels.items(), key=lambda item: (item[1], item[0]), reverse=True)))
+    stats["docs_reused"] = json.dumps(partial.reused)
+
+    #Near-duplicates: documents besides the first one of every cluster, and [[cluster size, clusters]] of the clusters
+    #with more than one document
+    if partial.lsh != None and partial.lsh.docs > 0:
+        clusters = partial.lsh.clusters()
+        stats["docs_near_duplication_ratio"] = round((partial.lsh.docs - sum(clusters.values())) / partial.lsh.docs, 4)
+        stats["docs_near_duplicate_clusters"] = json.dumps([[size, count] for size, count in sorted(clusters.items()) if size > 1])
+
+    yaml.dump(stats, args.yamlfile)
+
+if __name__ == '__main__':
+    try:
+        main()  # Running main program
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
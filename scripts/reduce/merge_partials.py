@@ -0,0 +1,123 @@
+import sys
+import argparse
+import traceback
+import logging
+import json
+import yaml
+
+sys.path.append('/work/scripts/')
+
+from partials import CorpusPartial
+from write_tokcounts import get_tokcount_stats
+
+#Merges the partials written by readcorpus.py/readcorpus_mono.py with --emit-partials,
+#and writes the volumes, token counts and ngrams keys (same as write_volumes.py, write_tokcounts.py and addngrams.py)
+
+def initialization():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('yamlfile', type=argparse.FileType('a'), help="Output YAML stats file.")
+    parser.add_argument('partialsfiles', nargs='+', type=argparse.FileType('r'), help="Input partials files (one JSON partial per line)")
+    parser.add_argument('--ngrams-top', type=int, default=5, help="Most common ngrams to keep for each order")
+    parser.add_argument('--jobs', type=int, default=1, help="Parallel processes for merging spilled ngram runs")
+
+    args = parser.parse_args()
+    return args
+
+def read_partials(partialsfiles):
+    merged = None
+    for partialsfile in partialsfiles:
+        for line in partialsfile:
+            if len(line.strip()) == 0:
+                continue
+            partial = CorpusPartial.from_json(line)
+            if merged == None:
+                merged = partial
+            else:
+                merged.merge(partial)
+    assert merged != None, "No partials found"
+    return merged
+
+def get_volume_stats(partial, distinct_counts):
+    stats = {}
+    stats["sentence_pairs"] = partial.segments
+    for side in partial.sides:
+        stats[side+"_tokens"] = partial.volumes[side]["tokens"]
+        stats[side+"_bytes"] = partial.volumes[side]["bytes"]
+        stats[side+"_chars"] = partial.volumes[side]["chars"]
+        stats[side+"_pii"] = partial.volumes[side]["pii"]
+        #Matches per PII type (a segment can have several)
+        stats[side+"_pii_types"] = dict(sorted(partial.pii_types[side].items()))
+    if len(partial.sides) > 1:
+        unique = sum(distinct_counts.get("pair", {}).values())
+    else:
+        unique = sum(distinct_counts.get("src", {}).values())
+    #Estimates can be a bit above the actual number of segments
+    stats["unique_sents"] = min(unique, stats["sentence_pairs"])
+    duplicates = stats["sentence_pairs"] - stats["unique_sents"]
+    stats["duplication_ratio"] = round(duplicates / stats["sentence_pairs"], 4)
+    if len(partial.sides) > 1:
+        #Source-only and target-only duplication
+        for side in partial.sides:
+            unique_side = min(sum(distinct_counts.get(side, {}).values()), stats["sentence_pairs"])
+            stats[side+"_duplication_ratio"] = round((stats["sentence_pairs"] - unique_side) / stats["sentence_pairs"], 4)
+    if partial.distinct.mode == "hll":
+        #Relative standard error of the unique counts
+        stats["unique_sents_error"] = partial.distinct.error()
+    return stats
+
+def get_top_ngrams(top_ngrams, side, max_order):
+    ngrams = {}
+    for order in range(1, max_order+1):
+        for ngram, freq in top_ngrams.get((side, order), []):
+            if str(order) not in ngrams.keys():
+                ngrams[str(order)] = []
+            ngrams[str(order)].append([[ngram], freq])
+    return ngrams
+
+def get_lang_stats(partial, distinct_counts, top_ngrams, side):
+    #Breakdown of a side by language (readcorpus_mono.py --lang-column): {lang: {segments, volumes, unique segments, ngrams}}, most segments first
+    langs = {}
+    for lang_side in partial.lang_sides:
+        if not lang_side.startswith(side + ":"):
+            continue
+        segments = sum(partial.tokcounts[lang_side].values())
+        unique = min(sum(distinct_counts.get(lang_side, {}).values()), segments)
+        stats = {"segments": segments}
+        for field in ["tokens", "bytes", "chars", "pii"]:
+            stats[field] = partial.volumes[lang_side][field]
+        stats["unique_sents"] = unique
+        stats["duplication_ratio"] = round((segments - unique) / segments, 4) if segments > 0 else 0
+        stats["ngrams"] = get_top_ngrams(top_ngrams, lang_side, partial.max_order)
+        langs[lang_side.split(":", 1)[1]] = stats
+    return dict(sorted(langs.items(), key=lambda item: (-item[1]["segments"], item[0])))
+
+def main():
+    args = initialization()
+    stats = {}
+
+    partial = read_partials(args.partialsfiles)
+
+    distinct_counts = partial.distinct.counts()
+    stats.update(get_volume_stats(partial, distinct_counts))
+    top_ngrams = partial.ngrams.top(args.ngrams_top, args.jobs)
+    for side in partial.sides:
+        tokcount_rows = []
+        for tokcount in sorted(partial.tokcounts[side].keys()):
+            count = partial.tokcounts[side][tokcount]
+            unique = min(distinct_counts.get(side, {}).get(tokcount, 0), count)
+            tokcount_rows.append([tokcount, count, unique])
+        stats.update(get_tokcount_stats(side, tokcount_rows))
+        stats[side+"_ngrams"] = json.dumps(get_top_ngrams(top_ngrams, side, partial.max_order))
+        lang_stats = get_lang_stats(partial, distinct_counts, top_ngrams, side)
+        if len(lang_stats) > 0:
+            stats[side+"_lang_stats"] = json.dumps(lang_stats)
+
+    yaml.dump(stats, args.yamlfile)
+
+if __name__ == '__main__':
+    try:
+        main()  # Running main program
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
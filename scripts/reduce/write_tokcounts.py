@@ -4,8 +4,6 @@ import traceback
 import logging
 import json
 import yaml
-import statistics
-from collections import Counter
 
 
 def initialization():
@@ -18,46 +16,51 @@ def initialization():
     args = parser.parse_args()
     return args
     
-def main():    
-    args = initialization()
+def histogram_element(histogram, position):
+    #Element at a position of the sorted elements of a [[value, freq]] histogram sorted by value
+    for value, freq in histogram:
+        if position < freq:
+            return value
+        position -= freq
+
+def get_tokcount_stats(side, tokcount_rows):
+    #tokcount_rows: [tokcount, segments, unique segments], sorted by tokcount
     stats = {}
+    tokens_list = []
+    unique_tokens_list = []
+    for tokcount, count, unique in tokcount_rows:
+        tokens_list.append([tokcount, count])
+        unique_tokens_list.append([tokcount, unique])
 
-    src_sent_tokens = Counter()
-    src_tokens_list = []    
-    src_unique_tokens_list = []    
-    srcfile = args.srctokencountfile    
-    
-    for line in srcfile:
+    stats[side+"_unique_sents"] = str(unique_tokens_list)
+    stats[side+"_sent_tokens"] = str(tokens_list)
+    #Same as statistics.mean and statistics.median of the sorted elements, without listing them
+    histogram = sorted([tokcount, count] for tokcount, count in tokens_list if count > 0)
+    sents = sum(count for tokcount, count in histogram)
+    stats[side+"_sent_tokens_mean"] = round(sum(tokcount * count for tokcount, count in histogram) / sents)
+    if sents % 2 == 1:
+        stats[side+"_sent_tokens_median"] = round(histogram_element(histogram, sents // 2))
+    else:
+        stats[side+"_sent_tokens_median"] = round((histogram_element(histogram, sents // 2 - 1) + histogram_element(histogram, sents // 2)) / 2)
+    return stats
+
+def read_tokcount_rows(tokcountfile):
+    rows = []
+    for line in tokcountfile:
         parts = line.split()
-        src_sent_tokens[int(parts[0])] = int(parts[1])
-        src_tokens_list.append([int(parts[0]), int(parts[1])])
-        src_unique_tokens_list.append([int(parts[0]), int(parts[2])])
+        rows.append([int(parts[0]), int(parts[1]), int(parts[2])])
+    return rows
     
-    stats["src_unique_sents"] = str(src_unique_tokens_list) 
-    stats["src_sent_tokens"] = str(src_tokens_list)
-    src_tokens_elements = sorted(src_sent_tokens.elements())
-    stats["src_sent_tokens_mean"] = round(statistics.mean(src_tokens_elements))
-    stats["src_sent_tokens_median"] = round(statistics.median(src_tokens_elements))
+def main():    
+    args = initialization()
+    stats = {}
 
+    stats.update(get_tokcount_stats("src", read_tokcount_rows(args.srctokencountfile)))
 
     if args.trgtokencountfile != None:
         #is parallel
-        trg_sent_tokens = Counter()
-        trg_tokens_list = []
-        trg_unique_tokens_list = []    
         with open(args.trgtokencountfile, 'r') as trgfile:            
-            for line in trgfile:
-                parts = line.split()
-                trg_sent_tokens[int(parts[0])] = int(parts[1])
-                trg_tokens_list.append([int(parts[0]), int(parts[1])])
-                trg_unique_tokens_list.append([int(parts[0]), int(parts[2])])
-   
-        stats["trg_unique_sents"] = str(trg_unique_tokens_list) 
-        stats["trg_sent_tokens"] =   str(trg_tokens_list)
-        trg_tokens_elements = sorted(trg_sent_tokens.elements())
-        stats["trg_sent_tokens_mean"] = round(statistics.mean(trg_tokens_elements))
-        stats["trg_sent_tokens_median"] = round(statistics.median(trg_tokens_elements))
-
+            stats.update(get_tokcount_stats("trg", read_tokcount_rows(trgfile)))
     
     yaml.dump(stats, args.yamlfile)
             
@@ -0,0 +1,95 @@
+import logging
+
+#Web register labels (TurkuNLP/multilingual-web-register-classification), refined as registerlabels.py reports them.
+#Kept apart from registerlabels.py (no torch needed), to refine the register probabilities that come with the
+#documents (i.e. "web-register" in HPLT v3) in readdocuments.py.
+
+THRESHOLD = 0.5
+
+def is_main_class(label):
+    return (label in  ["LY",  "SP", "ID", "NA", "HI", "IP", "IN", "OP"])     
+    
+def get_main_class(label):
+    #if label in ["MT"]: return "MT"
+    if label in ["LY"]: return "LY"
+    if label in ["it", "SP"]: return "SP"
+    if label in ["ID"]: return "ID"
+    if label in ["ne", "sr", "nb", "NA"]: return "NA"
+    if label in ["re", "HI"]: return "HI"
+    if label in ["ds", "ed", "IP"]: return "IP"
+    if label in ["en", "ra", "dtp", "fi", "lt", "IN"]: return "IN"
+    if label in ["rv", "ob", "rs", "av", "OP"]: return "OP"
+    raise ValueError("Unknown label: " + label)
+
+
+def get_class(label):
+    if is_main_class(label):
+        return label + "_other"
+    else:
+        return get_main_class(label) + "_" + label
+
+
+def refine_labels(filtered_labels):
+        #MT label is treated independently
+        refined_labels = []
+        if "MT" in filtered_labels:
+            #classes["MT"] += 1
+            filtered_labels.remove("MT")
+            logging.debug("MT")
+            refined_labels.append("MT")
+
+
+        #No matching registers --> UNK
+        if len(filtered_labels) == 0:
+            #classes["UNK"] += 1
+            logging.debug("UNK")
+            refined_labels.append("UNK")
+            return refined_labels
+
+        #Many matching registers --> MIX
+        main_labels = set([get_main_class(label) for label in filtered_labels])
+        if len(main_labels) > 1:
+            #classes["MIX"] += 1
+            logging.debug("MIX")
+            refined_labels.append("MIX")
+            return refined_labels
+
+        #Only one main register at this point
+        raw_classes = [get_class(label) for label in filtered_labels] 
+
+        #only one label -->  return the label
+        if len(raw_classes) == 1:
+            logging.debug(raw_classes[0])
+            #classes[raw_classes[0]] += 1
+            refined_labels.append(raw_classes[0])
+            return refined_labels
+
+        subclasses = [cls.split("_")[1] for cls in raw_classes]
+        subclasses_main = []
+        if "other" in subclasses:
+            subclasses_main = ["other"]
+            subclasses.remove("other")
+
+        #two labels, one is a parent of the other --> return child     
+        if len(subclasses_main) == 1 and len(subclasses) == 1:
+            final_label = get_main_class(subclasses[0]) + "_" + subclasses[0]
+            logging.debug(final_label)
+            #classes[final_label] += 1
+            refined_labels.append(final_label)
+            return refined_labels
+
+        #more than two labels in total (by definition, at least two of them are siblings)--> return the main label (regardless it is or it is not in the list) 
+        if len(subclasses) > 1:
+            #take the first one for example
+            final_label = get_main_class(subclasses[0]) + "_other"
+            logging.debug(final_label)
+            #classes[final_label]+= 1
+            refined_labels.append(final_label)
+            return refined_labels
+
+        logging.error(" =============== YOU SHOULD NOT BE READING THIS ====================")
+
+
+def get_labels(probabilities, threshold=THRESHOLD):
+    #Refined labels from {label: probability}, in the order of the model labels
+    return refine_labels([label for label, probability in probabilities.items() if probability > threshold])
@@ -16,6 +16,8 @@ JOBS_READCORPUS=$(($JOBS/3*2))
 GPU_BATCHSIZE=256
 GPU_BATCHSIZE_DL=64
 
+NGRAMS_TOP=5
+
 export PYTORCH_CUDA_ALLOC_CONF=${PYTORCH_CUDA_ALLOC_CONF:-expandable_segments:True}
 
 if [[ $* == *--no-cache* ]]
@@ -49,12 +51,87 @@ else
         DEBUGFLAG=false
 fi
 
+if [[ $* == *--emit-partials* ]]
+then
+        PARTIALSFLAG=true
+else
+        PARTIALSFLAG=false
+fi
+
+if [[ $* == *--segment-cache* ]]
+then
+        #Shared by all runs
+        mkdir -p /work/cache
+        #One generation for all the workers of the run, so that none of them evicts what the others just used
+        SEGCACHE_CMD="--segment-cache /work/cache/segments.sqlite --segment-cache-generation $(date +%s)"
+else
+        SEGCACHE_CMD=""
+fi
+
+if [[ $* == *--fast-tokenizer* ]]
+then
+        FASTTOK_CMD="--fast-tokenizer"
+else
+        FASTTOK_CMD=""
+fi
+
+if [[ $* == *--binary* ]]
+then
+        #Segments read as bytes by readcorpus, only decoded for tokenization and PII
+        BINARY_CMD="--binary"
+else
+        BINARY_CMD=""
+fi
+
+if [[ $* == *--analysisd* ]] && ( [ "$srclang" = "bn" ] || [ "$srclang" = "ben" ] || [ "$trglang" = "bn" ] || [ "$trglang" = "ben" ] )
+then
+        #The daemon runs with the system python, and bnlp is only in its own venv: Bengali is tokenized by readcorpus
+        echo "Warning: --analysisd is not used for Bengali corpora" >&2
+        ANALYSISD_CMD=""
+elif [[ $* == *--analysisd* ]]
+then
+        #Tokenizers, stopwords and PII scanners kept warm across runs (started once, reused by the next runs)
+        mkdir -p /work/cache
+        python3 /work/scripts/analysisd.py /work/cache/analysisd.sock --workers $JOBS_READCORPUS --detach --quiet --logfile /work/cache/analysisd.log
+        ANALYSISD_CMD="--analysisd /work/cache/analysisd.sock"
+else
+        ANALYSISD_CMD=""
+fi
+
+if [[ $* == *--dedup* ]]
+then
+        DEDUPFLAG=true
+        if [ "$PARTIALSFLAG" = false ]; then
+                #Without partials, readcorpus writes the rows of every line as many times as it is repeated
+                echo "Warning: --dedup without --emit-partials only saves language identification and tokenization, the .proc file and its sorts keep their size" >&2
+        fi
+else
+        DEDUPFLAG=false
+fi
+
+if [[ $* == *--multilingual* ]]
+then
+        MULTILINGUALFLAG=true
+else
+        MULTILINGUALFLAG=false
+fi
+
+if [[ $* == *--approx-unique* ]]
+then
+        CARDINALITY=hll
+else
+        CARDINALITY=exact
+fi
+
 
 if [ "$format" = "hplt2" ] || [ "$format" = "hplt3" ] || [ "$format" = "nemotron" ] || [ "$format" = "fineweb" ] || [ "$format" = "madlad" ]; then
 	DOCS=true
 else
 	DOCS=false
 fi
+#Annotations of the documents used instead of computing them (see scripts/capabilities.py)
+REUSE_SEGLANGS=false
+REUSE_RL=false
 
 if ! [ -x "$(command -v nvidia-smi)" ]; then
 	echo 'Warning: No GPUs detected..' >&2
@@ -92,6 +169,11 @@ TMPDIR=/work/transient/tmp
 #filename=$(basename "$saved_file_path")
 echo WORKDIR:  $workdir
 
+if [ "$PARTIALSFLAG" = true ]; then
+	mkdir -p $workdir/spill
+	PARTIALS_CMD="--emit-partials --spill-dir $workdir/spill --cardinality $CARDINALITY"
+fi
+
 # Check if its monolingual or bilingual corpus
 if [ "$langformat" == "parallel" ]; then    
 	if [ "$srclang" == "en" ]; then
@@ -296,17 +378,34 @@ if [ "$langformat" == "parallel" ]; then
     		echo "Language pair not supported by Bicleaner/BicleanerAI"
     	fi
 
+	#Collapse exact duplicates: language identification and readcorpus run once per distinct line, weighted by its multiplicity
+	if [ "$DEDUPFLAG" = true ]; then
+		echo "Collapsing duplicates..."
+		LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS $tsv_file_path | LC_ALL=C uniq -c | sed -E 's/^ *([0-9]+) /\1\t/' > $tsv_file_path.dedup
+		SEGMENTS_FILE=$tsv_file_path.dedup
+		WEIGHTED_CMD="--weighted"
+	else
+		SEGMENTS_FILE=$tsv_file_path
+		WEIGHTED_CMD=""
+	fi
+
 	#Fastspell
 	#Force FastSpell FastText download in this env
 	python3 ./scripts/force-fasttext-download.py $srclang
         python3 ./scripts/force-fasttext-download.py $trglang	
 	echo "Running FastSpell..."
 	#Map langs
-	./scripts/map/parallel-fastspell.sh $JOBS $srclang $tsv_file_path $tsv_file_path.$srclang.langids 1 
-	./scripts/map/parallel-fastspell.sh $JOBS $trglang $tsv_file_path $tsv_file_path.$trglang.langids 2	
+	./scripts/map/parallel-fastspell.sh $JOBS $srclang $SEGMENTS_FILE $tsv_file_path.$srclang.langids 1 $WEIGHTED_CMD
+	./scripts/map/parallel-fastspell.sh $JOBS $trglang $SEGMENTS_FILE $tsv_file_path.$trglang.langids 2 $WEIGHTED_CMD
 	#Reduce langs
-	cat $tsv_file_path.$srclang.langids | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | sort -nr  >  $tsv_file_path.srclangs
-	cat $tsv_file_path.$trglang.langids | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | sort -nr  >  $tsv_file_path.trglangs
+	if [ "$DEDUPFLAG" = true ]; then
+		#Same output as uniq -c, adding up multiplicities
+		cat $tsv_file_path.$srclang.langids | awk -F "\t" '{sum[$2]+=$1} END {for (key in sum) {printf "%7d %s\n", sum[key], key}}' | sort -nr  >  $tsv_file_path.srclangs
+		cat $tsv_file_path.$trglang.langids | awk -F "\t" '{sum[$2]+=$1} END {for (key in sum) {printf "%7d %s\n", sum[key], key}}' | sort -nr  >  $tsv_file_path.trglangs
+	else
+		cat $tsv_file_path.$srclang.langids | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | sort -nr  >  $tsv_file_path.srclangs
+		cat $tsv_file_path.$trglang.langids | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | sort -nr  >  $tsv_file_path.trglangs
+	fi
 
     	#Stats from readcorpus
 	echo "Running ReadCorpus..."
@@ -314,40 +413,46 @@ if [ "$langformat" == "parallel" ]; then
 		source /work/venvs/venv-bnlp/bin/activate	
 	fi	
 	#python3 ./scripts/readcorpus.py $tsv_file_path $srclang $trglang $tsv_file_path.proc	
-	bash /work/scripts/map/parallel-readcorpus.sh $JOBS_READCORPUS $tsv_file_path $srclang $trglang $tsv_file_path.proc
+	if [ "$PARTIALSFLAG" = true ]; then
+		bash /work/scripts/map/parallel-readcorpus.sh $JOBS_READCORPUS $SEGMENTS_FILE $srclang $trglang $tsv_file_path.partials $PARTIALS_CMD $SEGCACHE_CMD $FASTTOK_CMD $BINARY_CMD $ANALYSISD_CMD $WEIGHTED_CMD
+	else
+		bash /work/scripts/map/parallel-readcorpus.sh $JOBS_READCORPUS $SEGMENTS_FILE $srclang $trglang $tsv_file_path.proc $SEGCACHE_CMD $FASTTOK_CMD $BINARY_CMD $ANALYSISD_CMD $WEIGHTED_CMD
+	fi
         if [ "$srclang" = "bn" ]  || [ "$srclang" = "ben" ] || [ "$trglang" = "bn" ] || [ "$trglang" = "ben" ]; then
 		deactivate
 	fi
-	echo "Mapping & Reducing volumes"
-	#Map & reduce volumes
-	bash /work/scripts/map/parallel-volumes.sh $JOBS $tsv_file_path.proc $tsv_file_path.volumes
-	#Map & reduce unique sentence pairs
-	cat $tsv_file_path.proc | cut -f 11 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | wc -l | (read COUNT && sed -e 's/$/\t'$COUNT'/' -i $tsv_file_path.volumes)
-	#Map & reduce source & target unique tokens 
-	cat $tsv_file_path.proc |   cut -f 1,9 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd | uniq -c | awk -F " " '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.srctokcount
-	cat $tsv_file_path.proc |  cut -f 2,10 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd | uniq -c | awk -F ' ' '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.trgtokcount
+	if [ "$PARTIALSFLAG" = false ]; then
+		echo "Mapping & Reducing volumes"
+		#Map & reduce volumes
+		bash /work/scripts/map/parallel-volumes.sh $JOBS $tsv_file_path.proc $tsv_file_path.volumes
+		#Map & reduce unique sentence pairs
+		cat $tsv_file_path.proc | cut -f 11 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | wc -l | (read COUNT && sed -e 's/$/\t'$COUNT'/' -i $tsv_file_path.volumes)
+		#Map & reduce source & target unique tokens 
+		cat $tsv_file_path.proc |   cut -f 1,9 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd | uniq -c | awk -F " " '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.srctokcount
+		cat $tsv_file_path.proc |  cut -f 2,10 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd | uniq -c | awk -F ' ' '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.trgtokcount
 	
 	
-	echo "Computing ngrams"
-        for SUFFIX_ORDER in one_1 two_2 three_3 four_4 five_5
-        do
-                SUFFIX=$(echo $SUFFIX_ORDER  | cut -d "_" -f 1)
-                ORDER=$(echo $SUFFIX_ORDER | cut -d "_" -f 2)
-                echo "Order " $ORDER
-                SRC_COLUMN=$((11 + $ORDER)) #11 previous columns with other metadata
-                TRG_COLUMN=$((16 + $ORDER)) #11 previous columns with other metadata + 5 columns with src ngrams
-                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $SRC_COLUMN  > $tsv_file_path.$srclang.$SUFFIX
-                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $TRG_COLUMN  > $tsv_file_path.$trglang.$SUFFIX                
+		echo "Computing ngrams"
+	        for SUFFIX_ORDER in one_1 two_2 three_3 four_4 five_5
+	        do
+	                SUFFIX=$(echo $SUFFIX_ORDER  | cut -d "_" -f 1)
+	                ORDER=$(echo $SUFFIX_ORDER | cut -d "_" -f 2)
+	                echo "Order " $ORDER
+	                SRC_COLUMN=$((11 + $ORDER)) #11 previous columns with other metadata
+	                TRG_COLUMN=$((16 + $ORDER)) #11 previous columns with other metadata + 5 columns with src ngrams
+	                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $SRC_COLUMN  > $tsv_file_path.$srclang.$SUFFIX
+	                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $TRG_COLUMN  > $tsv_file_path.$trglang.$SUFFIX                
          
-                #Taking SIX most common ngrams because probably one of them will be the empty spaces and will be removed in the awk below
-                LC_ALL=C sort $tsv_file_path.$srclang.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 |   awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path.$srclang".ngrams"
-                LC_ALL=C sort $tsv_file_path.$trglang.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 |   awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path.$trglang".ngrams"
+	                #Taking SIX most common ngrams because probably one of them will be the empty spaces and will be removed in the awk below
+	                LC_ALL=C sort $tsv_file_path.$srclang.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 |   awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path.$srclang".ngrams"
+	                LC_ALL=C sort $tsv_file_path.$trglang.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 |   awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path.$trglang".ngrams"
                 
-                if [ "$DEBUGFLAG" = false ]; then
-		        rm -rf $tsv_file_path.$srclang.$SUFFIX
-		        rm -rf $tsv_file_path.$trglang.$SUFFIX 
-		fi                          
-        done
+	                if [ "$DEBUGFLAG" = false ]; then
+			        rm -rf $tsv_file_path.$srclang.$SUFFIX
+			        rm -rf $tsv_file_path.$trglang.$SUFFIX 
+			fi                          
+	        done
+	fi
 	
 	echo "Extracting samples"
 	cat $tsv_file_path | shuf -n 50 > $tsv_file_path".sample"
@@ -364,10 +469,15 @@ if [ "$langformat" == "parallel" ]; then
 	if [ "$srclang" = "bn" ]  || [ "$srclang" = "ben" ] || [ "$trglang" = "bn" ] || [ "$trglang" = "ben" ]; then
          	deactivate
         fi
-	#Volumes
-	python3 /work/scripts/reduce/write_volumes.py $tsv_file_path.volumes $yaml_file_path
-	#Unique token counts
-	python3 /work/scripts/reduce/write_tokcounts.py $yaml_file_path $tsv_file_path.srctokcount $tsv_file_path.trgtokcount 
+	if [ "$PARTIALSFLAG" = true ]; then
+		#Volumes, unique token counts and ngrams
+		python3 /work/scripts/reduce/merge_partials.py $yaml_file_path $tsv_file_path.partials --ngrams-top $NGRAMS_TOP --jobs $JOBS
+	else
+		#Volumes
+		python3 /work/scripts/reduce/write_volumes.py $tsv_file_path.volumes $yaml_file_path
+		#Unique token counts
+		python3 /work/scripts/reduce/write_tokcounts.py $yaml_file_path $tsv_file_path.srctokcount $tsv_file_path.trgtokcount 
+	fi
 	#Langcount
 	python3 /work/scripts/reduce/write_langs.py $yaml_file_path $tsv_file_path.srclangs $tsv_file_path.trglangs 
 	#Hardrules
@@ -380,8 +490,10 @@ if [ "$langformat" == "parallel" ]; then
         fi
 	
 
-        python3 ./scripts/reduce/addngrams.py $tsv_file_path.$srclang".ngrams"  $yaml_file_path "src"
-        python3 ./scripts/reduce/addngrams.py $tsv_file_path.$trglang".ngrams"  $yaml_file_path "trg"
+	if [ "$PARTIALSFLAG" = false ]; then
+	        python3 ./scripts/reduce/addngrams.py $tsv_file_path.$srclang".ngrams"  $yaml_file_path "src"
+	        python3 ./scripts/reduce/addngrams.py $tsv_file_path.$trglang".ngrams"  $yaml_file_path "trg"
+	fi
 	python3 ./scripts/reduce/write_sample.py $tsv_file_path".sample" $yaml_file_path "parallel"
 
 elif [ "$langformat" == "mono" ]; then
@@ -405,48 +517,48 @@ elif [ "$langformat" == "mono" ]; then
                 # Create the new file path with the "tsv" extension                
                 tsv_file_path="$workdir/$filename.tsv"
                 
-                if [ "$extension" == "zst" ] || [ "$extension" == "zstd" ] ; then
-		        zstdcat $saved_file_path | bash /work/scripts/map/parallel-readdocuments.sh $JOBS - $srclang $tsv_file_path.docproc $format
-
-		elif [ "$extension" == "parquet" ]; then
-			python3 scripts/deparquet.py $saved_file_path - | bash /work/scripts/map/parallel-readdocuments.sh $JOBS - $srclang $tsv_file_path.docproc $format
+                #Domains are kept across runs. Formats without doc_scores are scored (WDS) while read: half of the jobs read, each one with a scoring process
+                READ_JOBS=$JOBS
+                DOCPROC_CMD="--partials-dir $tsv_file_path.docpartials --domain-cache /work/cache/domains.sqlite --minhash"
+                if [ "$format" == "nemotron" ] || [ "$format" == "fineweb" ] || [ "$format" == "madlad" ]; then
+                	READ_JOBS=$(($JOBS/2>1 ? $JOBS/2 : 1))
+                	DOCPROC_CMD="$DOCPROC_CMD --wds-workers 1"
+                fi
+                rm -rf $tsv_file_path.docpartials
+
+                #Segment languages and register labels that come with the documents (WDS is always taken if there)
+                ANNOTATIONS=$(python3 scripts/capabilities.py $format $saved_file_path --quiet)
+                echo "Annotations in the documents: $ANNOTATIONS"
+                if [[ " $ANNOTATIONS " == *" seg_langs "* ]]; then
+                	REUSE_SEGLANGS=true
+                	DOCPROC_CMD="$DOCPROC_CMD --emit-langs"
+                fi
+                if [[ " $ANNOTATIONS " == *" register_labels "* ]] && [ "$SKIPRLFLAG" = false ]; then
+                	REUSE_RL=true
+                	DOCPROC_CMD="$DOCPROC_CMD --register-labels"
+                fi
 
+                #Document stats are kept by every worker (merged when writing the yaml file), only the segments are written
+                #(with their language, if reused). Row groups of parquet files are read by the workers, zst, gz and xz files
+                #are decompressed by mapdriver.py, plain files are split in byte ranges
+                if [ "$REUSE_SEGLANGS" = true ]; then
+                	bash /work/scripts/map/parallel-readdocuments.sh $READ_JOBS $saved_file_path $srclang $tsv_file_path.seglangs $format $DOCPROC_CMD
+                	cut -f 2 $tsv_file_path.seglangs > $tsv_file_path
                 else
-                	cat $saved_file_path | bash /work/scripts/map/parallel-readdocuments.sh $JOBS - $srclang $tsv_file_path.docproc $format
+                	bash /work/scripts/map/parallel-readdocuments.sh $READ_JOBS $saved_file_path $srclang $tsv_file_path $format $DOCPROC_CMD
                 fi
 
-
-		echo "Mapping & Reducing document volumes"
-		#Map & reduce document volumes
-		#bash /work/scripts/map/document-volumes.sh $JOBS $tsv_file_path.docproc $tsv_file_path.docvolumes
-		#Volumes
-		cat $tsv_file_path.docproc | cut -f 1 | parallel -j $JOBS --pipe awk -F \'\\t\' \'length\(\$1\) == 0{next\;}{sum0+=1\; sum1+=\$1\;} END {print sum0 \"\\t\" sum1 }\'  | awk -F "\t" '{sum0+=$1; sum1+=$2;} END {print sum0 "\t" sum1}'  > $tsv_file_path.docvolumes
-		#Map & reduce document sentences
-		cat $tsv_file_path.docproc |  cut -f 1 |  grep  '[0-9]'  | LC_ALL=C sort -S 50% --compress-program=zstd | uniq -c | awk -F " " '{sum[$2]+=$1;} END {for (key in sum) {print sum[key], key}}'  > $tsv_file_path.docsents
-		#WDS
-		cat $tsv_file_path.docproc | cut -f 2 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c > $tsv_file_path.wds
-		#sents in doclang
-		cat $tsv_file_path.docproc | cut -f 3 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c  > $tsv_file_path.doclangs
-		#collections
-		cat $tsv_file_path.docproc | cut -f 4 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | sort -nr  > $tsv_file_path.collections
-		#domains
-		cat $tsv_file_path.docproc | cut -f 5 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 101  > $tsv_file_path.domains
-		#tlds
-		cat $tsv_file_path.docproc | cut -f 6 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 101 > $tsv_file_path.tlds		
-		
-		#doing this for compatibility with non-document formats in the next steps
-		cat $tsv_file_path.docproc | cut -f 7 | awk 'length() == 0{next;} {print;}' > $tsv_file_path 
-		if [ "$DEBUGFLAG" = false ]; then
-			rm $tsv_file_path.docproc
-		fi
-						
 		#Register labels
-		if [ "$SKIPRLFLAG" = false ]; then		
+		if [ "$REUSE_RL" = true ]; then
+			echo "Register labels taken from the documents"
+		elif [ "$SKIPRLFLAG" = false ]; then		
 		        if [[ " ${registerlabels_langs[*]} " =~ " $srclang " ]]; then	        
 		        	source /work/venvs/venv-rl/bin/activate
 		        	echo "Running register labels..."   	
 		        	if [ "$extension" == "zst" ] || [ "$extension" == "zstd" ]; then
 					zstdcat $saved_file_path | python3 ./scripts/registerlabels.py --batchsize $GPU_BATCHSIZE  > $tsv_file_path.rl
+				elif [ "$extension" == "parquet" ]; then
+					python3 scripts/deparquet.py $saved_file_path - --columns text | python3 ./scripts/registerlabels.py --batchsize $GPU_BATCHSIZE  > $tsv_file_path.rl
 				else
 					cat $saved_file_path | python3 ./scripts/registerlabels.py  --batchsize $GPU_BATCHSIZE> $tsv_file_path.rl
 				fi
@@ -467,7 +579,7 @@ elif [ "$langformat" == "mono" ]; then
                                 if [ "$extension" == "zst" ] || [ "$extension" == "zstd" ]; then
                                         zstdcat $saved_file_path | python3 ./scripts/domainlabels.py --batchsize $GPU_BATCHSIZE_DL > $tsv_file_path.dl
                                 elif [ "$extension" == "parquet" ]; then
-                                        python3 scripts/deparquet.py $saved_file_path - | python3 ./scripts/domainlabels.py --batchsize $GPU_BATCHSIZE_DL > $tsv_file_path.dl
+                                        python3 scripts/deparquet.py $saved_file_path - --columns text | python3 ./scripts/domainlabels.py --batchsize $GPU_BATCHSIZE_DL > $tsv_file_path.dl
                                 else
                                         cat $saved_file_path | python3 ./scripts/domainlabels.py --batchsize $GPU_BATCHSIZE_DL > $tsv_file_path.dl
                                 fi
@@ -497,12 +609,48 @@ elif [ "$langformat" == "mono" ]; then
 	deactivate
 
 
+	#Collapse exact duplicates: language identification and readcorpus run once per distinct line, weighted by its multiplicity
+	if [ "$DEDUPFLAG" = true ]; then
+		echo "Collapsing duplicates..."
+		LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS $tsv_file_path | LC_ALL=C uniq -c | sed -E 's/^ *([0-9]+) /\1\t/' > $tsv_file_path.dedup
+		SEGMENTS_FILE=$tsv_file_path.dedup
+		WEIGHTED_CMD="--weighted"
+	else
+		SEGMENTS_FILE=$tsv_file_path
+		WEIGHTED_CMD=""
+	fi
+
         #Fastspell
-        echo "Running FastSpell..."
-	#Force Fasttext download, in case it does not exist in this environment, to avoid doing it in parallel
-	python3 /work/scripts/force-fasttext-download.py $srclang        
-        ./scripts/map/parallel-fastspell.sh $JOBS $srclang $tsv_file_path $tsv_file_path.langids 1 
-        cat $tsv_file_path.langids | LC_ALL=C sort --parallel $JOBS -S 50% --compress-program=zstd | uniq -c | sort -nr  >  $tsv_file_path.srclangs
+	if [ "$REUSE_SEGLANGS" = true ] && ! ( [ "$DEDUPFLAG" = true ] && [ "$MULTILINGUALFLAG" = true ] ); then
+		#One language per segment of $tsv_file_path, from the documents (with --dedup and --multilingual they are needed per distinct segment, so FastSpell runs)
+		echo "Segment languages taken from the documents"
+		cut -f 1 $tsv_file_path.seglangs > $tsv_file_path.langids
+	        cat $tsv_file_path.langids | LC_ALL=C sort --parallel $JOBS -S 50% --compress-program=zstd | uniq -c | sort -nr  >  $tsv_file_path.srclangs
+	else
+	        echo "Running FastSpell..."
+		#Force Fasttext download, in case it does not exist in this environment, to avoid doing it in parallel
+		python3 /work/scripts/force-fasttext-download.py $srclang        
+	        ./scripts/map/parallel-fastspell.sh $JOBS $srclang $SEGMENTS_FILE $tsv_file_path.langids 1 $WEIGHTED_CMD
+		if [ "$DEDUPFLAG" = true ]; then
+			#Same output as uniq -c, adding up multiplicities
+			cat $tsv_file_path.langids | awk -F "\t" '{sum[$2]+=$1} END {for (key in sum) {printf "%7d %s\n", sum[key], key}}' | sort -nr  >  $tsv_file_path.srclangs
+		else
+		        cat $tsv_file_path.langids | LC_ALL=C sort --parallel $JOBS -S 50% --compress-program=zstd | uniq -c | sort -nr  >  $tsv_file_path.srclangs
+		fi
+	fi
+
+	#Multilingual: every segment is tokenized with the tools of its identified language, and stats are broken down by language
+	if [ "$MULTILINGUALFLAG" = true ]; then
+		if [ "$DEDUPFLAG" = true ]; then
+			paste <(cut -f 2 $tsv_file_path.langids) $SEGMENTS_FILE > $tsv_file_path.langtagged
+		else
+			paste $tsv_file_path.langids $SEGMENTS_FILE > $tsv_file_path.langtagged
+		fi
+		SEGMENTS_FILE=$tsv_file_path.langtagged
+		LANGCOLUMN_CMD="--lang-column"
+	else
+		LANGCOLUMN_CMD=""
+	fi
 
 
 	#Read corpus mono
@@ -510,35 +658,41 @@ elif [ "$langformat" == "mono" ]; then
 	if [ "$srclang" = "bn" ]  || [ "$srclang" = "ben" ]; then
                 source /work/venvs/venv-bnlp/bin/activate
         fi	
-	bash /work/scripts/map/parallel-readcorpus-mono.sh $JOBS_READCORPUS $tsv_file_path $srclang $tsv_file_path.proc	
+	if [ "$PARTIALSFLAG" = true ]; then
+		bash /work/scripts/map/parallel-readcorpus-mono.sh $JOBS_READCORPUS $SEGMENTS_FILE $srclang $tsv_file_path.partials $PARTIALS_CMD $SEGCACHE_CMD $FASTTOK_CMD $BINARY_CMD $ANALYSISD_CMD $WEIGHTED_CMD $LANGCOLUMN_CMD
+	else
+		bash /work/scripts/map/parallel-readcorpus-mono.sh $JOBS_READCORPUS $SEGMENTS_FILE $srclang $tsv_file_path.proc $SEGCACHE_CMD $FASTTOK_CMD $BINARY_CMD $ANALYSISD_CMD $WEIGHTED_CMD $LANGCOLUMN_CMD
+	fi
 	if [ "$srclang" = "bn" ]  || [ "$srclang" = "ben" ]; then
 		deactivate
 	fi
 	
-	#Map & reduce volumes
-	echo "Mapping & Reducing volumes..."
-	bash /work/scripts/map/parallel-volumes-mono.sh $JOBS $tsv_file_path.proc $tsv_file_path.volumes
-	#Map & reduce unique sentences
-	cat $tsv_file_path.proc | cut -f 5 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | wc -l | (read COUNT && sed -e 's/$/\t'$COUNT'/' -i $tsv_file_path.volumes)
-	#Map & reduce source & target unique tokens 
-	cat $tsv_file_path.proc | cut -f 1,5 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS  | uniq -c | awk -F " " '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.srctokcount
-
-        echo "Computing ngrams"
-        for SUFFIX_ORDER in one_1 two_2 three_3 four_4 five_5
-        do
-                SUFFIX=$(echo $SUFFIX_ORDER  | cut -d "_" -f 1)
-                ORDER=$(echo $SUFFIX_ORDER | cut -d "_" -f 2)
-                echo "Order " $ORDER
-                SRC_COLUMN=$((5 + $ORDER)) #5 previous columns with other metadata
-                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $SRC_COLUMN  > $tsv_file_path.$SUFFIX
-
-                #Taking SIX most common ngrams because probably one of them will be the empty spaces and will be removed in the awk below
-                LC_ALL=C sort $tsv_file_path.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 | awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path".ngrams"
+	if [ "$PARTIALSFLAG" = false ]; then
+		#Map & reduce volumes
+		echo "Mapping & Reducing volumes..."
+		bash /work/scripts/map/parallel-volumes-mono.sh $JOBS $tsv_file_path.proc $tsv_file_path.volumes
+		#Map & reduce unique sentences
+		cat $tsv_file_path.proc | cut -f 5 | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS |  uniq -c | wc -l | (read COUNT && sed -e 's/$/\t'$COUNT'/' -i $tsv_file_path.volumes)
+		#Map & reduce source & target unique tokens 
+		cat $tsv_file_path.proc | cut -f 1,5 | grep  '[0-9]' | LC_ALL=C sort -S 50% --compress-program=zstd --parallel $JOBS  | uniq -c | awk -F " " '{sum[$2]+=$1; uni[$2]+=1} END {for (key in sum) {print key, sum[key], uni[key]}}' | sort -n  > $tsv_file_path.srctokcount
+
+	        echo "Computing ngrams"
+	        for SUFFIX_ORDER in one_1 two_2 three_3 four_4 five_5
+	        do
+	                SUFFIX=$(echo $SUFFIX_ORDER  | cut -d "_" -f 1)
+	                ORDER=$(echo $SUFFIX_ORDER | cut -d "_" -f 2)
+	                echo "Order " $ORDER
+	                SRC_COLUMN=$((5 + $ORDER)) #5 previous columns with other metadata
+	                parallel --jobs $JOBS --pipepart -a $tsv_file_path.proc cut -f $SRC_COLUMN  > $tsv_file_path.$SUFFIX
+
+	                #Taking SIX most common ngrams because probably one of them will be the empty spaces and will be removed in the awk below
+	                LC_ALL=C sort $tsv_file_path.$SUFFIX -S 50% --compress-program=zstd --parallel $JOBS | uniq -c | LC_ALL=C sort -nr -S 50% --compress-program=zstd --parallel $JOBS | head -n 6 | awk -v ORDER=$ORDER 'length($2) == 0{next;}{for (i=2; i<NF; i++) printf $i " "; print $NF"\t"$1"\t"ORDER}' >> $tsv_file_path".ngrams"
                 
-                if [ "$DEBUGFLAG" = false ]; then
-		        rm -rf $tsv_file_path.$SUFFIX
-		fi
-        done
+	                if [ "$DEBUGFLAG" = false ]; then
+			        rm -rf $tsv_file_path.$SUFFIX
+			fi
+	        done
+	fi
        
        	echo "Obtaining sample"
        	if [ "$DOCS" = true ]; then
@@ -546,7 +700,7 @@ elif [ "$langformat" == "mono" ]; then
                         zstdcat $saved_file_path | shuf -n 20 | jq .text > $tsv_file_path".sample"
 
                 elif [ "$extension" == "parquet" ]; then
-                        python3 scripts/deparquet.py $saved_file_path - | shuf -n 20 | jq .text  > $tsv_file_path".sample"
+                        python3 scripts/deparquet.py $saved_file_path - --columns text | shuf -n 20 | jq .text  > $tsv_file_path".sample"
 
                 else
                         cat $saved_file_path | shuf -n 20 | jq .text > $tsv_file_path".sample"
@@ -570,12 +724,20 @@ elif [ "$langformat" == "mono" ]; then
         fi
 	#Write docs stats
 	if [ "$DOCS" = true ]; then
-		python3 /work/scripts/reduce/write_docstats.py $yaml_file_path $tsv_file_path.docvolumes $tsv_file_path.docsents $tsv_file_path.wds $tsv_file_path.doclangs $tsv_file_path.collections $tsv_file_path.domains $tsv_file_path.tlds
+		python3 /work/scripts/reduce/merge_docpartials.py $yaml_file_path $tsv_file_path.docpartials
+		if [ "$DEBUGFLAG" = false ]; then
+			rm -rf $tsv_file_path.docpartials
+		fi
+	fi
+	if [ "$PARTIALSFLAG" = true ]; then
+		#Volumes, unique token counts and ngrams
+		python3 /work/scripts/reduce/merge_partials.py $yaml_file_path $tsv_file_path.partials --ngrams-top $NGRAMS_TOP --jobs $JOBS
+	else
+		#Volumes
+		python3 /work/scripts/reduce/write_volumes.py $tsv_file_path.volumes $yaml_file_path
+		#Unique token counts
+		python3 /work/scripts/reduce/write_tokcounts.py $yaml_file_path $tsv_file_path.srctokcount
 	fi
-	#Volumes
-	python3 /work/scripts/reduce/write_volumes.py $tsv_file_path.volumes $yaml_file_path
-	#Unique token counts
-	python3 /work/scripts/reduce/write_tokcounts.py $yaml_file_path $tsv_file_path.srctokcount
 	#Langcount
 	python3 /work/scripts/reduce/write_langs.py $yaml_file_path $tsv_file_path.srclangs
 	
@@ -592,7 +754,9 @@ elif [ "$langformat" == "mono" ]; then
                 python3 /work/scripts/reduce/write_domainlabels.py $tsv_file_path.dlcounts $yaml_file_path
         fi
 
-        python3 ./scripts/reduce/addngrams.py $tsv_file_path".ngrams"  $yaml_file_path "src"
+	if [ "$PARTIALSFLAG" = false ]; then
+	        python3 ./scripts/reduce/addngrams.py $tsv_file_path".ngrams"  $yaml_file_path "src"
+	fi
         if [ "$DOCS" = true ]; then
 	        python3 ./scripts/reduce/write_sample.py $tsv_file_path".sample" $yaml_file_path "docs"
 	else
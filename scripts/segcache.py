@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import sqlite3
+
+#Persistent cache of tokenization results, shared across runs (and across the workers of a run).
+#Keyed by (language, tokenizer type, xxh64 of the segment), it stores the token count and the ngrams
+#extracted from the segment, so that a segment seen in a previous corpus (i.e. a previous release of the
+#same crawl) does not need to be tokenized again.
+#The store is a SQLite database, read through a memory map and written in WAL mode, so that several
+#processes can read it while one of them writes. New entries and hits are written in batches.
+#When the database grows over max_bytes, the entries that were used longest ago are evicted.
+
+ORDER_SEP = "\x1e"
+NGRAM_SEP = "\x1f"
+
+class SegmentCache:
+
+    def __init__(self, path, max_bytes=4*1024**3, batch_size=10000, generation=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        #Entries used in this run. Given by the caller, so that it is the same for all the workers of the run
+        self.generation = generation if generation != None else int(time.time())
+        self.pending = []   #new entries
+        self.hits = []      #keys of entries used in this run
+        self.lookups = 0
+        self.found = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA mmap_size=" + str(max_bytes))
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS segments (lang TEXT, toktype TEXT, hash INTEGER, tokcount INTEGER, ngrams TEXT, used INTEGER, "
+                            "PRIMARY KEY (lang, toktype, hash)) WITHOUT ROWID")
+            self.db.execute("CREATE INDEX IF NOT EXISTS segments_used ON segments (used)")
+
+    def key(self, lang, toktype, seghash):
+        #SQLite integers are signed 64-bit
+        if seghash >= 1 << 63:
+            seghash -= 1 << 64
+        return (lang, toktype, seghash)
+
+    def get(self, lang, toktype, seghash):
+        #Returns (tokcount, [ngrams of order 1, ngrams of order 2, ...]) or None
+        key = self.key(lang, toktype, seghash)
+        self.lookups += 1
+        row = self.db.execute("SELECT tokcount, ngrams FROM segments WHERE lang=? AND toktype=? AND hash=?", key).fetchone()
+        if row == None:
+            return None
+        self.found += 1
+        self.hits.append(key)
+        if len(self.hits) >= self.batch_size:
+            self.flush()
+        tokcount, ngrams = row
+        return tokcount, [(order.split(NGRAM_SEP) if len(order) > 0 else []) for order in ngrams.split(ORDER_SEP)]
+
+    def put(self, lang, toktype, seghash, tokcount, ngrams_lists):
+        #ngrams_lists: [ngrams of order 1, ngrams of order 2, ...], every ngram being a string
+        ngrams = ORDER_SEP.join(NGRAM_SEP.join(order) for order in ngrams_lists)
+        self.pending.append(self.key(lang, toktype, seghash) + (tokcount, ngrams, self.generation))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.db:
+            if len(self.pending) > 0:
+                self.db.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)", self.pending)
+            if len(self.hits) > 0:
+                self.db.executemany("UPDATE segments SET used=" + str(self.generation) + " WHERE lang=? AND toktype=? AND hash=?", self.hits)
+        self.pending = []
+        self.hits = []
+        self.evict()
+
+    def size(self):
+        #Bytes in use (freed pages are reused by new entries, so the file itself stops growing)
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def evict(self):
+        #Remove the entries used longest ago until the database is below max_bytes.
+        #Entries from the current generation are never evicted.
+        if self.size() <= self.max_bytes:
+            return
+        #Don't drop more than a tenth of the entries in a single step
+        step = max(1, self.db.execute("SELECT COUNT(*) FROM segments").fetchone()[0] // 10)
+        while self.size() > self.max_bytes:
+            with self.db:
+                oldest = self.db.execute("SELECT MIN(used) FROM segments").fetchone()[0]
+                if oldest == None or oldest >= self.generation:
+                    break
+                self.db.execute("DELETE FROM segments WHERE (lang, toktype, hash) IN "
+                                "(SELECT lang, toktype, hash FROM segments WHERE used=? LIMIT ?)", (oldest, step))
+            logging.debug("Evicted old entries from the segment cache " + self.path)
+
+    def close(self):
+        self.flush()
+        if self.lookups > 0:
+            logging.info("Segment cache hits: " + str(self.found) + "/" + str(self.lookups))
+        self.db.close()
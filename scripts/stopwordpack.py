@@ -0,0 +1,122 @@
+import os
+import sys
+import mmap
+import json
+import logging
+import argparse
+import traceback
+
+from util import logging_setup
+
+#Precompiled stopwords for every supported language (including the 3-letter aliases), in a single file,
+#so that getting the stopwords of a language needs none of the stopword libraries (NLTK corpora, stopwords,
+#stopwordsiso, klpt, laonlp, openodia, etnltk, pycantonese) and does not depend on their versions.
+#Built once (i.e. when building the Docker image) with:
+#   python3 scripts/stopwordpack.py
+#File layout: a header line, a JSON index line ({lang: [offset, length]}, aliases with the same stopwords
+#share their entry) and the stopword lists, newline-separated UTF-8, which are read through a memory map.
+
+HEADER = b"STOPWORDSPACK1\n"
+DEFAULT_PATH = os.path.dirname(os.path.abspath(__file__))+"/resources/stopwords.pack"
+
+def write_pack(path, stopwords):
+    #stopwords: {lang: iterable of stopwords}
+    blob = bytearray()
+    index = {}
+    offsets = {}
+    for lang in sorted(stopwords.keys()):
+        data = "\n".join(sorted(stopwords[lang])).encode("utf-8")
+        if data not in offsets:
+            offsets[data] = [len(blob), len(data)]
+            blob.extend(data)
+        index[lang] = offsets[data]
+    tmppath = path + ".tmp"
+    with open(tmppath, "wb") as packfile:
+        packfile.write(HEADER)
+        packfile.write(json.dumps(index, ensure_ascii=True).encode("ascii") + b"\n")
+        packfile.write(blob)
+    os.replace(tmppath, path)
+
+
+class StopwordPack:
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with open(path, "rb") as packfile:
+            self.mm = mmap.mmap(packfile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(HEADER)] != HEADER:
+            raise Exception("Not a stopwords pack: " + path)
+        index_end = self.mm.find(b"\n", len(HEADER))
+        self.index = json.loads(self.mm[len(HEADER):index_end])
+        self.start = index_end + 1
+        self.cache = {}
+
+    def __contains__(self, lang):
+        return lang in self.index
+
+    def langs(self):
+        return list(self.index.keys())
+
+    def get(self, lang):
+        #frozenset of stopwords, or None if the language is not in the pack
+        if lang not in self.index:
+            return None
+        stop_words = self.cache.get(lang)
+        if stop_words == None:
+            offset, length = self.index[lang]
+            data = self.mm[self.start+offset:self.start+offset+length].decode("utf-8")
+            stop_words = frozenset(data.split("\n"))
+            self.cache[lang] = stop_words
+        return stop_words
+
+
+def initialization():
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    parser.add_argument('output', nargs='?', type=str, default=DEFAULT_PATH, help="Stopwords pack to build")
+
+    groupL = parser.add_argument_group('Logging')
+    groupL.add_argument('-q', '--quiet', action='store_true', help='Silent logging mode')
+    groupL.add_argument('--debug', action='store_true', help='Debug logging mode')
+    groupL.add_argument('--logfile', type=argparse.FileType('a'), default=sys.stderr, help="Store log to a file")
+
+    args = parser.parse_args()
+    logging_setup(args)
+    return args
+
+def main():
+    args = initialization()
+    import ngrams
+
+    #Every language with stopwords in ngrams.get_stopwords (languages without them are left out of the pack)
+    langs = []
+    langs.extend(ngrams.NLTK_STOPWORDS_LANGS.keys())
+    langs.extend(ngrams.NLTK_STOPWORDS_MAPS.keys())
+    langs.extend(ngrams.ASTUANA_STOPWORDS_LANGS)
+    langs.extend(ngrams.ASTUANA_STOPWORDS_MAPS.keys())
+    langs.extend(ngrams.ISO_STOPWORDS_LANGS)
+    langs.extend(ngrams.ISO_STOPWORDS_MAPS.keys())
+    langs.extend(ngrams.TXT_STOPWORDS_LANGS)
+    langs.extend(ngrams.TXT_STOPWORDS_MAPS.keys())
+    langs.extend(ngrams.KLPT_STOPWORDS_LANGS)
+    langs.extend(ngrams.CANTONESE_LANGS)
+    langs.extend(ngrams.LAONLP_LANGS)
+    langs.extend(ngrams.OPENODIA_LANGS)
+    langs.extend(ngrams.ETHIOPIC_LANGS)
+
+    stopwords = {}
+    for lang in sorted(set(langs)):
+        stop_words, warnings = ngrams.get_stopwords(lang, use_pack=False)
+        if len(warnings) > 0:
+            raise Exception("Could not get stopwords for " + lang + ": " + str(warnings))
+        stopwords[lang] = stop_words
+
+    write_pack(args.output, stopwords)
+    logging.info("Stopwords for " + str(len(stopwords)) + " languages written to " + args.output)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as ex:
+        tb = traceback.format_exc()
+        logging.error(tb)
+        sys.exit(1)
@@ -1,41 +1,15 @@
+import re
+import time
 import logging
+import argparse
 from util import stdout_to_err
 
 import warnings as wrns
-with wrns.catch_warnings(),  stdout_to_err():
-    wrns.simplefilter(action='ignore', category=FutureWarning)    
-    import hebrew_tokenizer
-    
-import mecab_ko
-import MeCab
-import reldi_tokeniser
-import pyidaungsu
-import spacy_pkuseg as pkuseg
-import botok
-
-from sacremoses import MosesTokenizer
-from nltk.tokenize import WordPunctTokenizer, word_tokenize
-from sinling import SinhalaTokenizer
-from fitrat import word_tokenize as fitrat_word_tokenize
-from thai_segmenter import tokenize as thai_tokenize
-from indicnlp.tokenize import indic_tokenize
-from nlp_id.tokenizer import Tokenizer as IndonesianTokenizer
-from klpt.tokenize import Tokenize as KurdishTokenizer
-from pycantonese.word_segmentation import segment as cantonese_segment
-from laonlp.tokenize import word_tokenize as lao_tokenize
-from openodia import ud as openodia_tokenize
-from igbo_text import IgboText
-from etnltk.tokenize.am import word_tokenize as amharic_tokenizer
-from etnltk.tokenize.tg import word_tokenize as tigrinya_tokenizer
-
-try:
-    from bnlp import NLTKTokenizer
-except:
-    pass
-
-
-#Apparently mahaNLP overwrites the logging level to quiet-er than desired
-logging.disable(logging.NOTSET)
+
+#Tokenizer backends are imported the first time a language needs them (and only once per process),
+#so that i.e. CustomTokenizer("en") does not import MeCab, pkuseg or botok, and the warnings of a language
+#can be obtained without importing anything. Import times are kept in IMPORT_TIMES (see --import-profile).
+IMPORT_TIMES = {}
 
 MOSES_LANGS = ["as", "ca", "cs", "co", "de", "el", "en", "es", "fi", "fr", "ga", "hu", "is", "it", "lt", "lv", "mni", "nl", "pl", "pt", "ro", "ru", "sk", "sl", "sv", "ta"]
 
@@ -120,46 +94,54 @@ ETHIOPIC_LANGS = ["am", "ti"]
 class CustomTokenizer:
 
 
-    def  __init__(self, lang):
+    def  __init__(self, lang, fast=False):
         self.lang = None
         self.tokenizer = None
+        self.tokenize_one = None
+        self.tokenize_many = None
+        self.backend = None
         self.toktype = None
         self.warnings = []
         
         self.lang = lang
         self.setTokenizer(lang)
+        if fast and self.toktype == "moses":
+            #Same tokens as sacremoses (see fastmoses.py)
+            self.backend = ("moses_fast", self.backend[1])
+            self.toktype = "moses_fast"
     
 
     def setTokenizer(self, lang):
+        #Only decides the backend (and toktype and warnings), the tokenizer is built on first use
         if lang in MOSES_LANGS:
-            self.tokenizer =  MosesTokenizer(lang).tokenize
+            self.backend = ("moses", lang)
             self.toktype = "moses"
         elif lang in MOSES_FALLBACK.keys():
             moses_lang = MOSES_FALLBACK.get(lang)
-            self.tokenizer = MosesTokenizer(moses_lang).tokenize
+            self.backend = ("moses", moses_lang)
             self.toktype =  "moses"
             self.warnings.append("warning_tok_moses_"+moses_lang)
 
         elif lang in NLTK_WORD_LANGS:
-            self.tokenizer = WordPunctTokenizer()
+            self.backend = ("nltk_wordpunct", None)
             self.toktype = "nltk_wordpunct"
             self.warnings.append("warning_tok_nltk_wordpunct")
         elif lang in NLTK_PUNKT_LANGS.keys():
-            self.tokenizer = word_tokenize
+            self.backend = ("nltk_punkt", None)
             self.toktype = "nltk_punkt_" + NLTK_PUNKT_LANGS.get(lang)
         elif lang in NLTK_FALLBACK.keys():
             nltk_langcode = NLTK_FALLBACK.get(lang)
             nltk_langname = NLTK_PUNKT_LANGS.get(nltk_langcode)
-            self.tokenizer = word_tokenize
+            self.backend = ("nltk_punkt", None)
             self.toktype = "nltk_punkt_" + nltk_langname
             self.warnings.append("warning_tok_nltk_punkt_"+nltk_langcode)           
 
         elif lang in MECAB_JA:
-            self.tokenizer = MeCab.Tagger("-Owakati")
+            self.backend = ("mecab_ja", None)
             self.toktype = "mecab"
 
         elif lang in MECAB_KO:
-            self.tokenizer = mecab_ko.Tagger("-Owakati")
+            self.backend = ("mecab_ko", None)
             self.toktype = "mecab"            
 
 #        elif lang in NLPASHTO_LANGS:
@@ -167,83 +149,76 @@ class CustomTokenizer:
 #            self.toktype = "nlpashto"
         
         elif lang in RELDI_LANGS:
-            self.tokenizer = reldi_tokeniser
+            self.backend = ("reldi", None)
             self.toktype = "reldi_" + lang        
         elif lang in RELDI_FALLBACK.keys():
-            self.tokenizer = reldi_tokeniser
+            self.backend = ("reldi", None)
             reldilang = RELDI_FALLBACK.get(lang)
             self.toktype = "reldi_" + reldilang 
             self.warnings.append("warning_tok_reldi_"+reldilang)          
         
         elif lang in PDS_LANGS:
-            self.tokenizer = pyidaungsu.tokenize
+            self.backend = ("pds", None)
             self.toktype = "pds"
             
         elif lang in SINLING_LANGS:
-            self.tokenizer = SinhalaTokenizer()
+            self.backend = ("sinling", None)
             self.toktype = "sinling"
 
         elif lang in FITRAT_LANGS:
-            self.tokenizer = fitrat_word_tokenize
+            self.backend = ("fitrat", None)
             self.toktype = "fitrat"        
             
         elif lang in BNLP_LANGS:
-            self.tokenizer = NLTKTokenizer()
+            self.backend = ("bnlp", None)
             self.toktype = "bnlp"
 
         elif lang in THAI_LANGS:
-            self.tokenizer = thai_tokenize
+            self.backend = ("thai", None)
             self.toktype = "thai"
 
         elif lang in INDIC_LANGS:
-            self.tokenizer = indic_tokenize
+            self.backend = ("indic", None)
             self.toktype = "indic_" + lang
            
         elif lang in PKUSEG_LANGS:           
-            self.tokenizer = pkuseg.pkuseg()
+            self.backend = ("pkuseg", None)
             self.toktype = "pkuseg"        
                 
         elif lang in HEBREW_LANGS:
-            self.tokenizer = hebrew_tokenizer
+            self.backend = ("hebrew", None)
             self.toktype = "hebrew"
             
         elif lang in NLPID_LANGS:
-            self.tokenizer = IndonesianTokenizer()
+            self.backend = ("nlpid", None)
             self.toktype = "nlpid"
 
         elif lang in BOTOK_LANGS:  #This is a little bit slow...
-            config=botok.config.Config(dialect_name="general")
-            self.tokenizer = botok.WordTokenizer(config)                          
+            self.backend = ("botok", None)
             self.toktype = "botok"
 
         elif lang in KLPT_LANGS:
-            if lang == "kmr":
-                self.tokenizer=KurdishTokenizer("Kurmanji", "Latin")
-            elif lang =="ckb":
-                self.tokenizer=KurdishTokenizer("Sorani", "Arabic")
+            self.backend = ("klpt", lang)
             self.toktype = "klpt"
         
         elif lang in CANTONESE_LANGS:
-            self.tokenizer  = cantonese_segment
+            self.backend = ("pycantonese", None)
             self.toktype = "pycantonese"
         
         elif lang in LAONLP_LANGS:
-            self.tokenizer = lao_tokenize
+            self.backend = ("laonlp", None)
             self.toktype = "laonlp"
             
         elif lang in OPENODIA_LANGS:
-            self.tokenizer = openodia_tokenize.word_tokenizer
+            self.backend = ("openodia", None)
             self.toktype = "openodia"
             
         elif lang in IGBO_LANGS:
-            self.tokenizer = IgboText()
+            self.backend = ("igbo", None)
             self.toktype = "igbo"
         
         elif lang in ETHIOPIC_LANGS:
-            if lang == "ti":
-                self.tokenizer = tigrinya_tokenizer
-            elif lang == "am":
-                self.tokenizer = amharic_tokenizer
+            self.backend = ("ethiopic", lang)
             self.toktype = "ethiopic"
             
         else:
@@ -252,107 +227,262 @@ class CustomTokenizer:
             self.toktype = "moses"
             self.warnings.append("warning_tok_moses_en")
             '''
-            self.tokenizer = WordPunctTokenizer()
+            self.backend = ("nltk_wordpunct", None)
             self.toktype = "nltk_wordpunct"
             self.warnings.append("warning_tok_nltk_wordpunct")
 
-    def tokenize(self, sent):
-        try:    
-            if self.toktype == "moses":
-                return self.tokenizer(sent, escape=False)
+    def buildTokenizer(self):
+        backend, param = self.backend
+        start = time.time()
+        if backend == "moses":
+            from sacremoses import MosesTokenizer
+            tokenizer = MosesTokenizer(param).tokenize
+        elif backend == "moses_fast":
+            from fastmoses import FastMosesTokenizer
+            tokenizer = FastMosesTokenizer(param).tokenize
+        elif backend == "nltk_wordpunct":
+            from nltk.tokenize import WordPunctTokenizer
+            tokenizer = WordPunctTokenizer()
+        elif backend == "nltk_punkt":
+            from nltk.tokenize import word_tokenize
+            tokenizer = word_tokenize
+        elif backend == "mecab_ja":
+            import MeCab
+            tokenizer = MeCab.Tagger("-Owakati")
+        elif backend == "mecab_ko":
+            import mecab_ko
+            tokenizer = mecab_ko.Tagger("-Owakati")
+        elif backend == "reldi":
+            import reldi_tokeniser
+            tokenizer = reldi_tokeniser
+        elif backend == "pds":
+            import pyidaungsu
+            tokenizer = pyidaungsu.tokenize
+        elif backend == "sinling":
+            from sinling import SinhalaTokenizer
+            tokenizer = SinhalaTokenizer()
+        elif backend == "fitrat":
+            from fitrat import word_tokenize as fitrat_word_tokenize
+            tokenizer = fitrat_word_tokenize
+        elif backend == "bnlp":
+            from bnlp import NLTKTokenizer
+            tokenizer = NLTKTokenizer()
+        elif backend == "thai":
+            from thai_segmenter import tokenize as thai_tokenize
+            tokenizer = thai_tokenize
+        elif backend == "indic":
+            from indicnlp.tokenize import indic_tokenize
+            tokenizer = indic_tokenize
+        elif backend == "pkuseg":
+            import spacy_pkuseg as pkuseg
+            tokenizer = pkuseg.pkuseg()
+        elif backend == "hebrew":
+            with wrns.catch_warnings(),  stdout_to_err():
+                wrns.simplefilter(action='ignore', category=FutureWarning)    
+                import hebrew_tokenizer
+            tokenizer = hebrew_tokenizer
+        elif backend == "nlpid":
+            from nlp_id.tokenizer import Tokenizer as IndonesianTokenizer
+            tokenizer = IndonesianTokenizer()
+        elif backend == "botok":  #This is a little bit slow...
+            import botok
+            config=botok.config.Config(dialect_name="general")
+            tokenizer = botok.WordTokenizer(config)
+        elif backend == "klpt":
+            from klpt.tokenize import Tokenize as KurdishTokenizer
+            if param == "kmr":
+                tokenizer=KurdishTokenizer("Kurmanji", "Latin")
+            elif param =="ckb":
+                tokenizer=KurdishTokenizer("Sorani", "Arabic")
+        elif backend == "pycantonese":
+            from pycantonese.word_segmentation import segment as cantonese_segment
+            tokenizer  = cantonese_segment
+        elif backend == "laonlp":
+            from laonlp.tokenize import word_tokenize as lao_tokenize
+            tokenizer = lao_tokenize
+        elif backend == "openodia":
+            from openodia import ud as openodia_tokenize
+            tokenizer = openodia_tokenize.word_tokenizer
+        elif backend == "igbo":
+            from igbo_text import IgboText
+            tokenizer = IgboText()
+        elif backend == "ethiopic":
+            if param == "ti":
+                from etnltk.tokenize.tg import word_tokenize as tigrinya_tokenizer
+                tokenizer = tigrinya_tokenizer
+            elif param == "am":
+                from etnltk.tokenize.am import word_tokenize as amharic_tokenizer
+                tokenizer = amharic_tokenizer
+
+        #Apparently mahaNLP overwrites the logging level to quiet-er than desired
+        logging.disable(logging.NOTSET)
+        if backend not in IMPORT_TIMES:
+            #The first build of a backend is the one that pays the imports
+            IMPORT_TIMES[backend] = time.time() - start
+        return tokenizer
+
+    def bindTokenize(self, tokenizer):
+        #Resolves the backend-specific call once, instead of going through the toktype chain for every sentence
+        toktype = self.toktype
+        if toktype == "moses":
+            return lambda sent: tokenizer(sent, escape=False)
+
+        elif toktype == "moses_fast":
+            return tokenizer
             
-            elif self.toktype == "nltk_wordpunct" :
-                return self.tokenizer.tokenize(sent)
+        elif toktype == "nltk_wordpunct" :
+            return tokenizer.tokenize
    
-            elif self.toktype.startswith("nltk_punkt_"):
-                nltk_lang = self.toktype.split("_")[2]
-                return self.tokenizer(sent, language=nltk_lang)
+        elif toktype.startswith("nltk_punkt_"):
+            nltk_lang = toktype.split("_")[2]
+            return lambda sent: tokenizer(sent, language=nltk_lang)
    
-            elif self.toktype == "mecab":
-                return self.tokenizer.parse(sent).split()
+        elif toktype == "mecab":
+            parse = tokenizer.parse
+            return lambda sent: parse(sent).split()
    
-            elif self.toktype.startswith("reldi_"):
+        elif toktype.startswith("reldi_"):
+            reldi_lang = toktype.split("_")[1]
+            def reldi_tokenize(sent):
                 #tokstring looks like "'1.1.1.1-5\tHello\n1.1.2.6-6\t,\n1.1.3.8-11\tgood\n1.1.4.13-19\tmorning\n\n'"
-                reldi_lang = self.toktype.split("_")[1]
-                tokstring =  self.tokenizer.run(lang=reldi_lang, text=sent)
+                tokstring =  tokenizer.run(lang=reldi_lang, text=sent)
                 tokens = []
                 for token in tokstring.split("\t"):
                     if "\n" in  token:
                         tokens.append(token.split("\n")[0])
                 return tokens        
+            return reldi_tokenize
    
-            elif self.toktype == "pds":
-                return self.tokenizer(sent, lang="mm", form="word")
+        elif toktype == "pds":
+            return lambda sent: tokenizer(sent, lang="mm", form="word")
 
+        elif toktype == "sinling":
+            return tokenizer.tokenize
 
-            elif self.toktype == "sinling":
-                return self.tokenizer.tokenize(sent)
+        elif toktype == "fitrat":
+            return tokenizer
 
-            elif self.toktype == "fitrat":
-                return self.tokenizer(sent)
+        elif toktype == "bnlp":
+            return lambda sent: tokenizer.word_tokenize(text=sent)
         
-
-            elif self.toktype == "bnlp":
-                return self.tokenizer.word_tokenize(text=sent)
-        
-            elif self.toktype == "thai": 
-                return [t for t in self.tokenizer(sent) if t != " "] #This tokenizer returns empty spaces too
+        elif toktype == "thai": 
+            return lambda sent: [t for t in tokenizer(sent) if t != " "] #This tokenizer returns empty spaces too
      
-            elif self.toktype.startswith("indic_"):
-                indic_lang = self.toktype.split("_")[1]
-                return self.tokenizer.trivial_tokenize(sent, lang=indic_lang)
+        elif toktype.startswith("indic_"):
+            indic_lang = toktype.split("_")[1]
+            return lambda sent: tokenizer.trivial_tokenize(sent, lang=indic_lang)
         
-            elif self.toktype == "pkuseg":
-                return self.tokenizer.cut(sent)
+        elif toktype == "pkuseg":
+            return tokenizer.cut
         
-            elif self.toktype == "hebrew":            
-                objs = self.tokenizer.tokenize(sent) #this is a generator of objects: ('HEBREW', 'למכולת', 9, (41, 47))  (The hebrew word is in index 1, but RTL languages messing it all)
-                tokens = []
-                for obj in objs:
-                    tokens.append(obj[1])
-                return tokens
+        elif toktype == "hebrew":            
+            #this is a generator of objects: ('HEBREW', 'למכולת', 9, (41, 47))  (The hebrew word is in index 1, but RTL languages messing it all)
+            return lambda sent: [obj[1] for obj in tokenizer.tokenize(sent)]
             
-            elif self.toktype == "nlpid":
-                return self.tokenizer.tokenize(sent)    
+        elif toktype == "nlpid":
+            return tokenizer.tokenize
         
-            elif self.toktype == "botok":
-                objects = self.tokenizer.tokenize(sent)
-                tokens = []
-                for obj in objects:
-                    tokens.append(obj.text)
-                return tokens
-                
-            elif self.toktype == "klpt":
-                tokens = self.tokenizer.word_tokenize(sent, keep_form=True, separator= " ")
-                return tokens
+        elif toktype == "botok":
+            return lambda sent: [obj.text for obj in tokenizer.tokenize(sent)]
                 
-            elif self.toktype == "pycantonese":
-                tokens = self.tokenizer(sent)
-                return tokens
+        elif toktype == "klpt":
+            return lambda sent: tokenizer.word_tokenize(sent, keep_form=True, separator= " ")
                 
-            elif self.toktype == "laonlp":
-                tokens = self.tokenizer(sent)
-                return tokens
+        elif toktype in ["pycantonese", "laonlp", "openodia"]:
+            return tokenizer
             
-            elif self.toktype == "openodia":
-                tokens = self.tokenizer(sent)
-                return tokens            
-            
-            elif self.toktype == "igbo":
-                tokens = self.tokenizer.tokenize(sent)
-                return tokens
+        elif toktype == "igbo":
+            return tokenizer.tokenize
                 
-            elif self.toktype == "ethiopic":
-                tokens = self.tokenizer(sent, return_word=False)
-                return tokens
+        elif toktype == "ethiopic":
+            return lambda sent: tokenizer(sent, return_word=False)
                 
-            else:
-                return None #TO DO Do something better here --> Because THIS CRASHES
+        else:
+            return lambda sent: None #TO DO Do something better here --> Because THIS CRASHES
+
+    def bindTokenizeBatch(self, tokenizer):
+        #Backends that can tokenize many sentences at once faster than one by one (None otherwise)
+        if self.toktype == "nltk_wordpunct":
+            #A single pass of the WordPunct regex over the joined sentences, newlines separate the results
+            findall = re.compile(r"\w+|[^\w\s]+|\n").findall
+            def wordpunct_batch(sents):
+                results = [[]]
+                for token in findall("\n".join(sents)):
+                    if token == "\n":
+                        results.append([])
+                    else:
+                        results[-1].append(token)
+                if len(results) != len(sents):
+                    raise Exception("Sentences with newlines")
+                return results
+            return wordpunct_batch
+        return None
+
+    def build(self):
+        tokenizer = self.buildTokenizer()
+        self.tokenizer = tokenizer
+        self.tokenize_one = self.bindTokenize(tokenizer)
+        self.tokenize_many = self.bindTokenizeBatch(tokenizer)
+
+    def tokenize(self, sent):
+        if self.tokenizer == None:
+            self.build()
+        try:    
+            return self.tokenize_one(sent)
         except Exception as ex:
             logging.error("Failed at tokenizing: " + sent)
             logging.error(ex)
             return []
+
+    def tokenize_batch(self, sents):
+        #Same as [self.tokenize(sent) for sent in sents]
+        if self.tokenizer == None:
+            self.build()
+        if self.tokenize_many != None and len(sents) > 0:
+            try:
+                return self.tokenize_many(sents)
+            except Exception as ex:
+                #One by one, so that the failing sentences are logged
+                pass
+        tokenize = self.tokenize
+        return [tokenize(sent) for sent in sents]
     
 
     def getWarnings(self):
         return self.warnings
+
+
+def initialization():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('langs', nargs='*', help="Languages whose tokenizers are profiled (default: all the supported languages)")
+    parser.add_argument('--import-profile', action='store_true', help="Report how long it takes to import (and build) every tokenizer backend")
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = initialization()
+    if not args.import_profile:
+        return
+    langs = args.langs
+    if len(langs) == 0:
+        langs = MOSES_LANGS + list(MOSES_FALLBACK.keys()) + NLTK_WORD_LANGS + list(NLTK_PUNKT_LANGS.keys()) + list(NLTK_FALLBACK.keys()) \
+                + MECAB_JA + MECAB_KO + RELDI_LANGS + list(RELDI_FALLBACK.keys()) + PDS_LANGS + SINLING_LANGS + FITRAT_LANGS + BNLP_LANGS \
+                + THAI_LANGS + INDIC_LANGS + PKUSEG_LANGS + HEBREW_LANGS + NLPID_LANGS + BOTOK_LANGS + KLPT_LANGS + CANTONESE_LANGS \
+                + LAONLP_LANGS + OPENODIA_LANGS + IGBO_LANGS + ETHIOPIC_LANGS
+    profiled = set()
+    for lang in langs:
+        tokenizer = CustomTokenizer(lang)
+        backend = tokenizer.backend[0]
+        if backend in profiled:
+            continue
+        profiled.add(backend)
+        try:
+            tokenizer.buildTokenizer()
+        except Exception as ex:
+            logging.error("Failed at importing " + backend + " (" + lang + "): " + str(ex))
+    #Slowest first
+    for backend, seconds in sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True):
+        print(backend + "\t" + str(round(seconds, 3)))
+
+if __name__ == '__main__':
+    main()
@@ -51,10 +51,56 @@ def stdout_to_err():
     yield
     sys.stdout = save_stdout
     
+def format_in_column(col, array_items):
+    #Same rows as print_in_column, as a single string
+    prefix = "\t" * (col-1)
+    return "".join([prefix + item + "\n" for item in array_items])
+
+def decode_segment(raw):
+    #Segment (bytes) -> (text, UTF-8 bytes), the text being the same as decoding with errors="replace" and strip()-ing it.
+    #The raw bytes are used as they are, unless they are not valid UTF-8 or start/end with non-ASCII whitespace
+    raw = raw.strip()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("utf-8", errors="replace")
+        raw = None
+    if text[:1].isspace() or text[-1:].isspace():
+        text = text.strip()
+        raw = None
+    if raw == None:
+        raw = text.encode("utf-8")
+    return text, raw
+
 def print_in_column(col, array_items, output):
     for item in array_items:
         for i in range(col-1):
             output.write("\t")
 
         output.write(item+"\n")
-    
\ No newline at end of file
+    
+
+def split_weights(lines):
+    #Lines collapsed by runstats.sh (--dedup), "multiplicity\tline" -> ([multiplicity, ...], [line, ...]). Text or bytes
+    weights = []
+    stripped = []
+    for line in lines:
+        weight, line = line.split(b"\t" if isinstance(line, bytes) else "\t", 1)
+        weights.append(int(weight))
+        stripped.append(line)
+    return weights, stripped
+
+def split_langs(lines):
+    #Lines with the language of the segment in the first column (readcorpus_mono.py --lang-column),
+    #"lang\tline" -> ([lang, ...], [line, ...]). Text or bytes, languages are always text
+    langs = []
+    stripped = []
+    for line in lines:
+        if isinstance(line, bytes):
+            lang, line = line.split(b"\t", 1)
+            lang = lang.decode("utf-8", errors="replace")
+        else:
+            lang, line = line.split("\t", 1)
+        langs.append(lang.strip())
+        stripped.append(line)
+    return langs, stripped